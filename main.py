@@ -41,6 +41,20 @@ if __name__ == "__main__":
         action="store_true",
         help="print the post image as a data URL to stdout (only works for dummy posts)",
     )
+    parser.add_argument(
+        "--fill-reservoirs",
+        type=int,
+        metavar="SIZE",
+        help="instead of posting, fill the pools of pre-generated fanfic titles and salts so each has SIZE of them",
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        type=str,
+        choices=["off", "read-through", "replay"],
+        help="mode of the cache of Ollama and Hugging Face completions: off, read-through (reuse cached completions of the same prompt), "
+        "or replay (only use cached completions, without calling the model server); by default the PROMPT_CACHE_MODE environment "
+        "variable or off",
+    )
     args = parser.parse_args()
 
     log_level = args.log_level.upper()
@@ -56,4 +70,6 @@ if __name__ == "__main__":
         sonicmaker=args.sonicmaker,
         templated=args.templated,
         print_data_url=args.data_url,
+        fill_reservoirs_size=args.fill_reservoirs,
+        prompt_cache_mode=args.prompt_cache,
     )
@@ -3,12 +3,15 @@ import logging
 import random
 import tempfile
 import traceback
-from typing import Literal, Optional
+from typing import Literal, Optional, Union
 
 from src.Util.FileUtil import file_to_data_url
 from src.OC import generate_oc
 from src.PostCreator import *
 from src.Poster import *
+from src.TextGenerator import FanfictionGenerator, SonicSezGenerator
+from src.TextModel import MarkovModelRegistry, PromptCache
+from src.TextModel.ModelMap import MODEL_CLASSES, MODEL_NAMES
 
 
 _logger = logging.getLogger(__name__)
@@ -136,12 +139,46 @@ def make_post(
                     print(file_to_data_url(f.name))
 
 
+def fill_reservoirs(size: int) -> None:
+    """Fill the pools of pre-generated fanfic titles and salts and Sonic Says salts, so posts don't need to load those Markov models.
+
+    Parameters
+    ----------
+    size : int
+        number of text blocks each pool should have
+    """
+    generators: list[Union[FanfictionGenerator, SonicSezGenerator]] = [
+        FanfictionGenerator(MODEL_NAMES["Markov"]["fanfic"], MODEL_CLASSES["Markov"]),
+        SonicSezGenerator(MODEL_NAMES["Markov"]["sonicsez"], MODEL_CLASSES["Markov"]),
+    ]
+    for generator in generators:
+        _logger.info(f"Filling reservoirs of {type(generator).__name__}...")
+        generator.fill_reservoirs(size)
+    MarkovModelRegistry.unload_all()
+
+
 def main(
     dummy_post: Optional[Literal["short", "long"]] = None,
     post_type: Optional[Literal["oc", "sonicsez", "fanfic"]] = None,
     sonicmaker: bool = False,
     templated: bool = False,
     print_data_url: bool = False,
+    fill_reservoirs_size: Optional[int] = None,
+    prompt_cache_mode: Optional[str] = None,
 ) -> None:
-    """Main app function. Parameters are same as those in `App.make_post`."""
+    """Main app function. Parameters are same as those in `App.make_post`, along with some additional ones:
+
+    Parameters
+    ----------
+    fill_reservoirs_size : Optional[int], optional
+        if set, fills the pools of pre-generated text to this size with `fill_reservoirs` instead of posting; by default None
+    prompt_cache_mode : Optional[str], optional
+        mode of the `PromptCache` of remote text models ("off", "read-through" or "replay"), or none to keep the mode from the
+        `PROMPT_CACHE_MODE` environment variable; by default None
+    """
+    if prompt_cache_mode is not None:
+        PromptCache.set_mode(prompt_cache_mode)
+    if fill_reservoirs_size is not None:
+        fill_reservoirs(fill_reservoirs_size)
+        return
     do_posts(dummy_post=dummy_post, post_type=post_type, sonicmaker=sonicmaker, templated=templated, print_data_url=print_data_url)
@@ -1,6 +1,6 @@
 """Constants for getting directory paths relative to the project root.
 
-This module has 7 constants to use. They are:
+This module has 9 constants to use. They are:
 - **PROJECT_DIR**: Final[Path]<br>
   Project's base directory derived from current file's path.
 - **DATA_DIR**: Final[Path]<br>
@@ -17,6 +17,8 @@ This module has 7 constants to use. They are:
   Path for Sonic Maker creation images.
 - **OC_TEMPLATES_DIR**: Final[Path]<br>
   Path for OC template images.
+- **CACHE_DIR**: Final[Path]<br>
+  Path for local caches that can be deleted at any time (e.g. decompressed models).
 """
 
 from pathlib import Path
@@ -30,6 +32,7 @@ _MODELS_DIR: Final[Path] = _PROJECT_DIR / "models"
 _TEMPLATES_DIR: Final[Path] = _PROJECT_DIR / "templates"
 _SONICMAKER_DIR: Final[Path] = _IMAGES_DIR / "sonicmaker"
 _OC_TEMPLATES_DIR: Final[Path] = _IMAGES_DIR / "octemplate"
+_CACHE_DIR: Final[Path] = _PROJECT_DIR / ".cache"
 
 
 def __getattr__(name: str) -> Any:
@@ -42,6 +45,7 @@ def __getattr__(name: str) -> Any:
         "TEMPLATES_DIR": _TEMPLATES_DIR,
         "SONICMAKER_DIR": _SONICMAKER_DIR,
         "OC_TEMPLATES_DIR": _OC_TEMPLATES_DIR,
+        "CACHE_DIR": _CACHE_DIR,
     }
     if name in attrs:
         return attrs[name]
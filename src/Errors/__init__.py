@@ -3,6 +3,16 @@ This module provides commonly used errors across the project.
 """
 
 
+class HuggingFaceError(Exception):
+    """Exception raised when no Hugging Face inference API request generates any text."""
+
+    def __init__(self, model_name: str, attempts: int = 0) -> None:
+        message = f"Failed to get text block from Hugging Face model {model_name}"
+        if attempts > 0:
+            message += f" after {attempts} attempts"
+        super().__init__(message)
+
+
 class OllamaError(Exception):
     """Exception raised by errors raised from Ollama text generation."""
 
@@ -11,3 +21,10 @@ class OllamaError(Exception):
         if attempts > 0:
             message += f" after {attempts} attempts"
         super().__init__(message)
+
+
+class PromptCacheMissError(Exception):
+    """Exception raised when a completion isn't in the prompt cache in "replay" mode."""
+
+    def __init__(self, api: str, model_name: str) -> None:
+        super().__init__(f"No cached completion of the prompt for {api} model {model_name} to replay")
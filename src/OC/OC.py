@@ -7,10 +7,10 @@ from typing import Optional
 
 import src.Util.FileUtil as FileUtil
 import src.Directories as Directories
-from src.Errors import OllamaError
+from src.Errors import HuggingFaceError, OllamaError
 from src.FillStrategy import FillStrategy
 from src.TextGenerator import TextGenerator, OCBioGenerator
-from src.TextModel.ModelMap import MODEL_CLASSES, MODEL_NAMES, MODEL_PROBABILITIES
+from src.TextModel.ModelMap import MODEL_CLASSES, MODEL_NAMES, MODEL_OPTIONS, MODEL_PROBABILITIES
 
 
 _logger = logging.getLogger(__name__)
@@ -219,13 +219,13 @@ class OC(ABC):
         model_name_base = name["oc"] if isinstance(name := MODEL_NAMES.get(chosen_model_key, ""), dict) else name
         _logger.info(f"Using {model_class.__name__} as the model")
         model_name = model_name_base.format(gender=self.gender)
-        self.__text_generator = self.__text_generator_class(model_name, model_class, oc=self)
+        self.__text_generator = self.__text_generator_class(model_name, model_class, oc=self, model_options=MODEL_OPTIONS.get(chosen_model_key, {}).get("oc"))
 
     def _generate_description(self) -> None:
         try:
             article = self.__text_generator.get_article()
         # If we get an HTTP-related error from an external service, fall back to local MarkovTextModel
-        except (ConnectionError, HTTPError, ReadTimeout, OllamaError) as e:
+        except (ConnectionError, HTTPError, ReadTimeout, HuggingFaceError, OllamaError) as e:
             _logger.error("Received %s from %s, falling back to MarkovTextModel", type(e).__name__, self.__text_generator_class.__name__)
             self._setup_text_generator("Markov")
             article = self.__text_generator.get_article()
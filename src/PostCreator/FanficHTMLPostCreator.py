@@ -6,9 +6,9 @@ from typing import Any, ClassVar, List, Optional, Union
 
 from .HTMLPostCreator import HTMLPostCreator
 import src.Directories as Directories
-from src.Errors import OllamaError
+from src.Errors import HuggingFaceError, OllamaError
 from src.TextGenerator import TextGenerator, FanfictionGenerator
-from src.TextModel.ModelMap import MODEL_CLASSES, MODEL_NAMES, MODEL_PROBABILITIES
+from src.TextModel.ModelMap import MODEL_CLASSES, MODEL_NAMES, MODEL_OPTIONS, MODEL_PROBABILITIES
 
 _logger = logging.getLogger(__name__)
 
@@ -42,11 +42,11 @@ class FanficHTMLPostCreator(HTMLPostCreator):
         model_class = MODEL_CLASSES[model_key]
         model_name = name["fanfic"] if isinstance(name := MODEL_NAMES.get(model_key, ""), dict) else name
         _logger.info(f"Using {model_class.__name__} as the model")
-        self.__text_generator = text_generator_class(model_name, model_class)
+        self.__text_generator = text_generator_class(model_name, model_class, model_options=MODEL_OPTIONS.get(model_key, {}).get("fanfic"))
         try:
             article = self.__text_generator.get_article()
         # If we get an HTTP-related error from an external service, fall back to local MarkovTextModel
-        except (ConnectionError, HTTPError, ReadTimeout, OllamaError) as e:
+        except (ConnectionError, HTTPError, ReadTimeout, HuggingFaceError, OllamaError) as e:
             _logger.error("Received %s from %s, falling back to MarkovTextModel", type(e).__name__, model_class.__name__)
             model_class = MODEL_CLASSES["Markov"]
             model_name = MODEL_NAMES["Markov"]["fanfic"]  # TODO: don't couple this so tightly to MarkovModel
@@ -1,9 +1,9 @@
 import os
-import requests
 import tempfile
 
 from .Poster import Poster
 from src.PostCreator import PostCreator
+from src.Util import HTTPUtil
 from src.Util.HTMLUtil import md_to_plaintext
 
 
@@ -37,7 +37,7 @@ class FacebookPoster(Poster):
         title_txt = post_creator.get_title()
         if img is None:
             body_txt = post_creator.get_long_text()
-            response = requests.post(
+            response = HTTPUtil.get_session().post(
                 self.__text_url,
                 data={
                     "access_token": self.__access_token,
@@ -52,7 +52,7 @@ class FacebookPoster(Poster):
                 # Create a temporary file to post
                 img.save(f.name, format="PNG")
                 f.seek(0)
-                response = requests.post(
+                response = HTTPUtil.get_session().post(
                     self.__photo_url,
                     data={
                         "access_token": self.__access_token,
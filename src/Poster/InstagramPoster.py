@@ -1,8 +1,8 @@
 import os
-import requests
 
 from .Poster import Poster
 from src.PostCreator import PostCreator, OCHTMLPostCreator
+from src.Util import HTTPUtil
 from src.Util.ImageUtil import imgur_upload, imgur_delete
 
 
@@ -43,7 +43,7 @@ class InstagramPoster(Poster):
             try:
                 # Use the short text and alt text for body text
                 body_txt = f"{post_creator.get_short_text()}\n\n{post_creator.get_alt_text(include_title=False)}"
-                upload_response = requests.post(
+                upload_response = HTTPUtil.get_session().post(
                     f"{self.__base_url}/media",
                     params={
                         "access_token": self.__access_token,
@@ -53,7 +53,7 @@ class InstagramPoster(Poster):
                     timeout=self.__timeout,
                 )
                 upload_response.raise_for_status()
-                publish_response = requests.post(
+                publish_response = HTTPUtil.get_session().post(
                     f"{self.__base_url}/media_publish",
                     params={
                         "access_token": self.__access_token,
@@ -3,7 +3,7 @@ from typing import Any, Literal, Optional
 
 from .TextGenerator import TextGenerator
 from src.TextModel import TextModel
-from src.TextModel import MarkovTextModel
+from src.TextModel import MarkovTextModel, TextReservoir
 
 
 class FanfictionGenerator(TextGenerator):
@@ -60,6 +60,7 @@ class FanfictionGenerator(TextGenerator):
         **kwargs : dict
             Other keyword arguments to define what/how much text is generated. Below are the available options:
             - prompts: override for __DEFAULT_PROMPTS
+            - model_options: generation options of the text model, passed to it as `options` (see `ModelMap.MODEL_OPTIONS`)
             - mean_paragraphs
             - stdev_paragraphs
             - mean_body_words
@@ -67,10 +68,12 @@ class FanfictionGenerator(TextGenerator):
             - max_body_length
             - mean_title_words
             - stdev_title_words
+            - use_reservoirs: whether to take titles and salts from their `TextReservoir` pools before generating them live, by
+              default True
         """
         self._prompt_template = kwargs.get("prompts", {}).get(model_class.__name__, FanfictionGenerator.__DEFAULT_PROMPTS[model_class.__name__])
 
-        self._text_model: TextModel = model_class(model_name)
+        self._text_model: TextModel = model_class(model_name, options=kwargs.get("model_options"))
         self._text_model.mean_words = kwargs.get("mean_body_words", FanfictionGenerator.__DEFAULT_KWARGS["mean_body_words"])
         self._text_model.stdev_words = kwargs.get("stdev_body_words", FanfictionGenerator.__DEFAULT_KWARGS["stdev_body_words"])
         self._text_model.mean_paragraphs = kwargs.get("mean_paragraphs", FanfictionGenerator.__DEFAULT_KWARGS["mean_paragraphs"])
@@ -91,6 +94,22 @@ class FanfictionGenerator(TextGenerator):
             self.__salt_model.mean_paragraphs = 1
             self.__salt_model.stdev_paragraphs = 0
 
+        self.__use_reservoirs: bool = kwargs.get("use_reservoirs", True)
+        self.__title_reservoir = TextReservoir(title_model_name, "title")
+        self.__salt_reservoir = TextReservoir(salt_model_name, "salt") if salt_model_name else None
+
+    def fill_reservoirs(self, size: int) -> None:
+        """Fill the title and salt pools with text generated by the title and salt models.
+
+        Parameters
+        ----------
+        size : int
+            number of titles and salts each pool should have
+        """
+        self.__title_reservoir.fill(self.__titles_model, size)
+        if self.__salt_reservoir and self.__salt_model:
+            self.__salt_reservoir.fill(self.__salt_model, size)
+
     def get_article(self) -> dict[Literal["title", "body"], str]:
         """Get a fanfiction with a title and body as a dict.
 
@@ -99,12 +118,18 @@ class FanfictionGenerator(TextGenerator):
         dict[Literal["title", "body"], str]
             dictionary containing the title and body of the fanfiction
         """
-        title = self.__titles_model.get_text_block()
+        title = self.__title_reservoir.pop_or_generate(self.__titles_model) if self.__use_reservoirs else self.__titles_model.get_text_block()
         # Remove title punctuation 4/5 of the time if it ends with punctuation
         if title[-1] in ".,:;!?" and random.random() < 0.8:
             title = title[:-1]
 
-        salt = (self.__salt_model.get_text_block() if self.__salt_model else "").strip()
+        salt = ""
+        if self.__salt_model:
+            salt = (
+                self.__salt_reservoir.pop_or_generate(self.__salt_model)
+                if self.__salt_reservoir and self.__use_reservoirs
+                else self.__salt_model.get_text_block()
+            ).strip()
         body_prompt = self._prompt_template.format(title=title, salt=salt).rstrip() if self._prompt_template else None
         body_text = self._text_model.get_text_block(prompt=body_prompt).removeprefix(body_prompt.removesuffix(salt) if body_prompt else "")
 
@@ -63,10 +63,11 @@ class OCBioGenerator(TextGenerator):
         **kwargs : dict
             Other keyword arguments to define what/how much text is generated. Below are the available options:
             - prompts: override for __DEFAULT_PROMPTS
+            - model_options: generation options of the text model, passed to it as `options` (see `ModelMap.MODEL_OPTIONS`)
         """
         self._prompt_template = kwargs.get("prompts", {}).get(model_class.__name__, OCBioGenerator.__DEFAULT_PROMPTS[model_class.__name__])
 
-        self._text_model: TextModel = model_class(model_name)
+        self._text_model: TextModel = model_class(model_name, options=kwargs.get("model_options"))
         self._text_model.mean_words = 42
         self._text_model.stdev_words = 20
         self._text_model.max_length = 150
@@ -2,7 +2,7 @@ from typing import Any, Literal, Optional
 
 from .TextGenerator import TextGenerator
 from src.TextModel import TextModel
-from src.TextModel import MarkovTextModel
+from src.TextModel import MarkovTextModel, TextReservoir
 
 
 class SonicSezGenerator(TextGenerator):
@@ -43,10 +43,12 @@ class SonicSezGenerator(TextGenerator):
         **kwargs : dict
             Other keyword arguments to define what/how much text is generated. Below are the available options:
             - prompts: override for __DEFAULT_PROMPTS
+            - model_options: generation options of the text model, passed to it as `options` (see `ModelMap.MODEL_OPTIONS`)
+            - use_reservoirs: whether to take salts from their `TextReservoir` pool before generating them live, by default True
         """
         self._prompt_template = kwargs.get("prompts", {}).get(model_class.__name__, SonicSezGenerator.__DEFAULT_PROMPTS[model_class.__name__])
 
-        self._text_model: TextModel = model_class(model_name, strip_to_closed_quote=True)
+        self._text_model: TextModel = model_class(model_name, strip_to_closed_quote=True, options=kwargs.get("model_options"))
         self._text_model.mean_words = 24
         self._text_model.stdev_words = 13
         self._text_model.max_length = 60
@@ -59,6 +61,20 @@ class SonicSezGenerator(TextGenerator):
             self.__salt_model.mean_paragraphs = 1
             self.__salt_model.stdev_paragraphs = 0
 
+        self.__use_reservoirs: bool = kwargs.get("use_reservoirs", True)
+        self.__salt_reservoir = TextReservoir(salt_model_name, "salt") if salt_model_name else None
+
+    def fill_reservoirs(self, size: int) -> None:
+        """Fill the salt pool with text generated by the salt model.
+
+        Parameters
+        ----------
+        size : int
+            number of salts the pool should have
+        """
+        if self.__salt_reservoir and self.__salt_model:
+            self.__salt_reservoir.fill(self.__salt_model, size)
+
     def get_article(self) -> dict[Literal["title", "body"], str]:
         """Get a Sonic Says blurb.
 
@@ -67,7 +83,13 @@ class SonicSezGenerator(TextGenerator):
         dict[Literal["title", "body"], str]
             dictionary containing the title and body of the Sonic Says segment
         """
-        salt = (self.__salt_model.get_text_block() if self.__salt_model else "").strip()
+        salt = ""
+        if self.__salt_model:
+            salt = (
+                self.__salt_reservoir.pop_or_generate(self.__salt_model)
+                if self.__salt_reservoir and self.__use_reservoirs
+                else self.__salt_model.get_text_block()
+            ).strip()
         body_prompt = self._prompt_template.format(salt=salt).rstrip() if self._prompt_template else None
         body_text = self._text_model.get_text_block(prompt=body_prompt).removeprefix(body_prompt.removesuffix(salt) if body_prompt else "")
 
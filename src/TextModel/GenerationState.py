@@ -0,0 +1,35 @@
+from dataclasses import dataclass, field
+import numpy as np
+from typing import Optional
+
+
+@dataclass
+class GenerationState:
+    """State of a single text generation: the chain state of the model and the random generator to sample with.
+
+    Text models keep no generation state of their own when given one of these, so a single text model (and the model data it loaded)
+    can serve any number of threads at once, each with its own `GenerationState`.
+    """
+
+    rng: np.random.Generator = field(default_factory=np.random.default_rng)
+    """Random generator used for this generation; by default a new one seeded from OS entropy, so concurrent calls don't share one."""
+    first_word: Optional[str] = None
+    """Second to last generated word, if any."""
+    second_word: Optional[str] = None
+    """Last generated word, if any."""
+
+    @classmethod
+    def from_seed(cls, seed: Optional[int] = None) -> "GenerationState":
+        """Create an empty `GenerationState` with a generator seeded with the given seed, for reproducible generation.
+
+        Parameters
+        ----------
+        seed : Optional[int], optional
+            seed of the random generator, by default None for a seed from OS entropy
+
+        Returns
+        -------
+        GenerationState
+            new generation state
+        """
+        return cls(rng=np.random.default_rng(seed))
@@ -0,0 +1,166 @@
+"""Hedged generation for text models that call remote APIs.
+
+Instead of retrying a rejected generation one attempt at a time, `first_success` runs several candidate attempts at once, either all
+at once or with staggered starts, takes the first one that passes validation, and tells the rest to stop. Attempts run in daemon
+threads, so attempts that can't stop early (like a request waiting for its whole response) don't delay the process exiting.
+
+Staggered starts can wait for a percentile of the latencies of earlier successful attempts (see `stagger_delay`), which
+`first_success` records per model in this process.
+"""
+
+from collections import deque
+import numpy as np
+import queue
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+LATENCY_HISTORY_SIZE: int = 100
+"""Max number of latencies recorded per key."""
+
+_latencies: dict[str, deque[float]] = {}
+_latencies_lock = threading.Lock()
+
+
+def record_latency(key: str, seconds: float) -> None:
+    """Record the latency of a successful attempt.
+
+    Parameters
+    ----------
+    key : str
+        key of the latencies, like the model name
+    seconds : float
+        latency of the attempt in seconds
+    """
+    with _latencies_lock:
+        _latencies.setdefault(key, deque(maxlen=LATENCY_HISTORY_SIZE)).append(seconds)
+
+
+def latency_percentile(key: str, percentile: float) -> Optional[float]:
+    """Get a percentile of the recorded latencies.
+
+    Parameters
+    ----------
+    key : str
+        key of the latencies, like the model name
+    percentile : float
+        percentile to get, between 0 and 100
+
+    Returns
+    -------
+    Optional[float]
+        percentile of the latencies in seconds, or none if none were recorded
+    """
+    with _latencies_lock:
+        latencies = list(_latencies.get(key, ()))
+    return float(np.percentile(latencies, percentile)) if latencies else None
+
+
+def stagger_delay(key: str, delay: Optional[float] = None, percentile: Optional[float] = None) -> Optional[float]:
+    """Get how long to wait after starting an attempt before starting another one.
+
+    Parameters
+    ----------
+    key : str
+        key of the latencies, like the model name
+    delay : Optional[float], optional
+        seconds to wait if no percentile is given or no latencies were recorded yet, by default none
+    percentile : Optional[float], optional
+        percentile of the recorded latencies to wait for, by default none
+
+    Returns
+    -------
+    Optional[float]
+        seconds to wait, or none to start attempts right away
+    """
+    latency = latency_percentile(key, percentile) if percentile is not None else None
+    return latency if latency is not None else delay
+
+
+def first_success(
+    attempt: Callable[[threading.Event], Optional[T]],
+    max_attempts: int,
+    candidates: int = 1,
+    stagger: Optional[float] = None,
+    latency_key: Optional[str] = None,
+) -> Optional[T]:
+    """Run attempts until one succeeds, with up to `candidates` of them running at once.
+
+    Each attempt gets an event that is set once a result was taken or an attempt raised, so it can stop early. A new attempt starts
+    whenever one fails, until `max_attempts` were started.
+
+    Parameters
+    ----------
+    attempt : Callable[[threading.Event], Optional[T]]
+        function running one attempt, returning its result or none if it failed
+    max_attempts : int
+        max number of attempts to start in total
+    candidates : int, optional
+        max number of attempts running at once, by default 1, which runs them one after another in this thread
+    stagger : Optional[float], optional
+        seconds to wait after starting an attempt before starting another one while it runs, or none to start up to `candidates`
+        of them right away; by default none
+    latency_key : Optional[str], optional
+        key to record the latency of the successful attempt with, or none to not record it; by default none
+
+    Returns
+    -------
+    Optional[T]
+        result of the first successful attempt, or none if all of them failed
+
+    Raises
+    ------
+    Exception
+        re-raises the first exception raised by an attempt
+    """
+    cancel = threading.Event()
+
+    def timed_attempt() -> Optional[T]:
+        start = time.monotonic()
+        result = attempt(cancel)
+        if result is not None and latency_key is not None:
+            record_latency(latency_key, time.monotonic() - start)
+        return result
+
+    if candidates <= 1:
+        for _ in range(max_attempts):
+            result = timed_attempt()
+            if result is not None:
+                return result
+        return None
+
+    results: queue.Queue[tuple[Optional[T], Optional[BaseException]]] = queue.Queue()
+
+    def run() -> None:
+        try:
+            results.put((timed_attempt(), None))
+        except BaseException as e:
+            results.put((None, e))
+
+    started = 0
+    running = 0
+    last_start = 0.0
+    try:
+        while started < max_attempts or running > 0:
+            can_start = started < max_attempts and running < candidates
+            now = time.monotonic()
+            if can_start and (stagger is None or running == 0 or now - last_start >= stagger):
+                threading.Thread(target=run, daemon=True).start()
+                started += 1
+                running += 1
+                last_start = now
+                continue
+            try:
+                result, error = results.get(timeout=last_start + stagger - now if can_start and stagger is not None else None)
+            except queue.Empty:
+                continue
+            running -= 1
+            if error:
+                raise error
+            if result is not None:
+                return result
+    finally:
+        cancel.set()
+    return None
@@ -1,15 +1,36 @@
 import os
-import requests
+import threading
 from typing import Any, Optional
 from unidecode import unidecode
 
+from .GenerationState import GenerationState
+from . import HedgedRequests, PromptCache
+from src.Errors import HuggingFaceError
+from src.Util import HTTPUtil
 from .TextModel import TextModel
 
 
 class HuggingFaceTextModel(TextModel):
-    """Text model that uses the Hugging Face inference API to generate text."""
+    """Text model that uses the Hugging Face inference API to generate text.
 
-    def __init__(self, model_name: str, max_length: int = 100, strip_last_incomplete_sentence: bool = True, strip_to_closed_quote: bool = False, **kwargs: Any):
+    With hedging (`hedge_candidates` above 1), several candidate requests run at once and the first one with any generated text is
+    used; the others' responses are ignored.
+
+    Completions go through the `PromptCache`, keyed by the model id, prompt and generation settings.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_length: int = 100,
+        strip_last_incomplete_sentence: bool = True,
+        strip_to_closed_quote: bool = False,
+        max_attempts: int = 1,
+        hedge_candidates: int = 1,
+        hedge_delay: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        **kwargs: Any,
+    ):
         """Create a `HuggingFaceTextModel`. Uses API token in environment variable `HUGGINGFACE_ACCESS_TOKEN`.
 
         Parameters
@@ -18,6 +39,16 @@ class HuggingFaceTextModel(TextModel):
             id of the model from https://huggingface.co/models
         max_length: int
             max number of tokens for the model to generate, by default 100
+        max_attempts : int, optional
+            max number of requests to try until one generates any text, by default 1 (at least `hedge_candidates`)
+        hedge_candidates : int, optional
+            max number of candidate requests to run at once, by default 1, which tries them one after another
+        hedge_delay : Optional[float], optional
+            seconds to wait after starting a candidate before starting another one while it runs, or none to start them all at once;
+            by default none
+        hedge_percentile : Optional[float], optional
+            if set, wait for this percentile of the latencies of earlier successful requests of the model in this process instead of
+            `hedge_delay`, once there are any; by default none
         """
         super().__init__(model_name, **kwargs)
         self.__api_url = "https://api-inference.huggingface.co/models"
@@ -27,8 +58,12 @@ class HuggingFaceTextModel(TextModel):
         self.__strip_last_incomplete_sentence = strip_last_incomplete_sentence
         self.__strip_to_closed_quote = strip_to_closed_quote
         self.__timeout = 300
+        self.max_attempts = max_attempts
+        self.hedge_candidates = hedge_candidates
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
 
-    def get_next_word(self) -> str:
+    def get_next_word(self, state: Optional[GenerationState] = None) -> str:
         """Not implemented as the API will return a block of text all at once.
 
         Raises
@@ -38,20 +73,69 @@ class HuggingFaceTextModel(TextModel):
         """
         raise NotImplementedError("This uses the API to generate a block of text all at once, so this is not implemented.")
 
-    def get_text_block(self, prompt: Optional[str] = None) -> str:
+    def get_text_block(self, prompt: Optional[str] = None, state: Optional[GenerationState] = None) -> str:
         """Get a random block of text from the model.
 
         Parameters
         ----------
         prompt : Optional[str]
             prompt to start the model with, or none if starting from empty state
+        state : Optional[GenerationState]
+            unused, as the API keeps no state between requests
 
         Returns
         -------
         str
             random block of text from the model
+
+        Raises
+        ------
+        HuggingFaceError
+            raised if no request generated any text after `max_attempts` attempts
+        PromptCacheMissError
+            raised if the prompt cache is in "replay" mode and the completion isn't cached
         """
         prompt_str = prompt or "Write some text:"
+        settings = {
+            "max_length": self.max_length,
+            "strip_last_incomplete_sentence": self.__strip_last_incomplete_sentence,
+            "strip_to_closed_quote": self.__strip_to_closed_quote,
+        }
+        gen_text = PromptCache.cached("huggingface", self.__model_id, prompt_str, settings, lambda: self.__generate_hedged(prompt_str))
+        return self._restore_prompt(prompt, gen_text)
+
+    def __generate_hedged(self, prompt_str: str) -> str:
+        """Request candidates until one generates any text, with hedging if enabled."""
+        max_attempts = max(self.max_attempts, self.hedge_candidates)
+        latency_key = f"huggingface:{self.__model_id}"
+        gen_text = HedgedRequests.first_success(
+            lambda cancel: self.__generate(prompt_str, cancel),
+            max_attempts,
+            candidates=self.hedge_candidates,
+            stagger=HedgedRequests.stagger_delay(latency_key, self.hedge_delay, self.hedge_percentile),
+            latency_key=latency_key,
+        )
+        if gen_text is None:
+            raise HuggingFaceError(self.__model_id, max_attempts)
+        return gen_text
+
+    def __generate(self, prompt_str: str, cancel: threading.Event) -> Optional[str]:
+        """Request one generation from the API.
+
+        Parameters
+        ----------
+        prompt_str : str
+            prompt to send
+        cancel : threading.Event
+            event set when the generation isn't needed anymore; checked before sending the request
+
+        Returns
+        -------
+        Optional[str]
+            cleaned up generated text, or none if nothing was generated or the generation was cancelled
+        """
+        if cancel.is_set():
+            return None
         payload = {
             "inputs": prompt_str,
             "options": {
@@ -65,7 +149,7 @@ class HuggingFaceTextModel(TextModel):
         }
 
         headers = {"Authorization": f"Bearer {self.__api_token}"}
-        response = requests.post(f"{self.__api_url}/{self.__model_id}", headers=headers, json=payload, timeout=self.__timeout)
+        response = HTTPUtil.get_session().post(f"{self.__api_url}/{self.__model_id}", headers=headers, json=payload, timeout=self.__timeout)
         response_json = response.json()
 
         if not isinstance(response_json, list):
@@ -79,4 +163,4 @@ class HuggingFaceTextModel(TextModel):
             cutoff_index = max(cutoff_index, *(gen_text.rfind(punc) + 1 for punc in ".?!"), *(gen_text.rfind(f'{punc}"') + 2 for punc in ".,:;?!"))
 
         cleaned_gen_text = gen_text[: cutoff_index if cutoff_index > 0 else len(gen_text)].removesuffix("<|endoftext|>").strip()
-        return self._restore_prompt(prompt, cleaned_gen_text)
+        return cleaned_gen_text or None
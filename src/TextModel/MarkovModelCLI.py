@@ -0,0 +1,439 @@
+"""Commands of `train.py`, which trains Markov models from text files and maintains the trained models in `models/`.
+
+Each command is a subcommand of `train.py`, like `python3 train.py train <db_name> <txt_file...>` to train a model; run
+`python3 train.py -h` for the commands, and `python3 train.py <command> -h` for their arguments.
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+import tempfile
+import time
+from typing import BinaryIO, Optional
+import uuid
+
+from .MarkovModelStats import BACKENDS, bench, stats
+from .MarkovTransitionTable import MarkovTransitionTable
+from .MarkovTriads import LATEST_SCHEMA_VERSION, MarkovFoldedDeltas, MarkovTriads, delta_paths, migrate_schema, vacuum_if_fragmented
+import src.Directories as Directories
+from src.Util import CacheUtil
+
+BYTES_PER_COUNTED_TRIAD = 256
+"""Rough memory use of one distinct triad counted in a `Counter`, used to turn a memory limit into a max number of triads."""
+
+
+def _decompress_model(db_name: str) -> str:
+    """Decompress `models/{db_name}.db.gz` to `models/{db_name}.db` if the uncompressed database doesn't exist, and return its path."""
+    db_path = str(Directories.MODELS_DIR / f"{db_name}.db")
+    if not os.path.exists(db_path) and os.path.exists(f"{db_path}.gz"):
+        with gzip.open(f"{db_path}.gz", "rb") as f_src, open(db_path, "wb") as f_dst:
+            f_dst.writelines(f_src)
+    return db_path
+
+
+def _compress_model(db_name: str) -> None:
+    """gzip-compress `models/{db_name}.db` to `models/{db_name}.db.gz`, and delete the uncompressed database.
+
+    The compressed file is replaced atomically, so loaders never read a partially written model.
+    """
+    db_path = str(Directories.MODELS_DIR / f"{db_name}.db")
+
+    def compress(f_dst: BinaryIO) -> None:
+        with open(db_path, "rb") as f_src, gzip.open(f_dst, "wb") as f_gz:
+            shutil.copyfileobj(f_src, f_gz)
+
+    CacheUtil.atomic_write(f"{db_path}.gz", compress)
+    os.remove(db_path)
+
+
+def _save_end_steps(engine: Engine) -> MarkovTransitionTable:
+    """Compile the model database and save the expected steps to a sentence end of its states into it, so loading the model for the
+    "sql" and "sqlite" backends doesn't have to, and return the compiled table."""
+    transition_table = MarkovTransitionTable.from_engine(engine)
+    transition_table.save_end_steps(engine)
+    return transition_table
+
+
+def migrate(args: argparse.Namespace) -> None:
+    """Migrate trained models to the latest schema version and add their read indexes, from the parsed `train.py migrate` arguments."""
+    for db_name in args.db_names:
+        engine = create_engine(f"sqlite:///{_decompress_model(db_name)}")
+        migrate_schema(engine)
+        _save_end_steps(engine)
+        engine.execute("vacuum")
+        engine.dispose()
+        _compress_model(db_name)
+
+
+def export(args: argparse.Namespace) -> None:
+    """Export a trained model to the memory-mappable binary format, from the parsed `train.py export` arguments."""
+    export_binary(args.db_name)
+
+
+def export_binary(db_name: str, transition_table: Optional[MarkovTransitionTable] = None) -> None:
+    """Export `models/{db_name}.db.gz`, along with any delta shards not folded into it, to the binary format read by
+    `MarkovTransitionTable.load`, in `models/{db_name}.markov`.
+
+    Parameters
+    ----------
+    db_name : str
+        name of the model to export
+    transition_table : Optional[MarkovTransitionTable], optional
+        table just compiled from the model database, exported instead of compiling it again if the model has no delta shards, by default
+        None
+    """
+    if transition_table is not None and not delta_paths(db_name):
+        transition_table.save(Directories.MODELS_DIR / f"{db_name}.markov")
+        return
+    db_path = Directories.MODELS_DIR / f"{db_name}.db"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "model.db")
+        with gzip.open(f"{db_path}.gz", "rb") as f_src, open(tmp_path, "wb") as f_dst:
+            f_dst.writelines(f_src)
+        engines = [create_engine(f"sqlite:///{tmp_path}")]
+        for delta_path in MarkovFoldedDeltas().pending(engines[0], delta_paths(db_name)):
+            engines.append(create_engine(f"sqlite:///file:{delta_path}?mode=ro&uri=true"))
+        MarkovTransitionTable.from_engines(engines).save(Directories.MODELS_DIR / f"{db_name}.markov")
+        for engine in engines:
+            engine.dispose()
+
+
+def merge(args: argparse.Namespace) -> None:
+    """Merge other trained model databases into a model, from the parsed `train.py merge` arguments."""
+
+    db_path = _decompress_model(args.db_name)
+    is_new_model = not os.path.exists(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    markov_model = MarkovTriads(schema_version=LATEST_SCHEMA_VERSION) if is_new_model else MarkovTriads.for_engine(engine)
+    markov_model.create_table(engine)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        other_db_paths = []
+        for i, other_db_path in enumerate(args.other_db_paths):
+            if other_db_path.endswith(".gz"):
+                other_db_paths.append(os.path.join(tmp_dir, f"{i}.db"))
+                with gzip.open(other_db_path, "rb") as f_src, open(other_db_paths[-1], "wb") as f_dst:
+                    shutil.copyfileobj(f_src, f_dst)
+            else:
+                other_db_paths.append(other_db_path)
+        markov_model.merge_from(engine, other_db_paths, upsert_type="overwrite" if args.overwrite else "add")
+    _save_end_steps(engine)
+    vacuum_if_fragmented(engine)
+    engine.dispose()
+    _compress_model(args.db_name)
+
+
+def compact(args: argparse.Namespace) -> None:
+    """Fold the delta shards of a trained model into its base model, from the parsed `train.py compact` arguments."""
+
+    shard_paths = delta_paths(args.db_name)
+    db_path = _decompress_model(args.db_name)
+    is_new_model = not os.path.exists(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    markov_model = MarkovTriads(schema_version=LATEST_SCHEMA_VERSION) if is_new_model else MarkovTriads.for_engine(engine)
+    markov_model.create_table(engine)
+    # Shards are recorded as folded in the base model, so if this is interrupted after compressing, they aren't counted twice
+    markov_model.fold_deltas(engine, shard_paths)
+    if args.remove_uncommon > 0 or args.min_count > 1:
+        markov_model.remove_uncommon_tokens(engine, uncommon_threshold=args.remove_uncommon, min_occurrences=args.min_count)
+    transition_table = _save_end_steps(engine)
+    vacuum_if_fragmented(engine)
+    engine.dispose()
+    _compress_model(args.db_name)
+    for shard_path in shard_paths:
+        shard_path.unlink()
+    if shard_paths and not any(shard_paths[0].parent.iterdir()):
+        shard_paths[0].parent.rmdir()
+    if args.binary:
+        export_binary(args.db_name, transition_table)
+
+
+def _train_delta(args: argparse.Namespace) -> None:
+    """Train a new delta shard of the model from the parsed `train.py train --delta` arguments."""
+    if not (Directories.MODELS_DIR / f"{args.db_name}.db.gz").exists():
+        raise FileNotFoundError(f"Delta shards need an existing base model, but models/{args.db_name}.db.gz doesn't exist")
+    delta_dir = Directories.MODELS_DIR / f"{args.db_name}.d"
+    delta_dir.mkdir(exist_ok=True)
+    delta_path = delta_dir / f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.db"
+    # Train into a temp file that isn't picked up as a shard until it's complete
+    tmp_path = delta_path.with_suffix(".db.tmp")
+    engine = create_engine(f"sqlite:///{tmp_path}", echo=True)
+    markov_model = MarkovTriads(schema_version=args.schema)
+    markov_model.create_table(engine)
+    max_counted_triads = max(1, args.memory_limit * 1024**2 // BYTES_PER_COUNTED_TRIAD)
+    markov_model.upsert_triads_from_files(engine, args.text_files, args.jobs, max_counted_triads=max_counted_triads)
+    vacuum_if_fragmented(engine)
+    engine.dispose()
+    os.replace(tmp_path, delta_path)
+    if args.binary:
+        export_binary(args.db_name)
+
+
+def train(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """Train a model from text files, from the parsed `train.py train` arguments; `parser` reports invalid combinations of them."""
+    if args.delta:
+        if args.overwrite:
+            parser.error("--overwrite can't be used with --delta, since shards only add to the base model's counts")
+        if args.remove_uncommon > 0 or args.min_count > 1:
+            parser.error("pruning can't be used with --delta, since it applies to the combined counts; use it with `train.py compact` instead")
+        _train_delta(args)
+        return
+
+    # Decompress gzip-compressed db first if the db file doesn't exist
+    db_path = _decompress_model(args.db_name)
+    is_new_model = not os.path.exists(db_path)
+    engine = create_engine(f"sqlite:///{db_path}", echo=True)
+    markov_model = MarkovTriads(schema_version=args.schema) if is_new_model else MarkovTriads.for_engine(engine)
+    markov_model.create_table(engine)
+    max_counted_triads = max(1, args.memory_limit * 1024**2 // BYTES_PER_COUNTED_TRIAD)
+    # Pruned triads are never written to new models; existing models have them deleted after training
+    markov_model.upsert_triads_from_files(
+        engine,
+        args.text_files,
+        args.jobs,
+        overwrite_probs=args.overwrite,
+        max_counted_triads=max_counted_triads,
+        min_occurrences=args.min_count,
+        uncommon_threshold=args.remove_uncommon,
+    )
+    transition_table = _save_end_steps(engine)
+    # Remove deleted data and the dropped staging table, if there's much of it
+    vacuum_if_fragmented(engine)
+    engine.dispose()
+    # gzip-compress the db now
+    _compress_model(args.db_name)
+    if args.binary:
+        export_binary(args.db_name, transition_table)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the parser of `train.py`, with a subparser per command whose handler is set as the `command` default.
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        parser of all commands
+    """
+    parser = argparse.ArgumentParser(prog="train.py", description="Train text generation Markov models and maintain the trained models.")
+    subparsers = parser.add_subparsers(title="commands", metavar="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="train a model from text files", description="Train a text generation Markov model.")
+    train_parser.add_argument(
+        "db_name",
+        type=str,
+        help="name of database to write model to",
+    )
+    train_parser.add_argument(
+        "text_files",
+        metavar="txt_file",
+        nargs="+",
+        type=str,
+        help="text file to train from",
+    )
+    train_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="overwrite occurrence counts when training instead of adding to existing counts",
+    )
+    train_parser.add_argument(
+        "-r",
+        "--remove-uncommon",
+        type=int,
+        default=0,
+        help="prune triads whose first token starts this many distinct triads or less",
+    )
+    train_parser.add_argument(
+        "--min-count",
+        type=int,
+        default=1,
+        help="prune triads with fewer occurrences than this",
+    )
+    train_parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="also export the model to the memory-mappable binary format (models/{db_name}.markov), which generation prefers when present",
+    )
+    train_parser.add_argument(
+        "-m",
+        "--memory-limit",
+        type=int,
+        default=512,
+        help="approximate memory in MB to use for counting triads per file before spilling counts to the database, by default 512",
+    )
+    train_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "number of processes to tokenize and count text with; with more than 1, chunks of all files are counted in parallel; "
+            "counts of all files are summed before they're written, and before --overwrite and pruning apply"
+        ),
+    )
+    train_parser.add_argument(
+        "--schema",
+        type=int,
+        choices=range(1, LATEST_SCHEMA_VERSION + 1),
+        default=LATEST_SCHEMA_VERSION,
+        help="schema version for new models and delta shards; existing models keep their schema version (see `train.py migrate`)",
+    )
+    train_parser.add_argument(
+        "--delta",
+        action="store_true",
+        help=(
+            "write the counts to a new delta shard (models/{db_name}.d/*.db) instead of updating the compressed base model, which is "
+            "much faster for small updates; loading the model adds the shards' counts, and `train.py compact` folds them into the base"
+        ),
+    )
+    train_parser.set_defaults(command=lambda args: train(args, train_parser))
+
+    bench_parser = subparsers.add_parser(
+        "bench",
+        help="benchmark generating text from models with each backend",
+        description="Benchmark generating text from trained Markov models with each backend.",
+    )
+    bench_parser.add_argument(
+        "db_names",
+        metavar="db_name",
+        nargs="+",
+        type=str,
+        help="name of model to benchmark",
+    )
+    bench_parser.add_argument(
+        "-n",
+        "--blocks",
+        type=int,
+        default=50,
+        help="number of text blocks to generate per backend, by default 50",
+    )
+    bench_parser.add_argument(
+        "--backend",
+        dest="backends",
+        action="append",
+        choices=BACKENDS,
+        help="backend to benchmark, which can be given more than once; by default all of them",
+    )
+    bench_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed of the first block's random generator, by default 0",
+    )
+    bench_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the results of each model as a line of JSON",
+    )
+    bench_parser.set_defaults(command=bench)
+
+    compact_parser = subparsers.add_parser(
+        "compact",
+        help="fold a model's delta shards into its base model",
+        description="Fold the delta shards of a trained Markov model (models/{db_name}.d/*.db) into its base model.",
+    )
+    compact_parser.add_argument(
+        "db_name",
+        type=str,
+        help="name of database to compact",
+    )
+    compact_parser.add_argument(
+        "-r",
+        "--remove-uncommon",
+        type=int,
+        default=0,
+        help="delete triads whose first token starts this many distinct triads or less, after folding the delta shards",
+    )
+    compact_parser.add_argument(
+        "--min-count",
+        type=int,
+        default=1,
+        help="delete triads with fewer occurrences than this, after folding the delta shards",
+    )
+    compact_parser.add_argument(
+        "-b",
+        "--binary",
+        action="store_true",
+        help="also export the compacted model to the memory-mappable binary format (models/{db_name}.markov)",
+    )
+    compact_parser.set_defaults(command=compact)
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="export a model to the memory-mappable binary format",
+        description="Export a trained Markov model to the memory-mappable binary format.",
+    )
+    export_parser.add_argument(
+        "db_name",
+        type=str,
+        help="name of database to export",
+    )
+    export_parser.set_defaults(command=export)
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="merge other model databases into a model",
+        description="Merge other trained Markov model databases, like ones trained on other machines, into a model.",
+    )
+    merge_parser.add_argument(
+        "db_name",
+        type=str,
+        help="name of database to merge into, which is created if it doesn't exist",
+    )
+    merge_parser.add_argument(
+        "other_db_paths",
+        metavar="other_db",
+        nargs="+",
+        type=str,
+        help="path of a Markov model database (.db or gzip-compressed .db.gz) to merge",
+    )
+    merge_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="overwrite occurrence counts with the merged counts instead of adding to existing counts",
+    )
+    merge_parser.set_defaults(command=merge)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate",
+        help="migrate models to the latest schema version and add their read indexes",
+        description=f"Migrate trained Markov models to schema version {LATEST_SCHEMA_VERSION} and add their read indexes.",
+    )
+    migrate_parser.add_argument(
+        "db_names",
+        metavar="db_name",
+        nargs="+",
+        type=str,
+        help="name of database to migrate",
+    )
+    migrate_parser.set_defaults(command=migrate)
+
+    stats_parser = subparsers.add_parser("stats", help="show statistics of models", description="Show statistics of trained Markov models.")
+    stats_parser.add_argument(
+        "db_names",
+        metavar="db_name",
+        nargs="+",
+        type=str,
+        help="name of model to inspect",
+    )
+    stats_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the statistics of each model as a line of JSON",
+    )
+    stats_parser.set_defaults(command=stats)
+    return parser
+
+
+def main(argv: list[str]) -> None:
+    """Run a `train.py` command.
+
+    Parameters
+    ----------
+    argv : list[str]
+        command line arguments, starting with the command
+    """
+    args = build_parser().parse_args(argv)
+    args.command(args)
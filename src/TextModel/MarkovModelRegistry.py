@@ -0,0 +1,375 @@
+"""Process-wide registry of loaded Markov models.
+
+Each model is decompressed and loaded at most once per process and backend, no matter how many `MarkovTextModel` objects (or threads)
+use it. `MarkovTextModel` objects only keep their own chain state and share the loaded, read-only model data from here.
+
+Decompressed models are also kept across processes in `Directories.CACHE_DIR / "models"`, keyed by the hash of the `.db.gz` file, so
+only the first run after a model changes pays for decompression. The cache is capped at `MODEL_CACHE_MAX_BYTES` (environment variable
+`MARKOV_MODEL_CACHE_MAX_BYTES`, 2 GiB by default), evicting the least recently used models first; a cap of 0 disables the cache.
+Loaded models hold their cached databases with `CacheUtil.hold`, so no process evicts a database that a loaded model still reads.
+
+The "sqlite" backend reads the decompressed database through a `MarkovSQLiteReader` instead of SQLAlchemy. The "sql" and "sqlite"
+backends steer sentence endings with the same weights as the "compiled" backend through the `MarkovEndSteps` tables, which `train.py`
+saves into the model whenever it writes one; decompressed models trained before that only get them computed once, when they're cached.
+
+For the "compiled" backend, a binary export of the model in `models/{model_name}.markov` (see `train.py export`) is preferred over
+the SQLite database when it is at least as new as the database and the model's delta shards; its arrays are memory-mapped, so
+processes share them through the OS page cache. Without one, the model is compiled once and exported into the cache directory too,
+next to its decompressed database and keyed by the same hash, so later loads memory-map that export instead of compiling again.
+
+Delta shards (`models/{model_name}.d/*.db`, see `train.py train --delta`) that weren't folded into the base model yet are merged at load
+time: the "compiled" backend sums their counts while compiling, and the other backends read a copy of the base model with the shards
+folded in, which is kept in the cache directory too.
+"""
+
+import atexit
+from dataclasses import dataclass, field
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+import threading
+from typing import BinaryIO, Literal, Optional, Union
+import uuid
+
+from .MarkovSQLiteReader import MarkovSQLiteReader
+from .MarkovTransitionTable import MarkovTransitionTable
+from .MarkovTriads import MarkovEndSteps, MarkovFoldedDeltas, MarkovTriads, delta_paths
+import src.Directories as Directories
+from src.Util import CacheUtil
+
+_logger = logging.getLogger(__name__)
+
+MarkovBackend = Literal["compiled", "sql", "sqlite"]
+"""How a Markov model generates tokens: from a compiled in-memory table, through SQLAlchemy, or through raw read-only `sqlite3`."""
+
+MODEL_CACHE_MAX_BYTES: int = int(os.getenv("MARKOV_MODEL_CACHE_MAX_BYTES", 2 * 1024**3))
+"""Max total size of decompressed models and their binary exports kept in the cache directory."""
+
+_CACHE_VERSION = 2
+"""Version of the decompressed databases in the cache directory, part of their names so older cached copies aren't read; version 2
+added the `MarkovEndSteps` tables."""
+
+_CACHE_PATTERNS = ("*.db", "*.markov")
+"""Glob patterns of the decompressed databases and binary exports in the cache directory, which share its size cap."""
+
+
+@dataclass
+class LoadedMarkovModel:
+    """Read-only data of a loaded Markov model, shared between all text models using it."""
+
+    model_name: str
+    backend: MarkovBackend
+    markov_table: MarkovTriads = field(default_factory=MarkovTriads)
+    engine: Optional[Engine] = None
+    """Engine of the decompressed database, only kept for the "sql" backend."""
+    transition_table: Optional[MarkovTransitionTable] = None
+    """Compiled transition table, only set for the "compiled" backend."""
+    reader: Optional[MarkovSQLiteReader] = None
+    """Read-only `sqlite3` reader of the decompressed database, only set for the "sqlite" backend."""
+    tmp_path: Optional[str] = None
+    """Path of the decompressed database if it's a temp file to delete on clean up; cached databases are left in place."""
+    held_db: Optional[BinaryIO] = None
+    """Cached database held with `CacheUtil.hold` while the model uses it, released on clean up."""
+
+    def clean_up(self) -> None:
+        """Dispose of the engine, close the reader, release the cached database, and delete the decompressed database file."""
+        if self.engine:
+            self.engine.dispose()
+            self.engine = None
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+        if self.held_db:
+            CacheUtil.release(self.held_db)
+            self.held_db = None
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.tmp_path = None
+
+
+_models: dict[tuple[str, str], LoadedMarkovModel] = {}
+_models_lock = threading.Lock()
+_load_locks: dict[tuple[str, str], threading.Lock] = {}
+
+
+def _model_hash(model_name: str) -> str:
+    """Get the SHA-256 hex digest of `models/{model_name}.db.gz`, which is only rehashed when its mtime or size changes."""
+    gz_path = Directories.MODELS_DIR / f"{model_name}.db.gz"
+    gz_stat = gz_path.stat()
+    key_path = Directories.CACHE_DIR / "models" / f"{model_name}.key.json"
+    try:
+        key = json.loads(key_path.read_text())
+    except (OSError, json.JSONDecodeError):
+        key = {}
+    if key.get("mtime_ns") != gz_stat.st_mtime_ns or key.get("size") != gz_stat.st_size or "sha256" not in key:
+        key = {"mtime_ns": gz_stat.st_mtime_ns, "size": gz_stat.st_size, "sha256": CacheUtil.file_hash(gz_path)}
+        CacheUtil.atomic_write(key_path, lambda f: f.write(json.dumps(key).encode("utf-8")))
+    return key["sha256"]
+
+
+def _shards_key(shard_paths: list[Path]) -> str:
+    """Get a key of the delta shards that changes whenever a shard is added, removed or rewritten."""
+    return hashlib.sha256("\n".join(f"{path.name}:{path.stat().st_size}:{path.stat().st_mtime_ns}" for path in shard_paths).encode("utf-8")).hexdigest()
+
+
+def model_version(model_name: str) -> str:
+    """Get a key of the contents of a model, which changes whenever it's retrained, whether into the base model or into delta shards.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model, which requires the file `models/{model_name}.db.gz`
+
+    Returns
+    -------
+    str
+        hash of the compressed model, followed by a key of its delta shards if it has any
+    """
+    shard_paths = delta_paths(model_name)
+    model_hash = _model_hash(model_name)
+    return f"{model_hash}.{_shards_key(shard_paths)}" if shard_paths else model_hash
+
+
+def _cached_db_path(model_name: str) -> Path:
+    """Get the path of the decompressed model in the cache directory."""
+    return Directories.CACHE_DIR / "models" / f"{model_name}.{_model_hash(model_name)[:16]}.v{_CACHE_VERSION}.db"
+
+
+def _cached_binary_path(model_name: str, shard_paths: list[Path]) -> Path:
+    """Get the path of the binary export of the model, compiled along with its delta shards, in the cache directory."""
+    db_path = _cached_db_path(model_name)
+    return db_path.with_name(f"{db_path.stem}.{_shards_key(shard_paths)[:16]}.markov" if shard_paths else f"{db_path.stem}.markov")
+
+
+def _load_cached_binary(binary_path: Path) -> Optional[MarkovTransitionTable]:
+    """Memory-map the binary export in the cache directory if it exists."""
+    if not (binary_path / "vocab.txt").exists():
+        return None
+    try:
+        transition_table = MarkovTransitionTable.load(binary_path)
+    except FileNotFoundError:
+        # Evicted by another process while loading; memory-mapped arrays stay readable once they're loaded
+        return None
+    CacheUtil.touch(binary_path)
+    return transition_table
+
+
+def _save_cached_binary(binary_path: Path, transition_table: MarkovTransitionTable) -> None:
+    """Save the compiled model as a binary export in the cache directory, unless another process already did."""
+    if (binary_path / "vocab.txt").exists():
+        return
+    try:
+        transition_table.save(binary_path)
+    except OSError:
+        _logger.warning(f"Could not save the compiled Markov model {binary_path.name} into the model cache", exc_info=True)
+        return
+    CacheUtil.evict_lru(binary_path.parent, MODEL_CACHE_MAX_BYTES, pattern=_CACHE_PATTERNS, keep=[binary_path])
+
+
+def _hold_cached_db(model_name: str) -> tuple[Path, BinaryIO, Optional[MarkovTransitionTable]]:
+    """Hold the decompressed model in the cache directory, decompressing it first if it isn't cached yet, and return its path along
+    with the held file, and the table compiled from it if saving its end steps took compiling it."""
+    gz_path = Directories.MODELS_DIR / f"{model_name}.db.gz"
+    db_path = _cached_db_path(model_name)
+    cache_dir = db_path.parent
+    held_db = CacheUtil.hold(db_path)
+    if held_db:
+        CacheUtil.touch(db_path)
+        return db_path, held_db, None
+
+    _logger.info(f"Decompressing Markov model {model_name} into the model cache")
+
+    # Another process may evict the new database before it's held, if the cache is too small for it
+    while not held_db:
+        with CacheUtil.atomic_path(db_path) as tmp_path:
+            with gzip.open(gz_path, "rb") as f_src, open(tmp_path, "wb") as f_dst:
+                shutil.copyfileobj(f_src, f_dst)
+            transition_table = _save_end_steps(tmp_path)
+        held_db = CacheUtil.hold(db_path)
+    CacheUtil.evict_lru(cache_dir, MODEL_CACHE_MAX_BYTES, pattern=_CACHE_PATTERNS)
+    return db_path, held_db, transition_table
+
+
+def _hold_cached_merged_db(model_name: str, db_path: Path, shard_paths: list[Path]) -> tuple[Path, BinaryIO]:
+    """Hold the cached base model `db_path` (which must be held already) with the delta shards folded in, folding them into a copy
+    first if needed, and return its path along with the held file."""
+    cache_dir = db_path.parent
+    merged_path = cache_dir / f"{db_path.stem}.{_shards_key(shard_paths)[:16]}.db"
+    held_db = CacheUtil.hold(merged_path)
+    if held_db:
+        CacheUtil.touch(merged_path)
+        return merged_path, held_db
+
+    _logger.info(f"Merging {len(shard_paths)} delta shards into Markov model {model_name} in the model cache")
+    while not held_db:
+        with CacheUtil.atomic_path(merged_path) as tmp_path:
+            shutil.copyfile(db_path, tmp_path)
+            _fold_deltas(tmp_path, shard_paths)
+            # The base model's end steps don't count the shards
+            _save_end_steps(tmp_path, overwrite=True)
+        held_db = CacheUtil.hold(merged_path)
+    CacheUtil.evict_lru(cache_dir, MODEL_CACHE_MAX_BYTES, pattern=_CACHE_PATTERNS)
+    return merged_path, held_db
+
+
+def _fold_deltas(db_path: Union[str, Path], shard_paths: list[Path]) -> None:
+    """Fold the delta shards into the (writable) decompressed model database."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    MarkovTriads.for_engine(engine).fold_deltas(engine, shard_paths)
+    engine.dispose()
+
+
+def _save_end_steps(db_path: Union[str, Path], overwrite: bool = False) -> Optional[MarkovTransitionTable]:
+    """Compile the (writable) decompressed model database and save the expected steps to a sentence end of its states into it, unless
+    it has them already and not `overwrite`, and return the compiled table if it was compiled."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        if not overwrite and MarkovEndSteps().has_tables(engine):
+            return None
+        _logger.info(f"Saving the end steps of Markov model database {db_path}")
+        transition_table = MarkovTransitionTable.from_engine(engine)
+        transition_table.save_end_steps(engine)
+        return transition_table
+    finally:
+        engine.dispose()
+
+
+def _binary_path(model_name: str, shard_paths: list[Path]) -> Optional[Path]:
+    """Get the path of the model's binary export if it exists and isn't older than its SQLite database or delta shards."""
+    binary_path = Directories.MODELS_DIR / f"{model_name}.markov"
+    gz_path = Directories.MODELS_DIR / f"{model_name}.db.gz"
+    if not (binary_path / "vocab.txt").exists():
+        return None
+    binary_mtime = (binary_path / "vocab.txt").stat().st_mtime
+    if gz_path.exists() and gz_path.stat().st_mtime > binary_mtime:
+        _logger.warning(f"Binary export of Markov model {model_name} is older than its database, ignoring it")
+        return None
+    if any(path.stat().st_mtime > binary_mtime for path in shard_paths):
+        _logger.warning(f"Binary export of Markov model {model_name} is older than its delta shards, ignoring it")
+        return None
+    return binary_path
+
+
+def load(model_name: str, backend: MarkovBackend) -> LoadedMarkovModel:
+    """Load the model `models/{model_name}.db.gz` with its delta shards, from the model cache if enabled or from a temp decompressed
+    copy otherwise. Unlike `get_model`, this always loads a new copy that isn't shared, which the caller must clean up.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model, which requires the file `models/{model_name}.db.gz`
+    backend : MarkovBackend
+        backend to load the model for
+
+    Returns
+    -------
+    LoadedMarkovModel
+        newly loaded model data
+    """
+    _logger.info(f"Loading Markov model {model_name} with {backend} backend")
+    shard_paths = delta_paths(model_name)
+    if backend == "compiled" and (binary_path := _binary_path(model_name, shard_paths)):
+        return LoadedMarkovModel(model_name, backend, transition_table=MarkovTransitionTable.load(binary_path))
+    if backend == "compiled" and MODEL_CACHE_MAX_BYTES > 0:
+        cached_binary_path = _cached_binary_path(model_name, shard_paths)
+        if cached_table := _load_cached_binary(cached_binary_path):
+            return LoadedMarkovModel(model_name, backend, transition_table=cached_table)
+    tmp_path: Optional[str] = None
+    held_db: Optional[BinaryIO] = None
+    transition_table: Optional[MarkovTransitionTable] = None
+    if MODEL_CACHE_MAX_BYTES > 0:
+        cached_path, held_db, transition_table = _hold_cached_db(model_name)
+        if shard_paths and backend != "compiled":
+            try:
+                merged_path, held_merged_db = _hold_cached_merged_db(model_name, cached_path, shard_paths)
+            finally:
+                # Only the merged database is read from now on
+                CacheUtil.release(held_db)
+            cached_path, held_db = merged_path, held_merged_db
+        db_path = str(cached_path)
+        engine_url = f"sqlite:///file:{db_path}?mode=ro&uri=true"
+    else:
+        gz_path = Directories.MODELS_DIR / f"{model_name}.db.gz"
+        # Add uuid to the temp path to avoid clashing with other processes
+        db_path = tmp_path = f"{gz_path}_tmp_{str(uuid.uuid4())}.db"
+        with gzip.open(gz_path, "rb") as f_src, open(tmp_path, "wb") as f_dst:
+            shutil.copyfileobj(f_src, f_dst)
+        if backend != "compiled":
+            if shard_paths:
+                _fold_deltas(tmp_path, shard_paths)
+            _save_end_steps(tmp_path, overwrite=bool(shard_paths))
+        engine_url = f"sqlite:///{tmp_path}"
+    model = LoadedMarkovModel(model_name, backend, tmp_path=tmp_path, held_db=held_db)
+    try:
+        if backend == "sqlite":
+            model.reader = MarkovSQLiteReader(db_path)
+            model.markov_table = model.reader.markov_table
+            return model
+        engine = model.engine = create_engine(engine_url)
+        model.markov_table = MarkovTriads.for_engine(engine)
+        if backend == "compiled":
+            # Read the whole table and the pending delta shards once, unless the table was just compiled to save the model's end steps;
+            # the databases aren't needed after that
+            shard_engines = [create_engine(f"sqlite:///file:{path}?mode=ro&uri=true") for path in MarkovFoldedDeltas().pending(engine, shard_paths)]
+            if transition_table is None or shard_engines:
+                transition_table = MarkovTransitionTable.from_engines([engine, *shard_engines])
+            model.transition_table = transition_table
+            if MODEL_CACHE_MAX_BYTES > 0:
+                _save_cached_binary(cached_binary_path, transition_table)
+            for shard_engine in shard_engines:
+                shard_engine.dispose()
+            model.clean_up()
+    except BaseException:
+        model.clean_up()
+        raise
+    return model
+
+
+def get_model(model_name: str, backend: MarkovBackend = "compiled") -> LoadedMarkovModel:
+    """Get the loaded model with the given name and backend, loading it if this is the first time it's requested in this process.
+
+    Concurrent requests for the same model wait for a single load; different models load in parallel.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model, which requires the file `models/{model_name}.db.gz`
+    backend : MarkovBackend, optional
+        backend to load the model for, by default "compiled"
+
+    Returns
+    -------
+    LoadedMarkovModel
+        shared, read-only model data
+    """
+    key = (model_name, backend)
+    with _models_lock:
+        if key in _models:
+            return _models[key]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        # Another thread may have finished loading while this one waited
+        if key not in _models:
+            model = load(model_name, backend)
+            with _models_lock:
+                _models[key] = model
+        return _models[key]
+
+
+def unload_all() -> None:
+    """Clean up and forget all loaded models."""
+    with _models_lock:
+        for model in _models.values():
+            model.clean_up()
+        _models.clear()
+        _load_locks.clear()
+
+
+# Ensure decompressed databases are deleted on exit
+atexit.register(unload_all)
@@ -0,0 +1,242 @@
+"""Inspection and benchmarks of trained Markov models, run with `train.py stats <db_name...>` and `train.py bench <db_name...>`.
+
+Stats describe a model's size (vocabulary, triads, states and how many next tokens each state has), its footprint on disk and in
+memory, and how long each backend takes to load it. Benchmarks generate text blocks with every backend and report throughput and
+per-block latency, so slow models and regressions after retraining can be spotted.
+"""
+
+import argparse
+import json
+import numpy as np
+from pathlib import Path
+import sys
+import time
+from typing import Any, Iterable, Optional, get_args
+
+from .GenerationState import GenerationState
+from . import MarkovModelRegistry
+from .MarkovModelRegistry import MarkovBackend
+from .MarkovTextModel import MarkovTextModel
+from .MarkovTransitionTable import MarkovTransitionTable
+from .MarkovTriads import delta_paths
+import src.Directories as Directories
+from src.Util import TokenizeUtil
+
+BACKENDS: tuple[MarkovBackend, ...] = get_args(MarkovBackend)
+"""All backends a Markov model can be loaded with."""
+
+
+def _path_size(path: Path) -> int:
+    """Get the size of a file, or the total size of the files in a directory."""
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+
+def _distribution(values: np.ndarray) -> dict[str, float]:
+    """Summarize values with their mean and percentiles."""
+    if len(values) == 0:
+        return {}
+    percentiles = np.percentile(values, [50, 90, 99])
+    return {
+        "mean": float(values.mean()),
+        "p50": float(percentiles[0]),
+        "p90": float(percentiles[1]),
+        "p99": float(percentiles[2]),
+        "max": float(values.max()),
+    }
+
+
+def table_memory_bytes(table: MarkovTransitionTable) -> int:
+    """Estimate the memory used by a compiled transition table: its arrays and its vocabulary strings.
+
+    Parameters
+    ----------
+    table : MarkovTransitionTable
+        compiled transition table
+
+    Returns
+    -------
+    int
+        approximate size in bytes
+    """
+    array_bytes = sum(getattr(table, name).nbytes for name in MarkovTransitionTable.ARRAY_NAMES)
+    return array_bytes + sum(sys.getsizeof(token) for token in table.vocab) + sys.getsizeof(table.vocab)
+
+
+def time_load(model_name: str, backend: MarkovBackend) -> float:
+    """Time loading a model with a backend from scratch, bypassing the models already loaded in this process. Decompression is
+    included if the model isn't in the model cache yet.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model
+    backend : MarkovBackend
+        backend to load the model with
+
+    Returns
+    -------
+    float
+        load time in seconds
+    """
+    start = time.perf_counter()
+    model = MarkovModelRegistry.load(model_name, backend)
+    load_time = time.perf_counter() - start
+    model.clean_up()
+    return load_time
+
+
+def model_stats(model_name: str) -> dict[str, Any]:
+    """Get statistics of a trained Markov model.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model, which requires the file `models/{model_name}.db.gz`
+
+    Returns
+    -------
+    dict[str, Any]
+        model statistics: vocabulary, triad, state and sentence start counts, the distribution of the number of next tokens of each
+        2-gram state (fanout), on-disk sizes, estimated in-memory size when compiled, and load time of each backend in seconds
+    """
+    load_times = {backend: time_load(model_name, backend) for backend in BACKENDS}
+    model = MarkovModelRegistry.get_model(model_name)
+    table = model.transition_table
+    if not table:
+        raise RuntimeError(f"Markov model {model_name} has no compiled transition table")
+    binary_path = Directories.MODELS_DIR / f"{model_name}.markov"
+    shard_paths = delta_paths(model_name)
+    return {
+        "model": model_name,
+        "vocab_size": table.vocab_size,
+        "triads": len(table.next_ids),
+        "occurrences": int(table.weights.sum()),
+        "states": len(table.state_keys),
+        "sentence_starts": len(table.start_ids),
+        "fanout": _distribution(np.diff(table.offsets)),
+        "gz_bytes": _path_size(Directories.MODELS_DIR / f"{model_name}.db.gz"),
+        "binary_bytes": _path_size(binary_path),
+        "delta_shards": len(shard_paths),
+        "delta_bytes": sum(_path_size(path) for path in shard_paths),
+        "compiled_memory_bytes": table_memory_bytes(table),
+        "load_seconds": load_times,
+    }
+
+
+def bench_model(model_name: str, backends: Iterable[MarkovBackend] = BACKENDS, n_blocks: int = 50, seed: int = 0) -> list[dict[str, Any]]:
+    """Benchmark generating text blocks from a model with each backend.
+
+    Every backend generates the same number of blocks from the same seeds after one warm-up block. For the "compiled" backend, the
+    batched `get_text_blocks` is benchmarked too, as "compiled-batch", where the latency is of the whole batch.
+
+    Parameters
+    ----------
+    model_name : str
+        name of the model, which requires the file `models/{model_name}.db.gz`
+    backends : Iterable[MarkovBackend], optional
+        backends to benchmark, by default all of them
+    n_blocks : int, optional
+        number of text blocks to generate per backend, by default 50
+    seed : int, optional
+        seed of the first block's random generator, by default 0
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        results of each backend: load time (if it wasn't loaded in this process yet), generated tokens, tokens per second, and
+        per-block latency distribution in milliseconds
+    """
+    results = []
+    for backend in backends:
+        start = time.perf_counter()
+        MarkovModelRegistry.get_model(model_name, backend)
+        load_seconds = time.perf_counter() - start
+        text_model = MarkovTextModel(model_name, backend=backend)
+        text_model.get_text_block(state=GenerationState.from_seed(seed))
+        latencies = []
+        n_tokens = 0
+        for i in range(n_blocks):
+            start = time.perf_counter()
+            text = text_model.get_text_block(state=GenerationState.from_seed(seed + i))
+            latencies.append(time.perf_counter() - start)
+            n_tokens += len(TokenizeUtil.word_tokenize(text))
+        results.append(_bench_result(backend, load_seconds, n_tokens, latencies))
+        if backend == "compiled":
+            start = time.perf_counter()
+            texts = text_model.get_text_blocks(n_blocks, state=GenerationState.from_seed(seed))
+            batch_seconds = time.perf_counter() - start
+            results.append(_bench_result("compiled-batch", 0.0, sum(len(TokenizeUtil.word_tokenize(text)) for text in texts), [batch_seconds]))
+    return results
+
+
+def _bench_result(backend: str, load_seconds: float, n_tokens: int, latencies: list[float]) -> dict[str, Any]:
+    """Summarize the benchmark of a backend."""
+    total_seconds = sum(latencies)
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "tokens": n_tokens,
+        "tokens_per_second": n_tokens / total_seconds if total_seconds > 0 else float("inf"),
+        "latency_ms": {key: value * 1000 for key, value in _distribution(np.array(latencies)).items()},
+    }
+
+
+def _format_bytes(n_bytes: int) -> str:
+    """Format a number of bytes with a binary unit."""
+    size = float(n_bytes)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def _print_stats(stats: dict[str, Any]) -> None:
+    """Print model statistics in a readable form."""
+    print(f"{stats['model']}:")
+    print(f"  vocabulary: {stats['vocab_size']:,} tokens, {stats['sentence_starts']:,} sentence starts")
+    print(f"  triads: {stats['triads']:,} over {stats['states']:,} states, {stats['occurrences']:,} occurrences")
+    print("  fanout: " + ", ".join(f"{key} {value:,.1f}" for key, value in stats["fanout"].items()))
+    print(
+        f"  on disk: {_format_bytes(stats['gz_bytes'])} compressed, {_format_bytes(stats['binary_bytes'])} binary export, "
+        f"{stats['delta_shards']} delta shards ({_format_bytes(stats['delta_bytes'])})"
+    )
+    print(f"  in memory: {_format_bytes(stats['compiled_memory_bytes'])} compiled")
+    print("  load time: " + ", ".join(f"{backend} {seconds * 1000:,.0f} ms" for backend, seconds in stats["load_seconds"].items()))
+
+
+def _print_bench(model_name: str, results: list[dict[str, Any]]) -> None:
+    """Print benchmark results as a table."""
+    print(f"{model_name}:")
+    print(f"  {'backend':<16}{'load ms':>10}{'tokens/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        latency = result["latency_ms"]
+        print(
+            f"  {result['backend']:<16}{result['load_seconds'] * 1000:>10,.0f}{result['tokens_per_second']:>12,.0f}"
+            f"{latency.get('p50', 0):>10,.2f}{latency.get('p99', 0):>10,.2f}"
+        )
+
+
+def stats(args: argparse.Namespace) -> None:
+    """Show statistics of trained models, from the parsed `train.py stats` arguments."""
+    for db_name in args.db_names:
+        summary = model_stats(db_name)
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            _print_stats(summary)
+        MarkovModelRegistry.unload_all()
+
+
+def bench(args: argparse.Namespace) -> None:
+    """Benchmark generating text from trained models, from the parsed `train.py bench` arguments."""
+    backends: Optional[list[MarkovBackend]] = args.backends
+    for db_name in args.db_names:
+        results = bench_model(db_name, backends or BACKENDS, n_blocks=args.blocks, seed=args.seed)
+        if args.json:
+            print(json.dumps({"model": db_name, "results": results}))
+        else:
+            _print_bench(db_name, results)
+        MarkovModelRegistry.unload_all()
@@ -0,0 +1,181 @@
+import logging
+import numpy as np
+from pathlib import Path
+import sqlite3
+import threading
+from typing import ClassVar, Optional, Union
+from urllib.parse import quote
+
+from .MarkovTriads import SENTENCE_END_TOKENS, MarkovTriads, choose_word_from_rows, terminating_rows
+
+_logger = logging.getLogger(__name__)
+
+
+class MarkovSQLiteReader:
+    """Read-only access to a Markov model database through raw `sqlite3`, for generating tokens without SQLAlchemy overhead.
+
+    The database is opened with `immutable=1`, so SQLite skips locking and change detection, and with a large `mmap_size`, so pages
+    are read straight from the OS page cache. Each thread gets its own connection, and every query is one of a few fixed SQL strings,
+    which `sqlite3` keeps prepared in each connection's statement cache. Queries are answered from the indexes made by
+    `MarkovTriads.create_indexes`; models trained before those indexes existed get them with `python3 train.py migrate <db_name>`,
+    and the reader logs a warning when opening a database without them. Sampling with `terminating=True` also reads the `MarkovEndSteps` tables, which `MarkovModelRegistry`
+    adds to the databases it loads.
+
+    The database file must not change while a reader has it open.
+    """
+
+    MMAP_SIZE: ClassVar[int] = 1 << 30
+    """Default max bytes of the database to memory-map."""
+
+    def __init__(self, db_path: Union[str, Path], mmap_size: Optional[int] = None):
+        """Create a `MarkovSQLiteReader`.
+
+        Parameters
+        ----------
+        db_path : Union[str, Path]
+            path of the (decompressed) Markov model database
+        mmap_size : Optional[int], optional
+            max bytes of the database to memory-map, by default `MMAP_SIZE`
+        """
+        self.db_path = str(db_path)
+        self.mmap_size = self.__class__.MMAP_SIZE if mmap_size is None else mmap_size
+        self.__local = threading.local()
+        self.__connections: list[sqlite3.Connection] = []
+        self.__connections_lock = threading.Lock()
+        self.__start_rows: Optional[list[tuple[str, int]]] = None
+        schema_version = max(1, self._connection().execute("PRAGMA user_version").fetchone()[0])
+        self.markov_table = MarkovTriads(schema_version=schema_version)
+        """Table definition matching the database, used for sampling and detokenizing."""
+        schema_names = {row[0] for row in self._connection().execute("SELECT name FROM sqlite_master")}
+        missing_indexes = sorted(set(self.markov_table.read_indexes) - schema_names)
+        if missing_indexes:
+            _logger.warning(
+                f"Markov model database {self.db_path} is missing the read indexes {', '.join(missing_indexes)}, so token lookups scan the "
+                "whole table; add them with `python3 train.py migrate <db_name>`"
+            )
+        end_steps_table = self.markov_table.end_steps_table
+        self.__has_end_steps = {end_steps_table.table_name, end_steps_table.uni_table.table_name} <= schema_names
+        self.__next_sql, self.__next_unigram_sql, self.__start_sql = self.__statements()
+        self.__term_next_sql, self.__term_next_unigram_sql = self.__terminating_statements()
+
+    def __statements(self) -> tuple[str, str, str]:
+        """Get the SQL of the 2-gram, 1-gram and sentence start queries for the database's schema version."""
+        triads = self.markov_table.table_name
+        end_params = ", ".join("?" for _ in SENTENCE_END_TOKENS)
+        if self.markov_table.schema_version >= 2:
+            vocab = self.markov_table.vocab_table.table_name
+            select_from = f"SELECT v.token AS token, {{weight}} AS weight FROM {triads} t JOIN {vocab} v ON v.id = t.third_token"
+            token_id = f"(SELECT id FROM {vocab} WHERE token = ?)"
+            return (
+                select_from.format(weight="t.occurrences") + f" WHERE t.first_token = {token_id} AND t.second_token = {token_id}",
+                select_from.format(weight="SUM(t.occurrences)") + f" WHERE t.second_token = {token_id} GROUP BY v.token",
+                select_from.format(weight="SUM(t.occurrences)")
+                + f" WHERE t.second_token IN (SELECT id FROM {vocab} WHERE token IN ({end_params})) GROUP BY v.token",
+            )
+        return (
+            f"SELECT third_token AS token, occurrences AS weight FROM {triads} WHERE first_token = ? AND second_token = ?",
+            f"SELECT third_token AS token, SUM(occurrences) AS weight FROM {triads} WHERE second_token = ? GROUP BY third_token",
+            f"SELECT third_token AS token, SUM(occurrences) AS weight FROM {triads} WHERE second_token IN ({end_params}) GROUP BY third_token",
+        )
+
+    def __terminating_statements(self) -> tuple[str, str]:
+        """Get the SQL of the 2-gram and 1-gram queries that also select the expected steps to a sentence end of the state each token
+        leads to, like `MarkovEndSteps.select_next_steps`. The 2-gram query takes the second token of the state again as its last
+        parameter."""
+        end_steps_table = self.markov_table.end_steps_table
+        end_steps, uni_end_steps = end_steps_table.table_name, end_steps_table.uni_table.table_name
+        join_uni = f"LEFT JOIN {uni_end_steps} u ON u.token = n.token"
+        return (
+            f"SELECT n.token, n.weight, COALESCE(e.steps, u.steps) FROM ({self.__next_sql}) n {join_uni} "
+            f"LEFT JOIN {end_steps} e ON e.first_token = ? AND e.second_token = n.token",
+            f"SELECT n.token, n.weight, u.steps FROM ({self.__next_unigram_sql}) n {join_uni}",
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection to the database, opening it on first use."""
+        conn: Optional[sqlite3.Connection] = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{quote(self.db_path)}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            self.__local.conn = conn
+            with self.__connections_lock:
+                self.__connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close the connections of all threads."""
+        with self.__connections_lock:
+            for conn in self.__connections:
+                conn.close()
+            self.__connections.clear()
+        self.__local = threading.local()
+
+    def get_first_token(self, rng: Optional[np.random.Generator] = None) -> str:
+        """Return the first token for a generated sentence. The sentence start distribution is read once and cached.
+
+        Parameters
+        ----------
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the `MarkovTriads` module generator
+
+        Returns
+        -------
+        str
+            first generated token
+
+        Raises
+        ------
+        ValueError
+            raised if the model has no sentence starts to choose from
+        """
+        if self.__start_rows is None:
+            rows = [row for row in self._connection().execute(self.__start_sql, SENTENCE_END_TOKENS).fetchall() if row[0]]
+            if len(rows) == 0:
+                raise ValueError("Markov model has no sentence starts to choose from")
+            self.__start_rows = rows
+        return choose_word_from_rows(self.__start_rows, rng=rng) or ""
+
+    def get_next_token(self, first_token: str, second_token: Optional[str] = None, terminating: bool = False, rng: Optional[np.random.Generator] = None) -> str:
+        """Return the next token for a generated sentence, with the same behavior as `MarkovTriads.get_next_token`.
+
+        Parameters
+        ----------
+        first_token : str
+            first token to check in model
+        second_token : Optional[str], optional
+            second token to check in model, by default None
+        terminating : bool, optional
+            whether to favor tokens that end the sentence sooner, reweighting them with `terminating_rows`; by default False
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the `MarkovTriads` module generator
+
+        Returns
+        -------
+        str
+            next generated token
+
+        Raises
+        ------
+        ValueError
+            raised if `terminating` but the database has no `MarkovEndSteps` tables
+        """
+        conn = self._connection()
+        if terminating:
+            if not self.__has_end_steps:
+                raise ValueError("Cannot steer sentence endings without end steps; save them with MarkovTransitionTable.save_end_steps")
+            # Treat as 1-gram Markov model if only first_token provided, otherwise 2-gram
+            if not second_token:
+                rows = terminating_rows(conn.execute(self.__term_next_unigram_sql, (first_token,)))
+            else:
+                rows = terminating_rows(conn.execute(self.__term_next_sql, (first_token, second_token, second_token)))
+        elif not second_token:
+            rows = conn.execute(self.__next_unigram_sql, (first_token,)).fetchall()
+        else:
+            rows = conn.execute(self.__next_sql, (first_token, second_token)).fetchall()
+        chosen_token = choose_word_from_rows(rows, rng=rng)
+        # In the event there is no link for the next choice, choose a new random one
+        if not chosen_token:
+            if not second_token:
+                return self.get_first_token(rng=rng)
+            return self.get_next_token(second_token, terminating=terminating, rng=rng)
+        return chosen_token
@@ -1,25 +1,17 @@
-import atexit
-import gzip
-import nltk
 import numpy as np
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
-from typing import Any, ClassVar, Optional, Union
-import uuid
+from typing import Any, ClassVar, Optional, Sequence, Union
 
+from .GenerationState import GenerationState
 from .TextModel import TextModel
-from .MarkovTriads import MarkovTriads
-import src.Directories as Directories
+from . import MarkovModelRegistry
+from .MarkovModelRegistry import LoadedMarkovModel, MarkovBackend
+from .MarkovTransitionTable import MarkovTransitionTable
+from .MarkovTriads import SENTENCE_END_TOKENS
+from src.Util import TokenizeUtil
 
 
-nltk.download("punkt", quiet=True)
-
-_rng = np.random.default_rng()
-
-
-def _gauss_int(mean: float, stdev: float, min_val: int = 0) -> int:
-    return max(min_val, round(_rng.normal(mean, stdev)))
+def _gauss_int(rng: np.random.Generator, mean: float, stdev: float, min_val: int = 0) -> int:
+    return max(min_val, round(rng.normal(mean, stdev)))
 
 
 class MarkovTextModel(TextModel):
@@ -36,6 +28,8 @@ class MarkovTextModel(TextModel):
         mean_paragraphs: Union[int, float] = 1,
         stdev_paragraphs: Union[int, float] = 0,
         punc_required: bool = True,
+        steer_endings: bool = True,
+        backend: MarkovBackend = "compiled",
         **kwargs: Any,
     ):
         """Create a `MarkovTextModel`.
@@ -54,96 +48,208 @@ class MarkovTextModel(TextModel):
             standard deviation of number of paragraphs, by default 0
         punc_required : bool, optional
             whether punctuation is required in this model, by default True
+        steer_endings : bool, optional
+            whether to favor tokens that end the sentence sooner once the paragraph's word count is reached, when punctuation is
+            required; this bounds how long finishing the last sentence takes; by default True
+        backend : MarkovBackend, optional
+            how tokens are looked up: "compiled" reads the model once into a `MarkovTransitionTable` in memory, "sql" queries the
+            SQLite database through SQLAlchemy for every token, and "sqlite" queries it through a read-only `MarkovSQLiteReader`;
+            by default "compiled"
         """
         super().__init__(
             model_name, mean_words=mean_words, stdev_words=stdev_words, mean_paragraphs=mean_paragraphs, stdev_paragraphs=stdev_paragraphs, **kwargs
         )
-        self.__first_word: Optional[str] = None
-        self.__second_word: Optional[str] = None
+        # Only used by get_next_word calls without a state
+        self.__state = GenerationState()
         self.__punc_required: bool = punc_required
-        self.__markov_table = MarkovTriads()
-        self.__db_path = Directories.MODELS_DIR / f"{model_name}.db.gz"
-        # Don't decompress database right away, only load when necessary
-        self.__tmp_path: Optional[str] = None
-        self.__engine: Optional[Engine] = None
-        # Ensure ungzipped database is deleted on exit
-        atexit.register(self.__clean_up)
-
-    def __load_db(self) -> None:
-        """Decompress and load the database."""
-        # Add uuid to the temp path to avoid concurrent thread issues
-        self.__tmp_path = f"{self.__db_path}_tmp_{str(uuid.uuid4())}.db"
-        with gzip.open(self.__db_path, "rb") as f_src, open(self.__tmp_path, "wb") as f_dst:
-            f_dst.writelines(f_src)
-        self.__engine = create_engine(f"sqlite:///{self.__tmp_path}")
-
-    def __clean_up(self) -> None:
-        """Delete the ungzipped database file once done."""
-        if self.__tmp_path and os.path.exists(self.__tmp_path):
-            os.remove(self.__tmp_path)
-
-    def get_next_word(self) -> str:
+        self.__steer_endings: bool = steer_endings
+        self.__backend = backend
+        self.__model_name = model_name
+        # Don't load the model right away, only get it from the registry when necessary
+        self.__model: Optional[LoadedMarkovModel] = None
+
+    def __get_model(self) -> LoadedMarkovModel:
+        """Get the shared model data from the registry, loading it on first use."""
+        if not self.__model:
+            self.__model = MarkovModelRegistry.get_model(self.__model_name, self.__backend)
+        return self.__model
+
+    def get_next_word(self, state: Optional[GenerationState] = None, terminating: bool = False) -> str:
         """Use the Markov model to get the next word.
 
+        Parameters
+        ----------
+        state : Optional[GenerationState]
+            generation state to continue and update, or none to use the text model's own state, which isn't thread-safe
+        terminating : bool, optional
+            whether to favor words that end the sentence sooner, by default False
+
         Returns
         -------
         str
             next word from the model
         """
-        # Load database if not loaded first
-        if not self.__engine:
-            self.__load_db()
-            return self.get_next_word()
-        else:
-            if self.__second_word:
-                if self.__first_word:
-                    third_word = self.__markov_table.get_next_token(self.__engine, self.__first_word, self.__second_word)
+        state = state or self.__state
+        model = self.__get_model()
+        if model.transition_table:
+            table = model.transition_table
+            if state.second_word:
+                if state.first_word:
+                    third_word = table.get_next_token(state.first_word, state.second_word, rng=state.rng, terminating=terminating)
+                else:
+                    third_word = table.get_next_token(state.second_word, rng=state.rng, terminating=terminating)
+            else:
+                third_word = table.get_first_token(state.rng)
+        elif model.reader:
+            reader = model.reader
+            if state.second_word:
+                if state.first_word:
+                    third_word = reader.get_next_token(state.first_word, state.second_word, terminating=terminating, rng=state.rng)
                 else:
-                    third_word = self.__markov_table.get_next_token(self.__engine, self.__second_word)
+                    third_word = reader.get_next_token(state.second_word, terminating=terminating, rng=state.rng)
             else:
-                third_word = self.__markov_table.get_first_token(self.__engine)
-            # Update the Markov model state
-            self.__first_word = self.__second_word
-            self.__second_word = third_word
-            return third_word
+                third_word = reader.get_first_token(rng=state.rng)
+        elif model.engine:
+            markov_table, engine = model.markov_table, model.engine
+            if state.second_word:
+                if state.first_word:
+                    third_word = markov_table.get_next_token(engine, state.first_word, state.second_word, terminating=terminating, rng=state.rng)
+                else:
+                    third_word = markov_table.get_next_token(engine, state.second_word, terminating=terminating, rng=state.rng)
+            else:
+                third_word = markov_table.get_first_token(engine, rng=state.rng)
+        else:
+            raise RuntimeError(f"Markov model {self.__model_name} has been unloaded")
+        # Update the Markov model state
+        state.first_word = state.second_word
+        state.second_word = third_word
+        return third_word
 
-    def get_text_block(self, prompt: Optional[str] = None) -> str:
+    def get_text_block(self, prompt: Optional[str] = None, state: Optional[GenerationState] = None) -> str:
         """Get a random block of text from the model.
 
         Parameters
         ----------
         prompt : Optional[str]
             prompt to start the model with, or none if starting from empty state
+        state : Optional[GenerationState]
+            generation state to use, or none to use a new one for this call
 
         Returns
         -------
         str
             random block of text from the model
         """
+        gen_state = state or GenerationState()
 
         def get_paragraph(prompt: Optional[str]) -> str:
             # Set model state first
             if prompt:
-                prompt_tokens = nltk.word_tokenize(prompt)
+                prompt_tokens = TokenizeUtil.word_tokenize(prompt)
                 if len(prompt_tokens) >= 2:
-                    self.__first_word = prompt_tokens[-2]
-                    self.__second_word = prompt_tokens[-1]
+                    gen_state.first_word = prompt_tokens[-2]
+                    gen_state.second_word = prompt_tokens[-1]
                 else:
-                    self.__first_word = prompt_tokens[0] if len(prompt_tokens) >= 1 else None
-                    self.__second_word = None
+                    gen_state.first_word = prompt_tokens[0] if len(prompt_tokens) >= 1 else None
+                    gen_state.second_word = None
             else:
-                self.__first_word = None
-                self.__second_word = None
-            n_words = max(1, abs(round(_rng.normal(self.mean_words, self.stdev_words))))
-            tokens = [self.get_next_word() for _ in range(n_words)]
+                gen_state.first_word = None
+                gen_state.second_word = None
+            n_words = max(1, abs(round(gen_state.rng.normal(self.mean_words, self.stdev_words))))
+            tokens = [self.get_next_word(gen_state) for _ in range(n_words)]
             # Finish until the end of a sentence, if punctuation is required
-            while self.__punc_required and tokens[-1] not in (".", "!", "?") and len(tokens) < self.__class__.MAX_TOKENS_PER_BLOCK:
-                tokens.append(self.get_next_word())
-            return self.__markov_table.detokenize(tokens)
+            while self.__punc_required and tokens[-1] not in SENTENCE_END_TOKENS and len(tokens) < self.__class__.MAX_TOKENS_PER_BLOCK:
+                tokens.append(self.get_next_word(gen_state, terminating=self.__steer_endings))
+            return self.__get_model().markov_table.detokenize(tokens)
 
         next_prompt = prompt
         returned_text = ""
-        for _ in range(_gauss_int(self.mean_paragraphs, self.stdev_paragraphs, min_val=1)):
+        for _ in range(_gauss_int(gen_state.rng, self.mean_paragraphs, self.stdev_paragraphs, min_val=1)):
             next_prompt = get_paragraph(next_prompt)
             returned_text += f"{next_prompt}\n\n"
         return self._restore_prompt(prompt, returned_text).rstrip()
+
+    def get_text_blocks(self, n: int, prompts: Optional[Sequence[Optional[str]]] = None, state: Optional[GenerationState] = None) -> list[str]:
+        """Get several random blocks of text from the model.
+
+        With the "compiled" backend, all the blocks' chains are advanced together, sampling the next token of every live chain with
+        one vectorized lookup per step. This doesn't change the model's own chain state used by `get_next_word`.
+
+        Parameters
+        ----------
+        n : int
+            number of text blocks to generate
+        prompts : Optional[Sequence[Optional[str]]]
+            prompt to start each text block with, or none if starting all of them from empty state
+        state : Optional[GenerationState]
+            generation state whose random generator is used, or none to use a new one for this call
+
+        Returns
+        -------
+        list[str]
+            random blocks of text from the model
+
+        Raises
+        ------
+        ValueError
+            raised if the number of prompts isn't `n`
+        """
+        model = self.__get_model()
+        if not model.transition_table:
+            return super().get_text_blocks(n, prompts, state=state)
+        table = model.transition_table
+        if prompts is None:
+            prompts = [None] * n
+        if len(prompts) != n:
+            raise ValueError(f"Expected {n} prompts, got {len(prompts)}")
+
+        # Set the initial state of each chain from its prompt, with -1 for no token
+        first_ids = np.full(n, -1, dtype=np.int64)
+        second_ids = np.full(n, -1, dtype=np.int64)
+        for i, prompt in enumerate(prompts):
+            prompt_tokens = TokenizeUtil.word_tokenize(prompt) if prompt else []
+            if len(prompt_tokens) >= 2:
+                first_ids[i] = table.token_ids.get(prompt_tokens[-2], -1)
+                second_ids[i] = table.token_ids.get(prompt_tokens[-1], -1)
+            elif len(prompt_tokens) == 1:
+                first_ids[i] = table.token_ids.get(prompt_tokens[0], -1)
+
+        rng = (state or GenerationState()).rng
+        n_paragraphs = np.maximum(1, np.round(rng.normal(self.mean_paragraphs, self.stdev_paragraphs, n))).astype(np.int64)
+        paragraphs: list[list[str]] = [[] for _ in range(n)]
+        for paragraph_idx in range(int(n_paragraphs.max(initial=0))):
+            chains = np.flatnonzero(n_paragraphs > paragraph_idx)
+            for chain, token_ids in zip(chains, self.__generate_paragraphs(table, first_ids[chains], second_ids[chains], rng)):
+                paragraphs[chain].append(model.markov_table.detokenize([table.vocab[token_id] for token_id in token_ids]))
+                # Continue the next paragraph from the end of this one
+                first_ids[chain], second_ids[chain] = (token_ids[-2], token_ids[-1]) if len(token_ids) >= 2 else (token_ids[-1], -1)
+        return [
+            self._restore_prompt(prompt, "".join(f"{paragraph}\n\n" for paragraph in chain_paragraphs)).rstrip()
+            for prompt, chain_paragraphs in zip(prompts, paragraphs)
+        ]
+
+    def __generate_paragraphs(self, table: MarkovTransitionTable, first_ids: np.ndarray, second_ids: np.ndarray, rng: np.random.Generator) -> list[np.ndarray]:
+        """Generate a paragraph of token ids for each chain starting from the given states, advancing all chains together."""
+        n = len(second_ids)
+        n_words = np.maximum(1, np.abs(np.round(rng.normal(self.mean_words, self.stdev_words, n)))).astype(np.int64)
+        max_tokens = self.__class__.MAX_TOKENS_PER_BLOCK
+        first_ids, second_ids = first_ids.copy(), second_ids.copy()
+        lengths = np.zeros(n, dtype=np.int64)
+        live = np.arange(n)
+        # Token ids generated at each step, with -1 for chains that already finished
+        steps: list[np.ndarray] = []
+        while len(live) > 0:
+            terminating = (lengths[live] >= n_words[live]) & self.__punc_required & self.__steer_endings
+            next_ids = table.get_next_ids(first_ids[live], second_ids[live], rng=rng, terminating=terminating)
+            step = np.full(n, -1, dtype=np.int64)
+            step[live] = next_ids
+            steps.append(step)
+            lengths[live] += 1
+            first_ids[live], second_ids[live] = second_ids[live], next_ids
+            # Finish until the end of a sentence, if punctuation is required
+            done = lengths[live] >= n_words[live]
+            if self.__punc_required:
+                done &= np.isin(next_ids, table.end_ids) | (lengths[live] >= max_tokens)
+            live = live[~done]
+        token_matrix = np.stack(steps, axis=1)
+        return [row[:length] for row, length in zip(token_matrix, lengths)]
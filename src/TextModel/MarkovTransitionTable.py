@@ -0,0 +1,691 @@
+from contextlib import closing
+from functools import cached_property
+import numpy as np
+from pathlib import Path
+import shutil
+from sqlalchemy.engine import Engine
+from typing import ClassVar, Optional, Sequence, Union
+import uuid
+
+from .MarkovTriads import MAX_END_STEPS, SENTENCE_END_TOKENS, MarkovEndSteps, MarkovTriads
+
+_rng = np.random.default_rng()
+
+TERMINATION_ARRAY_NAMES: tuple[str, ...] = (
+    "end_steps",
+    "term_alias_probs",
+    "term_alias_idx",
+    "uni_end_steps",
+    "uni_term_alias_probs",
+    "uni_term_alias_idx",
+)
+"""Names of the arrays used for sentence termination, which can be rebuilt from the other arrays."""
+
+
+class MarkovTransitionTable:
+    """In-memory, integer-indexed version of a `MarkovTriads` table for fast token generation.
+
+    Tokens are mapped to integer ids, and each state (a pair of token ids) is stored in compressed sparse row (CSR) form:
+    the next token ids and weights for state `i` are at `next_ids[offsets[i]:offsets[i + 1]]` and `weights[offsets[i]:offsets[i + 1]]`.
+    States are sorted by `first_id * vocab_size + second_id` so they can be looked up with a binary search. The same layout is used
+    for the 1-gram backoff (keyed by a single token id) and for the sentence start distribution.
+
+    Each CSR layout also has Walker/Vose alias tables built once at load, so sampling the next token is O(1) no matter the state's fanout.
+
+    For bounded sentence endings, each 2-gram and 1-gram state also stores the expected number of steps until a sentence ending token
+    is generated from it, and a second set of "termination" alias tables whose weights are scaled by `1 / (1 + expected steps)` of the
+    state each token leads to. Sampling with `terminating=True` uses these, which favors tokens that end the sentence sooner while
+    keeping the relative order of tokens that are equally close to an ending.
+    """
+
+    ARRAY_NAMES: ClassVar[tuple[str, ...]] = (
+        "state_keys",
+        "offsets",
+        "next_ids",
+        "weights",
+        "alias_probs",
+        "alias_idx",
+        "uni_keys",
+        "uni_offsets",
+        "uni_next_ids",
+        "uni_weights",
+        "uni_alias_probs",
+        "uni_alias_idx",
+        "start_offsets",
+        "start_ids",
+        "start_weights",
+        "start_alias_probs",
+        "start_alias_idx",
+    ) + TERMINATION_ARRAY_NAMES
+    """Names of the arrays that make up a compiled table, which are saved as `{name}.npy` files by `save`."""
+
+    MAX_END_ITERATIONS: ClassVar[int] = MAX_END_STEPS
+    """Max iterations when computing expected steps to a sentence end; states that loop without ending saturate around this value."""
+
+    def __init__(self, vocab: list[str], arrays: dict[str, np.ndarray]):
+        """Create a `MarkovTransitionTable` from already compiled arrays. Usually created with `MarkovTransitionTable.from_engine`,
+        `MarkovTransitionTable.from_triads` or `MarkovTransitionTable.load`.
+
+        Parameters
+        ----------
+        vocab : list[str]
+            list of tokens, where the index of each token is its id
+        arrays : dict[str, np.ndarray]
+            compiled arrays, with a key for each of `ARRAY_NAMES`
+        """
+        self.vocab = vocab
+        self.vocab_size = max(1, len(vocab))
+        self.state_keys = arrays["state_keys"]
+        self.offsets = arrays["offsets"]
+        self.next_ids = arrays["next_ids"]
+        self.weights = arrays["weights"]
+        self.alias_probs = arrays["alias_probs"]
+        self.alias_idx = arrays["alias_idx"]
+        self.uni_keys = arrays["uni_keys"]
+        self.uni_offsets = arrays["uni_offsets"]
+        self.uni_next_ids = arrays["uni_next_ids"]
+        self.uni_weights = arrays["uni_weights"]
+        self.uni_alias_probs = arrays["uni_alias_probs"]
+        self.uni_alias_idx = arrays["uni_alias_idx"]
+        self.start_offsets = arrays["start_offsets"]
+        self.start_ids = arrays["start_ids"]
+        self.start_weights = arrays["start_weights"]
+        self.start_alias_probs = arrays["start_alias_probs"]
+        self.start_alias_idx = arrays["start_alias_idx"]
+        self.end_steps = arrays["end_steps"]
+        self.term_alias_probs = arrays["term_alias_probs"]
+        self.term_alias_idx = arrays["term_alias_idx"]
+        self.uni_end_steps = arrays["uni_end_steps"]
+        self.uni_term_alias_probs = arrays["uni_term_alias_probs"]
+        self.uni_term_alias_idx = arrays["uni_term_alias_idx"]
+
+    @cached_property
+    def token_ids(self) -> dict[str, int]:
+        """Map of tokens to their ids, built on first use."""
+        return {token: i for i, token in enumerate(self.vocab)}
+
+    @cached_property
+    def end_ids(self) -> np.ndarray:
+        """Ids of the sentence ending tokens in the vocabulary."""
+        return np.array([self.token_ids[token] for token in SENTENCE_END_TOKENS if token in self.token_ids], dtype=np.int64)
+
+    @classmethod
+    def from_triads(
+        cls, vocab: list[str], first_ids: np.ndarray, second_ids: np.ndarray, third_ids: np.ndarray, occurrences: np.ndarray
+    ) -> "MarkovTransitionTable":
+        """Compile triads of token ids into a `MarkovTransitionTable`.
+
+        Parameters
+        ----------
+        vocab : list[str]
+            list of tokens, where the index of each token is its id
+        first_ids : np.ndarray
+            ids of the first token of each triad
+        second_ids : np.ndarray
+            ids of the second token of each triad
+        third_ids : np.ndarray
+            ids of the third token of each triad
+        occurrences : np.ndarray
+            number of occurrences of each triad
+
+        Returns
+        -------
+        MarkovTransitionTable
+            compiled transition table
+        """
+        vocab_size = max(1, len(vocab))
+        first_ids = np.asarray(first_ids, dtype=np.int64)
+        second_ids = np.asarray(second_ids, dtype=np.int64)
+        third_ids = np.asarray(third_ids, dtype=np.int64)
+        occurrences = np.asarray(occurrences, dtype=np.float64)
+        arrays: dict[str, np.ndarray] = {}
+
+        # 2-gram states: (first, second) -> third
+        arrays["state_keys"], arrays["offsets"], arrays["next_ids"], arrays["weights"] = _build_csr(first_ids * vocab_size + second_ids, third_ids, occurrences)
+        # 1-gram backoff states: second -> third, summing over all first tokens
+        arrays["uni_keys"], arrays["uni_offsets"], arrays["uni_next_ids"], arrays["uni_weights"] = _build_csr(second_ids, third_ids, occurrences)
+        # Sentence starts: tokens that come after sentence ending punctuation
+        end_ids = [i for i, token in enumerate(vocab) if token in SENTENCE_END_TOKENS]
+        is_start = np.isin(second_ids, end_ids)
+        if not np.any(is_start):
+            # Fall back to any token if the model has no sentence endings
+            is_start = np.ones(len(second_ids), dtype=bool)
+        _, _, arrays["start_ids"], arrays["start_weights"] = _build_csr(
+            np.zeros(np.count_nonzero(is_start), dtype=np.int64), third_ids[is_start], occurrences[is_start]
+        )
+        arrays["start_offsets"] = np.array([0, len(arrays["start_ids"])], dtype=np.int64)
+
+        # Alias tables for O(1) weighted sampling in each state
+        arrays["alias_probs"], arrays["alias_idx"] = _build_alias(arrays["offsets"], arrays["weights"])
+        arrays["uni_alias_probs"], arrays["uni_alias_idx"] = _build_alias(arrays["uni_offsets"], arrays["uni_weights"])
+        arrays["start_alias_probs"], arrays["start_alias_idx"] = _build_alias(arrays["start_offsets"], arrays["start_weights"])
+        arrays.update(_build_termination(vocab, arrays, cls.MAX_END_ITERATIONS))
+        return cls(vocab, arrays)
+
+    def save(self, directory: Union[str, Path]) -> None:
+        """Save the table in a directory as a vocabulary file (`vocab.txt`, one token per line) and a `.npy` file per array.
+
+        The directory is written next to its destination first and then moved into place, so readers never see a partial table.
+
+        Parameters
+        ----------
+        directory : Union[str, Path]
+            directory to save the table in, replacing it if it already exists
+        """
+        directory = Path(directory)
+        tmp_dir = directory.with_name(f".{directory.name}.{uuid.uuid4()}.tmp")
+        tmp_dir.mkdir(parents=True)
+        try:
+            (tmp_dir / "vocab.txt").write_text("\n".join(self.vocab), encoding="utf-8")
+            for name in self.__class__.ARRAY_NAMES:
+                np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+            if directory.exists():
+                old_dir = directory.with_name(f".{directory.name}.{uuid.uuid4()}.old")
+                directory.rename(old_dir)
+                tmp_dir.rename(directory)
+                shutil.rmtree(old_dir)
+            else:
+                tmp_dir.rename(directory)
+        finally:
+            if tmp_dir.exists():
+                shutil.rmtree(tmp_dir)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap: bool = True) -> "MarkovTransitionTable":
+        """Load a table saved with `save`.
+
+        Parameters
+        ----------
+        directory : Union[str, Path]
+            directory the table was saved in
+        mmap : bool, optional
+            whether to memory-map the arrays read-only instead of reading them into memory, by default True; memory-mapped arrays
+            share the OS page cache between processes, and loading takes the same time regardless of model size
+
+        Returns
+        -------
+        MarkovTransitionTable
+            loaded transition table
+        """
+        directory = Path(directory)
+        vocab_text = (directory / "vocab.txt").read_text(encoding="utf-8")
+        vocab = vocab_text.split("\n") if vocab_text else []
+        arrays = {
+            name: np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in cls.ARRAY_NAMES
+            if name not in TERMINATION_ARRAY_NAMES or (directory / f"{name}.npy").exists()
+        }
+        if any(name not in arrays for name in TERMINATION_ARRAY_NAMES):
+            # Exported before termination tables existed, so build them now
+            arrays.update(_build_termination(vocab, arrays, cls.MAX_END_ITERATIONS))
+        return cls(vocab, arrays)
+
+    @classmethod
+    def from_engine(cls, engine: Engine, markov_table: Optional[MarkovTriads] = None) -> "MarkovTransitionTable":
+        """Read a whole `MarkovTriads` table once and compile it into a `MarkovTransitionTable`.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine with the Markov triads table
+        markov_table : Optional[MarkovTriads], optional
+            table definition to read from, by default one matching the database's schema version
+
+        Returns
+        -------
+        MarkovTransitionTable
+            compiled transition table
+        """
+        return cls.from_engines([engine], [markov_table or MarkovTriads.for_engine(engine)])
+
+    @classmethod
+    def from_engines(cls, engines: Sequence[Engine], markov_tables: Optional[Sequence[MarkovTriads]] = None) -> "MarkovTransitionTable":
+        """Read several `MarkovTriads` tables, like a base model and its delta shards, and compile their summed counts into one
+        `MarkovTransitionTable`.
+
+        Parameters
+        ----------
+        engines : Sequence[Engine]
+            SQLAlchemy engines with the Markov triads tables
+        markov_tables : Optional[Sequence[MarkovTriads]], optional
+            table definition to read from for each engine, by default ones matching the databases' schema versions
+
+        Returns
+        -------
+        MarkovTransitionTable
+            compiled transition table
+        """
+        markov_tables = markov_tables or [MarkovTriads.for_engine(engine) for engine in engines]
+        parts = [_read_triads(engine, markov_table) for engine, markov_table in zip(engines, markov_tables)]
+        parts = [part for part in parts if len(part[1]) > 0]
+        if len(parts) == 0:
+            return cls.from_triads([], *(np.zeros(0, dtype=np.int64) for _ in range(4)))
+        if len(parts) == 1:
+            vocab, triads = parts[0]
+            return cls.from_triads(vocab.tolist(), triads[:, 0], triads[:, 1], triads[:, 2], triads[:, 3])
+        # Map each table's token ids into the merged vocabulary; duplicate triads are summed when building the CSR arrays
+        vocab = np.unique(np.concatenate([part[0] for part in parts]))
+        triads = np.concatenate(
+            [np.column_stack((np.searchsorted(vocab, part_vocab)[part_triads[:, :3]], part_triads[:, 3])) for part_vocab, part_triads in parts]
+        )
+        return cls.from_triads(vocab.tolist(), triads[:, 0], triads[:, 1], triads[:, 2], triads[:, 3])
+
+    def _find(self, keys: np.ndarray, key: int) -> int:
+        """Find the index of the key in the sorted keys array, or -1 if it doesn't exist."""
+        idx = int(np.searchsorted(keys, key))
+        return idx if idx < len(keys) and keys[idx] == key else -1
+
+    def _choose(self, next_ids: np.ndarray, alias_probs: np.ndarray, alias_idx: np.ndarray, lo: int, hi: int, rng: np.random.Generator) -> str:
+        """Choose a token id between `lo` and `hi` of the CSR arrays using its alias table, and return its token."""
+        u = rng.random() * (hi - lo)
+        idx = lo + int(u)
+        if u - int(u) >= alias_probs[idx]:
+            idx = alias_idx[idx]
+        return self.vocab[next_ids[idx]]
+
+    def get_first_token(self, rng: Optional[np.random.Generator] = None) -> str:
+        """Return the first token for a generated sentence.
+
+        Parameters
+        ----------
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the module generator
+
+        Returns
+        -------
+        str
+            first generated token
+        """
+        if len(self.start_ids) == 0:
+            raise ValueError("Cannot generate tokens from an empty Markov model")
+        return self._choose(self.start_ids, self.start_alias_probs, self.start_alias_idx, 0, len(self.start_ids), rng or _rng)
+
+    def _find_state(self, first_token: str, second_token: Optional[str] = None) -> tuple[bool, int]:
+        """Find the state of the tokens, returning whether it's a 2-gram state and its index, or -1 if it doesn't exist."""
+        first_id = self.token_ids.get(first_token, -1)
+        if not second_token:
+            return False, self._find(self.uni_keys, first_id) if first_id >= 0 else -1
+        second_id = self.token_ids.get(second_token, -1)
+        return True, self._find(self.state_keys, first_id * self.vocab_size + second_id) if first_id >= 0 and second_id >= 0 else -1
+
+    def get_next_token(self, first_token: str, second_token: Optional[str] = None, rng: Optional[np.random.Generator] = None, terminating: bool = False) -> str:
+        """Return the next token for a generated sentence, with the same backoff behavior as `MarkovTriads.get_next_token`.
+
+        Parameters
+        ----------
+        first_token : str
+            first token to check in model
+        second_token : Optional[str], optional
+            second token to check in model, by default None
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the module generator
+        terminating : bool, optional
+            whether to sample with the termination tables, favoring tokens that end the sentence sooner; by default False
+
+        Returns
+        -------
+        str
+            next generated token
+        """
+        rng = rng or _rng
+        # Treat as 1-gram Markov model if only first_token provided, otherwise 2-gram
+        is_bigram, state = self._find_state(first_token, second_token)
+        if state < 0:
+            if second_token:
+                return self.get_next_token(second_token, rng=rng, terminating=terminating)
+            return self.get_first_token(rng)
+        if is_bigram:
+            alias_probs, alias_idx = (self.term_alias_probs, self.term_alias_idx) if terminating else (self.alias_probs, self.alias_idx)
+            return self._choose(self.next_ids, alias_probs, alias_idx, self.offsets[state], self.offsets[state + 1], rng)
+        alias_probs, alias_idx = (self.uni_term_alias_probs, self.uni_term_alias_idx) if terminating else (self.uni_alias_probs, self.uni_alias_idx)
+        return self._choose(self.uni_next_ids, alias_probs, alias_idx, self.uni_offsets[state], self.uni_offsets[state + 1], rng)
+
+    def _find_many(self, keys: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Find the indices of the queries in the sorted keys array, with -1 for queries that don't exist."""
+        if len(keys) == 0:
+            return np.full(len(queries), -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        return np.where((queries >= 0) & (keys[idx] == queries), idx, -1)
+
+    def _choose_many(
+        self,
+        next_ids: np.ndarray,
+        alias_tables: tuple[np.ndarray, np.ndarray],
+        term_alias_tables: Optional[tuple[np.ndarray, np.ndarray]],
+        lo: np.ndarray,
+        hi: np.ndarray,
+        terminating: np.ndarray,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """Choose a token id between each `lo` and `hi` of the CSR arrays at once, using the termination alias tables where `terminating`."""
+        u = rng.random(len(lo)) * (hi - lo)
+        slots = lo + u.astype(np.int64)
+        probs, aliases = alias_tables[0][slots], alias_tables[1][slots]
+        if term_alias_tables:
+            probs = np.where(terminating, term_alias_tables[0][slots], probs)
+            aliases = np.where(terminating, term_alias_tables[1][slots], aliases)
+        return next_ids[np.where(u - np.floor(u) < probs, slots, aliases)]
+
+    def get_next_ids(
+        self, first_ids: np.ndarray, second_ids: np.ndarray, rng: Optional[np.random.Generator] = None, terminating: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Return the next token ids for many chains at once, with the same backoff behavior as `get_next_token`.
+
+        Parameters
+        ----------
+        first_ids : np.ndarray
+            ids of the first token of each chain's state, or -1 for none or unknown tokens
+        second_ids : np.ndarray
+            ids of the second token of each chain's state, or -1 for none or unknown tokens; chains without a second token start a
+            new sentence
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the module generator
+        terminating : Optional[np.ndarray], optional
+            boolean mask of the chains to sample with the termination tables, by default none of them
+
+        Returns
+        -------
+        np.ndarray
+            next token id of each chain
+        """
+        rng = rng or _rng
+        first_ids, second_ids = np.asarray(first_ids, dtype=np.int64), np.asarray(second_ids, dtype=np.int64)
+        terminating = np.zeros(len(second_ids), dtype=bool) if terminating is None else np.asarray(terminating, dtype=bool)
+        result = np.empty(len(second_ids), dtype=np.int64)
+        # 2-gram states, backing off to 1-gram states of the second token, and then to sentence starts
+        states = self._find_many(self.state_keys, np.where((first_ids >= 0) & (second_ids >= 0), first_ids * self.vocab_size + second_ids, -1))
+        is_bigram = states >= 0
+        uni_states = np.where(is_bigram, -1, self._find_many(self.uni_keys, second_ids))
+        is_unigram = uni_states >= 0
+        is_start = ~is_bigram & ~is_unigram
+        if np.any(is_bigram):
+            states = states[is_bigram]
+            result[is_bigram] = self._choose_many(
+                self.next_ids,
+                (self.alias_probs, self.alias_idx),
+                (self.term_alias_probs, self.term_alias_idx),
+                self.offsets[states],
+                self.offsets[states + 1],
+                terminating[is_bigram],
+                rng,
+            )
+        if np.any(is_unigram):
+            uni_states = uni_states[is_unigram]
+            result[is_unigram] = self._choose_many(
+                self.uni_next_ids,
+                (self.uni_alias_probs, self.uni_alias_idx),
+                (self.uni_term_alias_probs, self.uni_term_alias_idx),
+                self.uni_offsets[uni_states],
+                self.uni_offsets[uni_states + 1],
+                terminating[is_unigram],
+                rng,
+            )
+        if np.any(is_start):
+            if len(self.start_ids) == 0:
+                raise ValueError("Cannot generate tokens from an empty Markov model")
+            n_starts = np.count_nonzero(is_start)
+            result[is_start] = self._choose_many(
+                self.start_ids,
+                (self.start_alias_probs, self.start_alias_idx),
+                None,
+                np.zeros(n_starts, dtype=np.int64),
+                np.full(n_starts, len(self.start_ids), dtype=np.int64),
+                terminating[is_start],
+                rng,
+            )
+        return result
+
+    def get_end_steps(self, first_token: str, second_token: Optional[str] = None) -> float:
+        """Return the expected number of tokens generated from the state until a sentence ending token, including that token.
+
+        Parameters
+        ----------
+        first_token : str
+            first token of the state
+        second_token : Optional[str], optional
+            second token of the state, by default None
+
+        Returns
+        -------
+        float
+            expected number of steps, after the same backoff as `get_next_token`; inf if no state of the tokens exists
+        """
+        is_bigram, state = self._find_state(first_token, second_token)
+        if state < 0:
+            return self.get_end_steps(second_token) if second_token else float("inf")
+        return float((self.end_steps if is_bigram else self.uni_end_steps)[state])
+
+    def save_end_steps(self, engine: Engine) -> None:
+        """Save the expected steps to a sentence end of every state into `MarkovEndSteps` tables of the engine's database, so the "sql"
+        and "sqlite" backends steer sentence endings with the same weights as this table's termination tables.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the (writable) Markov model database this table was compiled from
+        """
+        vocab = self.vocab
+        firsts, seconds = np.divmod(self.state_keys, self.vocab_size)
+        MarkovEndSteps().replace(
+            engine,
+            ((vocab[first], vocab[second], float(steps)) for first, second, steps in zip(firsts, seconds, self.end_steps)),
+            ((vocab[token], float(steps)) for token, steps in zip(self.uni_keys, self.uni_end_steps)),
+        )
+
+
+def _read_triads(engine: Engine, markov_table: MarkovTriads) -> tuple[np.ndarray, np.ndarray]:
+    """Read a triads table, returning its sorted vocabulary and an array of (first id, second id, third id, occurrences) rows.
+
+    Rows are read through the raw `sqlite3` connection, whose plain tuples NumPy converts far faster than SQLAlchemy rows.
+    """
+    with closing(engine.raw_connection()) as conn, closing(conn.cursor()) as cursor:
+        rows = cursor.execute(f"SELECT first_token, second_token, third_token, occurrences FROM {markov_table.table_name}").fetchall()
+        vocab_rows: list[tuple[int, str]] = []
+        if len(rows) > 0 and markov_table.schema_version >= 2:
+            vocab_rows = cursor.execute(f"SELECT id, token FROM {markov_table.vocab_table.table_name} ORDER BY token").fetchall()
+    if len(rows) == 0:
+        return np.zeros(0, dtype=object), np.zeros((0, 4), dtype=np.int64)
+    if markov_table.schema_version >= 2:
+        # Token ids are already integers; just make them contiguous
+        vocab_ids = np.array([row[0] for row in vocab_rows], dtype=np.int64)
+        triads = np.array(rows, dtype=np.int64)
+        # Position of each id in the token ordered vocabulary
+        id_order = np.argsort(vocab_ids)
+        for i in range(3):
+            triads[:, i] = id_order[np.searchsorted(vocab_ids, triads[:, i], sorter=id_order)]
+        return np.array([row[1] for row in vocab_rows], dtype=object), triads
+    firsts, seconds, thirds, occurrences = zip(*rows)
+    vocab, inverse = np.unique(np.array(firsts + seconds + thirds, dtype=object), return_inverse=True)
+    return vocab, np.column_stack((inverse.reshape(3, len(rows)).T, np.array(occurrences, dtype=np.int64)))
+
+
+def _build_termination(vocab: list[str], arrays: dict[str, np.ndarray], max_iterations: int) -> dict[str, np.ndarray]:
+    """Build the expected steps to a sentence end of every state and the reweighted termination alias tables.
+
+    The expected steps `E` of a state are `1 + sum(p(t) * E(next state of t))` over its next tokens `t`, where the next state of a
+    sentence ending token counts as 0 and a missing next state backs off like sampling does (2-gram to 1-gram). This is solved by
+    value iteration over all states at once, stopping when it converges or after `max_iterations`.
+
+    Parameters
+    ----------
+    vocab : list[str]
+        list of tokens, where the index of each token is its id
+    arrays : dict[str, np.ndarray]
+        compiled CSR arrays of the table
+    max_iterations : int
+        max value iterations; also the value of states that can't reach a sentence end
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        arrays with a key for each of `TERMINATION_ARRAY_NAMES`
+    """
+    vocab_size = max(1, len(vocab))
+    end_ids = np.array([i for i, token in enumerate(vocab) if token in SENTENCE_END_TOKENS], dtype=np.int64)
+    cap = float(max_iterations)
+
+    def successors(keys: np.ndarray, next_keys: np.ndarray) -> np.ndarray:
+        if len(keys) == 0:
+            return np.full(len(next_keys), -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(keys, next_keys), len(keys) - 1)
+        return np.where(keys[idx] == next_keys, idx, -1)
+
+    def segment_sums(offsets: np.ndarray, values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, offsets[:-1]) if len(values) > 0 else np.zeros(len(offsets) - 1)
+
+    uni_keys, uni_offsets, uni_next_ids = arrays["uni_keys"], arrays["uni_offsets"], arrays["uni_next_ids"]
+    state_keys, offsets, next_ids = arrays["state_keys"], arrays["offsets"], arrays["next_ids"]
+    uni_probs = arrays["uni_weights"] / np.repeat(segment_sums(uni_offsets, arrays["uni_weights"]), np.diff(uni_offsets))
+    probs = arrays["weights"] / np.repeat(segment_sums(offsets, arrays["weights"]), np.diff(offsets))
+    # Next state of each entry: 1-gram state of the next token, and 2-gram state of (second token of the state, next token)
+    uni_is_end = np.isin(uni_next_ids, end_ids)
+    is_end = np.isin(next_ids, end_ids)
+    uni_succ = successors(uni_keys, uni_next_ids)
+    backoff_succ = successors(uni_keys, next_ids)
+    succ = successors(state_keys, np.repeat(state_keys % vocab_size, np.diff(offsets)) * vocab_size + next_ids)
+
+    def next_uni_steps(uni_end_steps: np.ndarray) -> np.ndarray:
+        return np.where(uni_is_end, 0.0, np.where(uni_succ >= 0, uni_end_steps[uni_succ], cap))
+
+    def next_steps(end_steps: np.ndarray, uni_end_steps: np.ndarray) -> np.ndarray:
+        backoff = np.where(backoff_succ >= 0, uni_end_steps[backoff_succ], cap)
+        return np.where(is_end, 0.0, np.where(succ >= 0, end_steps[succ], backoff))
+
+    uni_end_steps = np.ones(len(uni_keys))
+    for _ in range(max_iterations):
+        updated = np.minimum(cap, 1.0 + segment_sums(uni_offsets, uni_probs * next_uni_steps(uni_end_steps)))
+        converged = np.allclose(updated, uni_end_steps, rtol=1e-4, atol=1e-3)
+        uni_end_steps = updated
+        if converged:
+            break
+    end_steps = np.ones(len(state_keys))
+    for _ in range(max_iterations):
+        updated = np.minimum(cap, 1.0 + segment_sums(offsets, probs * next_steps(end_steps, uni_end_steps)))
+        converged = np.allclose(updated, end_steps, rtol=1e-4, atol=1e-3)
+        end_steps = updated
+        if converged:
+            break
+
+    termination: dict[str, np.ndarray] = {"end_steps": end_steps, "uni_end_steps": uni_end_steps}
+    termination["term_alias_probs"], termination["term_alias_idx"] = _build_alias(offsets, arrays["weights"] / (1.0 + next_steps(end_steps, uni_end_steps)))
+    termination["uni_term_alias_probs"], termination["uni_term_alias_idx"] = _build_alias(
+        uni_offsets, arrays["uni_weights"] / (1.0 + next_uni_steps(uni_end_steps))
+    )
+    return termination
+
+
+def _build_csr(keys: np.ndarray, next_ids: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Group (key, next_id, weight) entries by key into CSR arrays, summing the weights of duplicate (key, next_id) pairs.
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        state keys of each entry
+    next_ids : np.ndarray
+        next token id of each entry
+    weights : np.ndarray
+        weight of each entry
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        sorted unique keys, offsets into the next token and weight arrays (one longer than the keys), next token ids, and weights
+    """
+    order = np.lexsort((next_ids, keys))
+    keys, next_ids, weights = keys[order], next_ids[order], weights[order]
+    # Merge duplicate (key, next_id) pairs
+    is_new = np.ones(len(keys), dtype=bool)
+    is_new[1:] = (keys[1:] != keys[:-1]) | (next_ids[1:] != next_ids[:-1])
+    group_starts = np.flatnonzero(is_new)
+    weights = np.add.reduceat(weights, group_starts) if len(group_starts) > 0 else weights
+    keys, next_ids = keys[group_starts], next_ids[group_starts]
+    unique_keys, key_starts = np.unique(keys, return_index=True)
+    offsets = np.append(key_starts, len(keys)).astype(np.int64)
+    return unique_keys, offsets, next_ids, weights
+
+
+def _build_alias(offsets: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Build Walker/Vose alias tables for every CSR segment of weights at once.
+
+    To sample from segment `[lo, hi)`, pick a uniform slot `i` in the segment and a uniform `u` in [0, 1); the sample is `i` if
+    `u < probs[i]`, otherwise `alias[i]`.
+
+    The tables are the ones Vose's method builds when it sweeps each segment's entries in order: every small entry (scaled weight
+    below 1) is aliased to the current large entry, and a large entry whose surplus runs out becomes small and is aliased to the next
+    large entry. With `D` the running sum of the smalls' deficits and `S` the running sum of the larges' surpluses, the small entry
+    `i` is aliased to the first large entry `j` with `S[j] >= D[i - 1]`, and the large entry `j` runs out at the first small entry
+    `i` with `D[i] > S[j]`, leaving it `1 + S[j] - D[i]`. Both are found for all segments at once with sorts instead of a loop.
+
+    Parameters
+    ----------
+    offsets : np.ndarray
+        CSR offsets of each segment
+    weights : np.ndarray
+        weights of each entry
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        acceptance probability of each slot, and the absolute index of the alias of each slot
+    """
+    probs = np.ones(len(weights), dtype=np.float64)
+    alias = np.arange(len(weights), dtype=np.int64)
+    if len(weights) == 0:
+        return probs, alias
+    sizes = np.diff(offsets)
+    segments = np.arange(len(sizes) + 1)
+    seg = np.repeat(segments[:-1], sizes)
+    scaled = weights * (sizes / np.add.reduceat(weights, offsets[:-1]))[seg]
+    is_small = scaled < 1.0
+    small_idx, large_idx = np.flatnonzero(is_small), np.flatnonzero(~is_small)
+    small_seg, large_seg = seg[small_idx], seg[large_idx]
+    # Where each segment's smalls and larges start, and the running sums of their deficits and surpluses within each segment
+    small_starts, large_starts = np.searchsorted(small_seg, segments), np.searchsorted(large_seg, segments)
+    deficits = 1.0 - scaled[small_idx]
+    deficit_sums = _segment_cumsum(deficits, small_seg, small_starts)
+    deficits_before = _segment_cumsum(deficits, small_seg, small_starts, inclusive=False)
+    surplus_sums = _segment_cumsum(scaled[large_idx] - 1.0, large_seg, large_starts)
+
+    # Smalls alias to the first large whose running surplus reaches the deficits before them; in segments without larges (which only
+    # happens through rounding), every entry is close enough to 1 to always accept
+    n_larges = np.diff(large_starts)[small_seg]
+    nth_large = _count_below(small_seg, deficits_before, large_seg, surplus_sums, inclusive=False)
+    has_large = n_larges > 0
+    aliased = small_idx[has_large]
+    probs[aliased] = scaled[aliased]
+    alias[aliased] = large_idx[large_starts[small_seg[has_large]] + np.minimum(nth_large, n_larges - 1)[has_large]]
+
+    # Larges run out at the first small whose running deficit passes their running surplus, and then alias to the next large; the
+    # last large of a segment never runs out, up to rounding
+    nth_small = _count_below(large_seg, surplus_sums, small_seg, deficit_sums, inclusive=True)
+    runs_out = (nth_small < np.diff(small_starts)[large_seg]) & (np.arange(len(large_idx)) + 1 < large_starts[large_seg + 1])
+    out = np.flatnonzero(runs_out)
+    probs[large_idx[out]] = 1.0 + surplus_sums[out] - deficit_sums[small_starts[large_seg[out]] + nth_small[out]]
+    alias[large_idx[out]] = large_idx[out + 1]
+    np.clip(probs, 0.0, 1.0, out=probs)
+    return probs, alias
+
+
+def _segment_cumsum(values: np.ndarray, seg: np.ndarray, seg_starts: np.ndarray, inclusive: bool = True) -> np.ndarray:
+    """Get the running sums of values within each segment (including each value itself if `inclusive`), where `seg` is the sorted
+    segment of each value and `seg_starts` the index of each segment's first value.
+
+    Both variants subtract the same prefix sums, so each exclusive sum is exactly equal to the previous inclusive sum of its segment."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    return sums[1:] - sums[seg_starts[seg]] if inclusive else sums[:-1] - sums[seg_starts[seg]]
+
+
+def _count_below(query_seg: np.ndarray, queries: np.ndarray, ref_seg: np.ndarray, refs: np.ndarray, inclusive: bool) -> np.ndarray:
+    """Count the references in the same segment as each query that are below it (or equal to it if `inclusive`), where the
+    references are sorted by segment."""
+    segs = np.concatenate((ref_seg, query_seg))
+    values = np.concatenate((refs, queries))
+    is_query = np.concatenate((np.zeros(len(refs), dtype=bool), np.ones(len(queries), dtype=bool)))
+    # At equal values, references sort before queries if they count, and after them otherwise
+    order = np.lexsort((is_query if inclusive else ~is_query, values, segs))
+    refs_before = np.cumsum(~is_query[order])
+    counts = np.empty(len(queries), dtype=np.int64)
+    query_positions = np.flatnonzero(is_query[order])
+    counts[order[query_positions] - len(refs)] = refs_before[query_positions]
+    # Only count the references of the query's own segment
+    return counts - np.searchsorted(ref_seg, query_seg)
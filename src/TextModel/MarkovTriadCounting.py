@@ -0,0 +1,157 @@
+"""Streaming and parallel counting of the Markov triads of training text, used by `MarkovTriads.upsert_triads_from_files`.
+
+Text files are read in chunks split at whitespace, and each chunk's tokens are turned into triads as if the whole file were one list
+of tokens, carrying the last two tokens over to the next chunk. With an executor, chunks are tokenized and counted in other processes,
+and the triads spanning chunk boundaries are stitched back together in order.
+"""
+
+from collections import Counter, deque
+from concurrent.futures import Executor, Future
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+from src.Util import TokenizeUtil
+
+
+def iter_text_chunks(filepath: Union[str, Path], chunk_chars: int = 1 << 20) -> Iterator[str]:
+    """Read a text file in chunks of about `chunk_chars` characters, split at whitespace (preferring line breaks) so no token is cut.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        path of the text file to read
+    chunk_chars : int, optional
+        approximate number of characters per chunk, by default 1 Mi
+
+    Yields
+    ------
+    Iterator[str]
+        chunks of the file
+    """
+    remainder = ""
+    with open(filepath) as f:
+        while block := f.read(chunk_chars):
+            text = remainder + block
+            split_idx = text.rfind("\n") + 1 or max(text.rfind(" "), text.rfind("\t")) + 1
+            if split_idx <= 0:
+                # No whitespace at all; keep reading until there is some
+                remainder = text
+                continue
+            remainder = text[split_idx:]
+            yield text[:split_idx]
+    if remainder:
+        yield remainder
+
+
+def iter_triad_chunks(token_chunks: Iterable[list[str]]) -> Iterator[list[tuple[str, str, str]]]:
+    """Turn chunks of tokens into chunks of Markov triads, as if all the tokens were in one list.
+
+    Like `MarkovTriads.upsert_triads`, the tokens wrap around, so the last two triads continue into the first two tokens.
+
+    Parameters
+    ----------
+    token_chunks : Iterable[list[str]]
+        consecutive chunks of tokens
+
+    Yields
+    ------
+    Iterator[list[tuple[str, str, str]]]
+        triads for each chunk of tokens
+
+    Raises
+    ------
+    ValueError
+        raised if there are less than 3 tokens in total
+    """
+    head: list[str] = []
+    carry: list[str] = []
+    n_tokens = 0
+    for tokens in token_chunks:
+        n_tokens += len(tokens)
+        if len(head) < 2:
+            head.extend(tokens[: 2 - len(head)])
+        window = carry + tokens
+        yield list(zip(window, window[1:], window[2:]))
+        carry = window[-2:]
+    if n_tokens < 3:
+        raise ValueError("Input text has less than 3 tokens; triads cannot be made")
+    window = carry + head
+    yield list(zip(window, window[1:], window[2:]))
+
+
+def iter_triads(token_chunks: Iterable[list[str]]) -> Iterator[tuple[str, str, str]]:
+    """Same as `iter_triad_chunks`, but yielding one triad at a time."""
+    for triads in iter_triad_chunks(token_chunks):
+        yield from triads
+
+
+def _count_chunk_triads(text: str) -> tuple[Counter[tuple[str, str, str]], list[str], list[str], int]:
+    """Tokenize a chunk of text and count its triads, for `iter_parallel_triad_counts`.
+
+    Returns the triad counts, the first two and last two tokens (to stitch chunks together), and the number of tokens.
+    """
+    tokens = TokenizeUtil.word_tokenize(text)
+    return Counter(zip(tokens, tokens[1:], tokens[2:])), tokens[:2], tokens[-2:], len(tokens)
+
+
+def iter_parallel_triad_counts(
+    executor: Executor, filepaths: Iterable[Union[str, Path]], chunk_chars: int = 1 << 22, max_pending: int = 8
+) -> Iterator[Union[Counter[tuple[str, str, str]], list[tuple[str, str, str]]]]:
+    """Count the triads of text files in chunks with an executor, yielding the counts of each chunk in order along with the triads that
+    span chunk boundaries. Each file's triads wrap around like in `iter_triad_chunks`.
+
+    Parameters
+    ----------
+    executor : Executor
+        executor (usually a `ProcessPoolExecutor`) to tokenize and count chunks with
+    filepaths : Iterable[Union[str, Path]]
+        paths of the text files to count triads of
+    chunk_chars : int, optional
+        approximate number of characters per chunk, by default 4 Mi
+    max_pending : int, optional
+        max number of chunks submitted to the executor at once, which bounds memory use, by default 8
+
+    Yields
+    ------
+    Iterator[Union[Counter[tuple[str, str, str]], list[tuple[str, str, str]]]]
+        triad counts within each chunk, and lists of the triads spanning chunk boundaries
+
+    Raises
+    ------
+    ValueError
+        raised if a file has less than 3 tokens in total
+    """
+    filepaths = list(filepaths)
+    # Stitching state for each file: first two tokens, last two tokens so far, and token count
+    heads: list[list[str]] = [[] for _ in filepaths]
+    carries: list[list[str]] = [[] for _ in filepaths]
+    n_tokens = [0 for _ in filepaths]
+
+    def collect(file_idx: int, future: Future) -> Iterator[Union[Counter[tuple[str, str, str]], list[tuple[str, str, str]]]]:
+        counts, head, tail, n_chunk_tokens = future.result()
+        carry = carries[file_idx]
+        if len(heads[file_idx]) < 2:
+            heads[file_idx].extend(head[: 2 - len(heads[file_idx])])
+        # Triads starting in the previous chunk and ending in this one
+        window = carry + head
+        yield list(zip(window, window[1:], window[2:]))[: len(carry)]
+        carries[file_idx] = window[-2:] if n_chunk_tokens < 2 else tail
+        n_tokens[file_idx] += n_chunk_tokens
+        yield counts
+
+    # Chunks are collected in the order they were submitted, so each file's chunks are stitched in order
+    pending: deque[tuple[int, Future]] = deque()
+    for file_idx, filepath in enumerate(filepaths):
+        for chunk in iter_text_chunks(filepath, chunk_chars):
+            if len(pending) >= max_pending:
+                yield from collect(*pending.popleft())
+            pending.append((file_idx, executor.submit(_count_chunk_triads, chunk)))
+    while pending:
+        yield from collect(*pending.popleft())
+
+    # Wrap each file's last two tokens around to its first two
+    for file_idx, filepath in enumerate(filepaths):
+        if n_tokens[file_idx] < 3:
+            raise ValueError(f"Input text {filepath} has less than 3 tokens; triads cannot be made")
+        window = carries[file_idx] + heads[file_idx]
+        yield list(zip(window, window[1:], window[2:]))
@@ -1,36 +1,452 @@
-import argparse
 from dataclasses import dataclass, field
-import gzip
-from itertools import groupby
-import nltk
-from nltk.tokenize.treebank import TreebankWordDetokenizer
+from collections import Counter
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import os
-from sqlalchemy import create_engine, Column, Integer, String, and_, select, delete, func
+from pathlib import Path
+import sqlite3
+from sqlalchemy import inspect, Column, Float, Integer, String, and_, select, delete, func, literal_column
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.engine import Engine, Row
-from typing import Optional
+from sqlalchemy.schema import DropTable
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import TypeEngine
+from typing import Any, Iterable, Iterator, Literal, Mapping, Optional, Sequence, Union
 
+from .MarkovTriadCounting import iter_parallel_triad_counts, iter_text_chunks, iter_triad_chunks, iter_triads
 import src.Directories as Directories
-from src.UpsertTable import UpsertTable
-
-nltk.download("punkt", quiet=True)
+from src.UpsertTable import UpsertTable, attach_database, bulk_load_cursor
+from src.Util import TokenizeUtil
 
 _rng = np.random.default_rng()
 
+SENTENCE_END_TOKENS: tuple[str, ...] = (".", "!", "?")
+"""Tokens that end a sentence; the tokens following these are used as sentence starts."""
+
+MAX_END_STEPS = 200
+"""Cap on the expected number of steps from a state to a sentence end; states that loop without ending, and tokens that lead to no
+state, count as this many steps."""
+
+LATEST_SCHEMA_VERSION = 2
+"""Latest version of the Markov model schema. Version 1 stores tokens as strings in the triads table; version 2 stores token ids in
+the triads table and the tokens themselves in a `markov_vocab` table."""
+
+
+TOKEN_COLUMNS: tuple[str, ...] = ("first_token", "second_token", "third_token")
+"""Names of the token columns of the triads table."""
+
+
+def _triad_columns(token_type: Union[type[TypeEngine], TypeEngine]) -> list[Column]:
+    """Columns of the triads table, with the given type for the token columns."""
+    return [
+        Column("first_token", token_type, primary_key=True, nullable=False),
+        Column("second_token", token_type, primary_key=True, nullable=False),
+        Column("third_token", token_type, primary_key=True, nullable=False),
+        Column("occurrences", Integer, default=0),
+    ]
+
+
+def _triad_rows(triad_counts: Iterable[tuple[tuple[Any, Any, Any], int]]) -> Iterator[tuple[Any, Any, Any, int]]:
+    """Convert ((first, second, third), count) pairs into rows of the triads table's columns."""
+    return ((first, second, third, count) for (first, second, third), count in triad_counts)
+
+
+def _kept_first_tokens(triad_counts: Iterable[tuple[tuple[Any, Any, Any], int]], min_occurrences: int, uncommon_threshold: int) -> set[Any]:
+    """Get the first tokens of more than `uncommon_threshold` distinct triads with at least `min_occurrences` occurrences."""
+    fanouts = Counter(first for (first, _, _), count in triad_counts if count >= min_occurrences)
+    return {first for first, fanout in fanouts.items() if fanout > uncommon_threshold}
+
+
+def _prune_counts(
+    triad_counts: Iterable[tuple[tuple[Any, Any, Any], int]], min_occurrences: int, kept_first_tokens: Optional[set[Any]]
+) -> Iterator[tuple[tuple[Any, Any, Any], int]]:
+    """Filter ((first, second, third), count) pairs to those with at least `min_occurrences` occurrences and a kept first token."""
+    return (
+        (triad, count)
+        for triad, count in triad_counts
+        if count >= min_occurrences and (kept_first_tokens is None or triad[0] in kept_first_tokens) and not triad[0] == triad[1] == triad[2]
+    )
+
+
+def vacuum_if_fragmented(engine: Engine, max_free_fraction: float = 0.1) -> bool:
+    """Run `VACUUM` on the database only if more than `max_free_fraction` of its pages are free, since it rewrites the whole file.
+
+    Parameters
+    ----------
+    engine : Engine
+        SQLAlchemy engine of the database
+    max_free_fraction : float, optional
+        max fraction of free pages to leave in the database, by default 0.1
+
+    Returns
+    -------
+    bool
+        whether the database was vacuumed
+    """
+    free_pages = engine.execute("PRAGMA freelist_count").scalar() or 0
+    total_pages = engine.execute("PRAGMA page_count").scalar() or 0
+    if free_pages <= max_free_fraction * total_pages:
+        return False
+    engine.execute("vacuum")
+    return True
+
+
+def terminating_rows(rows: Iterable[Union[Row, tuple[str, float, Optional[float]]]]) -> list[tuple[str, float]]:
+    """Reweight rows of (token, weight, expected steps to a sentence end from the state the token leads to) to favor tokens that end
+    the sentence sooner, dividing each weight by 1 plus the expected steps, like the termination tables of `MarkovTransitionTable`.
+
+    Sentence ending tokens count as 0 steps, and tokens without expected steps (which lead to no state) count as `MAX_END_STEPS`.
+
+    Parameters
+    ----------
+    rows : Iterable[Union[Row, tuple[str, float, Optional[float]]]]
+        rows of tokens, weights and expected steps, as selected with `MarkovEndSteps.select_next_steps`
+
+    Returns
+    -------
+    list[tuple[str, float]]
+        reweighted rows of tokens and weights
+    """
+    return [(token, weight / (1.0 + (0.0 if token in SENTENCE_END_TOKENS else MAX_END_STEPS if steps is None else steps))) for token, weight, steps in rows]
+
+
+def choose_word_from_rows(rows: Sequence[Union[Row, tuple[str, float]]], rng: Optional[np.random.Generator] = None) -> Optional[str]:
+    """Choose a word from rows of (word, weight), with probability proportional to its weight.
+
+    Parameters
+    ----------
+    rows : Sequence[Union[Row, tuple[str, float]]]
+        list of queried rows with words and weights
+    rng : Optional[np.random.Generator], optional
+        random generator to sample with, by default the module generator
+
+    Returns
+    -------
+    Optional[str]
+        chosen word, or none if there are no rows
+    """
+    if len(rows) == 0:
+        return None
+    words, weights = tuple(zip(*rows))
+    # Sample against the cumulative weights instead of building a normalized probability vector
+    cum_weights = np.cumsum(weights)
+    return words[int(np.searchsorted(cum_weights, (rng or _rng).random() * cum_weights[-1], side="right"))]
+
+
+def get_schema_version(engine: Engine) -> int:
+    """Get the Markov model schema version of the database.
+
+    Parameters
+    ----------
+    engine : Engine
+        SQLAlchemy engine of the Markov model database
+
+    Returns
+    -------
+    int
+        schema version, which is 1 for databases without a version set
+    """
+    return max(1, engine.execute("PRAGMA user_version").scalar() or 0)
+
 
 @dataclass
-class MarkovTriads(UpsertTable):
-    """Table that contains Markov model triads."""
+class MarkovVocab(UpsertTable):
+    """Table that maps the token ids used by version 2 `MarkovTriads` tables to their tokens."""
 
-    table_name: str = field(default="markov_triads")
+    table_name: str = field(default="markov_vocab")
+    columns: list[Column] = field(
+        default_factory=lambda: [
+            Column("id", Integer, primary_key=True),
+            Column("token", String, nullable=False, unique=True),
+        ]
+    )
+
+    def get_ids(self, engine: Engine, tokens: Iterable[str], batch_size: int = 500) -> dict[str, int]:
+        """Get the ids of the tokens, adding any tokens that aren't in the vocabulary yet.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine with the vocabulary table
+        tokens : Iterable[str]
+            tokens to get the ids of
+        batch_size : int, optional
+            number of tokens per query, by default 500
+
+        Returns
+        -------
+        dict[str, int]
+            map of each token to its id
+        """
+        unique_tokens = sorted(set(tokens))
+        token_ids: dict[str, int] = {}
+        with engine.begin() as conn:
+            for i in range(0, len(unique_tokens), batch_size):
+                batch = unique_tokens[i : i + batch_size]
+                conn.execute(insert(self.table_def).on_conflict_do_nothing(index_elements=["token"]), [{"token": token} for token in batch])
+                rows = conn.execute(select(self.table_def.columns.token, self.table_def.columns.id).where(self.table_def.columns.token.in_(batch)))
+                token_ids.update({token: token_id for token, token_id in rows})
+        return token_ids
+
+
+@dataclass
+class MarkovEndSteps(UpsertTable):
+    """Table of the expected number of tokens generated from each 2-gram state of a Markov model until a sentence ending token,
+    along with a table of the same for each 1-gram state, keyed by tokens as strings for any schema version.
+
+    Both are derived from the triads with `MarkovTransitionTable.save_end_steps`, which `train.py` does whenever it writes a model (and
+    `MarkovModelRegistry` for loaded databases without them), so that sampling with `terminating=True` favors the same tokens with every
+    backend.
+    """
+
+    table_name: str = field(default="markov_end_steps")
     columns: list[Column] = field(
         default_factory=lambda: [
             Column("first_token", String, primary_key=True, nullable=False),
             Column("second_token", String, primary_key=True, nullable=False),
-            Column("third_token", String, primary_key=True, nullable=False),
-            Column("occurrences", Integer, default=0),
+            Column("steps", Float, nullable=False),
         ]
     )
+    uni_table: UpsertTable = field(
+        default_factory=lambda: UpsertTable(
+            "markov_uni_end_steps", [Column("token", String, primary_key=True, nullable=False), Column("steps", Float, nullable=False)]
+        ),
+        init=False,
+        repr=False,
+        compare=False,
+    )
+
+    def create_table(self, engine: Engine) -> None:
+        """Create the 2-gram and 1-gram tables with the specified engine.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to create the tables in
+        """
+        super().create_table(engine)
+        self.uni_table.create_table(engine)
+
+    def has_tables(self, engine: Engine) -> bool:
+        """Check whether the engine's database has the 2-gram and 1-gram tables.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the Markov model database
+
+        Returns
+        -------
+        bool
+            whether both tables exist
+        """
+        inspector = inspect(engine)
+        return inspector.has_table(self.table_name) and inspector.has_table(self.uni_table.table_name)
+
+    def replace(self, engine: Engine, end_steps: Iterable[tuple[str, str, float]], uni_end_steps: Iterable[tuple[str, float]]) -> None:
+        """Replace the expected steps of all states, creating the tables if they don't exist.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the Markov model database
+        end_steps : Iterable[tuple[str, str, float]]
+            rows of the first token, second token and expected steps of each 2-gram state
+        uni_end_steps : Iterable[tuple[str, float]]
+            rows of the token and expected steps of each 1-gram state
+        """
+        self.create_table(engine)
+        engine.execute(delete(self.table_def))
+        engine.execute(delete(self.uni_table.table_def))
+        self.upsert(engine, end_steps, validate=False)
+        self.uni_table.upsert(engine, uni_end_steps, validate=False)
+
+    def select_next_steps(self, rows_stmt: Any, last_token: Optional[str] = None) -> Any:
+        """Extend a select of (next token, weight) rows with the expected steps of the state each token leads to.
+
+        After a 2-gram state whose second token is `last_token`, a token leads to the 2-gram state (`last_token`, token), backing off to
+        the token's 1-gram state if that doesn't exist; after a 1-gram state, it leads to the token's 1-gram state. This matches how
+        `MarkovTransitionTable` computes its termination tables.
+
+        Parameters
+        ----------
+        rows_stmt : Any
+            select of (token, weight) rows, with tokens as strings
+        last_token : Optional[str], optional
+            second token of the 2-gram state the rows follow, or none if they follow a 1-gram state; by default none
+
+        Returns
+        -------
+        Any
+            select of (token, weight, expected steps) rows, where the steps are null for tokens that lead to no state
+        """
+        rows = rows_stmt.subquery()
+        token_col, weight_col = list(rows.columns)
+        uni_cols = self.uni_table.table_def.columns
+        from_clause = rows.outerjoin(self.uni_table.table_def, uni_cols.token == token_col)
+        if last_token is None:
+            return select(token_col, weight_col, uni_cols.steps).select_from(from_clause)
+        cols = self.table_def.columns
+        from_clause = from_clause.outerjoin(self.table_def, and_(cols.first_token == last_token, cols.second_token == token_col))
+        return select(token_col, weight_col, func.coalesce(cols.steps, uni_cols.steps)).select_from(from_clause)
+
+
+def delta_paths(db_name: str) -> list[Path]:
+    """Get the delta shards of a model, `models/{db_name}.d/*.db`, oldest first.
+
+    Delta shards are small, uncompressed Markov model databases written by `train.py train --delta`. Loading a model adds their counts to the
+    base model's, and `train.py compact` folds them into the base model.
+
+    Parameters
+    ----------
+    db_name : str
+        name of the model
+
+    Returns
+    -------
+    list[Path]
+        paths of the model's delta shards, which are named so they sort by creation time
+    """
+    return sorted((Directories.MODELS_DIR / f"{db_name}.d").glob("*.db"))
+
+
+@dataclass
+class MarkovFoldedDeltas(UpsertTable):
+    """Table of the names of the delta shards that were folded into a base Markov model, so their counts are never added twice."""
+
+    table_name: str = field(default="markov_folded_deltas")
+    columns: list[Column] = field(default_factory=lambda: [Column("name", String, primary_key=True)])
+
+    def get_names(self, engine: Engine) -> set[str]:
+        """Get the names of the folded delta shards, without creating the table if it doesn't exist.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the base model database
+
+        Returns
+        -------
+        set[str]
+            file names of the folded delta shards
+        """
+        if not inspect(engine).has_table(self.table_name):
+            return set()
+        return {row[0] for row in engine.execute(select(self.table_def.columns.name))}
+
+    def pending(self, engine: Engine, delta_paths: Iterable[Union[str, Path]]) -> list[Path]:
+        """Get the delta shards that weren't folded into the base model yet.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the base model database
+        delta_paths : Iterable[Union[str, Path]]
+            paths of the delta shards to check
+
+        Returns
+        -------
+        list[Path]
+            paths of the delta shards whose counts aren't in the base model
+        """
+        folded_names = self.get_names(engine)
+        return [Path(path) for path in delta_paths if Path(path).name not in folded_names]
+
+
+@dataclass
+class MarkovTriads(UpsertTable):
+    """Table that contains Markov model triads.
+
+    With `schema_version` 2, the token columns hold ids from a `MarkovVocab` table instead of the tokens themselves. All methods still
+    take and return tokens as strings either way; use `MarkovTriads.for_engine` to get a table matching an existing database.
+    """
+
+    table_name: str = field(default="markov_triads")
+    columns: list[Column] = field(default_factory=lambda: _triad_columns(String))
+    schema_version: int = 1
+    vocab_table: MarkovVocab = field(default_factory=MarkovVocab, init=False, repr=False, compare=False)
+    end_steps_table: MarkovEndSteps = field(default_factory=MarkovEndSteps, init=False, repr=False, compare=False)
+    _start_rows: dict[str, tuple[Any, list[Row]]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    """Cache of sentence start rows per database URL, along with the version of the database file they were read from."""
+    _end_steps_urls: set[str] = field(default_factory=set, init=False, repr=False, compare=False)
+    """URLs of the databases known to have `MarkovEndSteps` tables."""
+
+    def __post_init__(self) -> None:
+        if self.schema_version >= 2:
+            self.columns = _triad_columns(Integer)
+        super().__post_init__()
+
+    @classmethod
+    def for_engine(cls, engine: Engine) -> "MarkovTriads":
+        """Create a `MarkovTriads` with the schema version of the engine's database.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the Markov model database
+
+        Returns
+        -------
+        MarkovTriads
+            table matching the database's schema
+        """
+        return cls(schema_version=get_schema_version(engine))
+
+    def create_table(self, engine: Engine) -> None:
+        """Create this table (and the vocabulary table for schema version 2) with the specified engine, along with its read indexes.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to create the table in
+        """
+        super().create_table(engine)
+        if self.schema_version >= 2:
+            self.vocab_table.create_table(engine)
+            engine.execute(f"PRAGMA user_version = {self.schema_version}")
+        self.create_indexes(engine)
+
+    @property
+    def read_indexes(self) -> dict[str, str]:
+        """Names of the indexes used to read tokens, mapped to their columns."""
+        return {
+            f"ix_{self.table_name}_covering": "first_token, second_token, third_token, occurrences",
+            f"ix_{self.table_name}_second_token": "second_token, third_token, occurrences",
+        }
+
+    def create_indexes(self, engine: Engine) -> None:
+        """Create the indexes used to read tokens, if they don't exist yet.
+
+        Both are covering indexes, so token lookups never read the table itself: one on all columns for 2-gram lookups, and one
+        starting with the second token for 1-gram lookups and sentence starts.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine with this table
+        """
+        for index_name, index_columns in self.read_indexes.items():
+            engine.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {self.table_name} ({index_columns})")
+
+    def _token_match(self, column: Column, token: str) -> ColumnElement:
+        """Get a condition matching a token column to a token, looking up its id for schema version 2."""
+        if self.schema_version >= 2:
+            vocab_cols = self.vocab_table.table_def.columns
+            return column == select(vocab_cols.id).where(vocab_cols.token == token).scalar_subquery()
+        return column == token
+
+    def _select_third_tokens(self, *conditions: ColumnElement, summed: bool = True) -> Any:
+        """Select (third token, weight) rows matching the conditions, grouped by third token if `summed`, with tokens as strings."""
+        cols = self.table_def.columns
+        weight = func.sum(cols.occurrences) if summed else cols.occurrences
+        if self.schema_version >= 2:
+            vocab_cols = self.vocab_table.table_def.columns
+            from_clause = self.table_def.join(self.vocab_table.table_def, vocab_cols.id == cols.third_token)
+            sel_stmt = select(vocab_cols.token, weight).select_from(from_clause).where(*conditions)
+            return sel_stmt.group_by(vocab_cols.token) if summed else sel_stmt
+        sel_stmt = select(cols.third_token, weight).where(*conditions)
+        return sel_stmt.group_by(cols.third_token) if summed else sel_stmt
 
     def upsert_triads(self, engine: Engine, text: str, overwrite_probs: bool = False) -> None:
         """Upsert Markov triads into the database from the inputted text.
@@ -49,48 +465,290 @@ class MarkovTriads(UpsertTable):
         ValueError
             raised if input text is less than 3 tokens
         """
-        tokens = nltk.word_tokenize(text)
+        tokens = TokenizeUtil.word_tokenize(text)
         if len(tokens) < 3:
             raise ValueError("Input text has less than 3 tokens; triads cannot be made")
-        records = [
-            {
-                "first_token": token,
-                "second_token": tokens[(i + 1) % len(tokens)],
-                "third_token": tokens[(i + 2) % len(tokens)],
-                "occurrences": 1,
-            }
-            for i, token in enumerate(tokens)
-        ]
-        group_key = lambda rec: (rec["first_token"], rec["second_token"], rec["third_token"])
-        grouped_iter = groupby(sorted(records, key=group_key), key=group_key)
-        grouped_records = [
-            {
-                "first_token": key[0],
-                "second_token": key[1],
-                "third_token": key[2],
-                "occurrences": sum(rec["occurrences"] for rec in group),
-            }
-            for key, group in grouped_iter
-        ]
-        self.upsert(engine, grouped_records, upsert_type="overwrite" if overwrite_probs else "add")
-        # Delete triads where all 3 words are the same, to avoid repeating symbols too much
-        engine.execute(
-            delete(self.table_def).where(
-                and_(
-                    self.table_def.columns.first_token == self.table_def.columns.second_token,
-                    self.table_def.columns.second_token == self.table_def.columns.third_token,
-                )
-            )
+        self.upsert_triad_counts(engine, Counter(iter_triads([tokens])), overwrite_probs=overwrite_probs)
+
+    def upsert_triads_from_file(
+        self,
+        engine: Engine,
+        filepath: Union[str, Path],
+        overwrite_probs: bool = False,
+        chunk_chars: int = 1 << 20,
+        max_counted_triads: int = 2_000_000,
+        min_occurrences: int = 1,
+        uncommon_threshold: int = 0,
+    ) -> None:
+        """Upsert Markov triads into the database from a text file, streaming it so memory use doesn't depend on the file size.
+
+        The file is read and tokenized in chunks split at whitespace, carrying the last two tokens over to the next chunk, so the
+        triads are the same as reading the whole file with `upsert_triads` (up to tokenization differences at chunk boundaries).
+        Triad counts are kept in memory until there are `max_counted_triads` distinct triads, after which they are added to a staging
+        table in the database and the counts start over; the staging table is upserted into this table at the end.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to upsert triads into
+        filepath : Union[str, Path]
+            path of the text file to create Markov triads from
+        overwrite_probs : bool, optional
+            whether to overwrite the weights in the database or to just add them, by default False
+        chunk_chars : int, optional
+            approximate number of characters to tokenize at a time, by default 1 Mi
+        max_counted_triads : int, optional
+            max distinct triads to count in memory before spilling them to the database, by default 2,000,000
+        min_occurrences : int, optional
+            prune triads with fewer occurrences than this, by default 1
+        uncommon_threshold : int, optional
+            prune triads whose first token starts this many distinct triads or less, like `remove_uncommon_tokens`, by default 0
+
+        Raises
+        ------
+        ValueError
+            raised if input text is less than 3 tokens
+        """
+        self.upsert_triads_from_files(
+            engine,
+            [filepath],
+            1,
+            overwrite_probs=overwrite_probs,
+            chunk_chars=chunk_chars,
+            max_counted_triads=max_counted_triads,
+            min_occurrences=min_occurrences,
+            uncommon_threshold=uncommon_threshold,
         )
 
-    def remove_uncommon_tokens(self, engine: Engine, uncommon_threshold: int = 5) -> None:
+    def upsert_triads_from_files(
+        self,
+        engine: Engine,
+        filepaths: Iterable[Union[str, Path]],
+        jobs: int,
+        overwrite_probs: bool = False,
+        chunk_chars: int = 1 << 22,
+        max_counted_triads: int = 2_000_000,
+        min_occurrences: int = 1,
+        uncommon_threshold: int = 0,
+    ) -> None:
+        """Upsert Markov triads from several text files, tokenizing and counting chunks of them in parallel processes.
+
+        Each file is split into chunks like in `upsert_triads_from_file`, and with more than 1 job, each chunk is tokenized and counted
+        in a process pool; the triads spanning chunk boundaries (and each file's wrap-around) are stitched back together here. Partial
+        counts are merged and written in bulk at the end, spilling to a staging table like `upsert_triads_from_file` if they get too
+        large. Unlike calling `upsert_triads_from_file` per file, counts of all files are summed before they're written, even when
+        overwriting.
+
+        Triads are pruned as the summed counts are written, so pruned triads are never written. If the table already has triads, the
+        pruning applies to the combined counts, so it's done by deleting them with `remove_uncommon_tokens` afterwards instead.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to upsert triads into
+        filepaths : Iterable[Union[str, Path]]
+            paths of the text files to create Markov triads from
+        jobs : int
+            number of processes to tokenize and count with
+        overwrite_probs : bool, optional
+            whether to overwrite the weights in the database or to just add them, by default False
+        chunk_chars : int, optional
+            approximate number of characters per chunk counted by a process, by default 4 Mi
+        max_counted_triads : int, optional
+            max distinct triads to keep in memory before spilling them to the database, by default 2,000,000
+        min_occurrences : int, optional
+            prune triads with fewer occurrences than this, by default 1
+        uncommon_threshold : int, optional
+            prune triads whose first token starts this many distinct triads or less, like `remove_uncommon_tokens`, by default 0
+
+        Raises
+        ------
+        ValueError
+            raised if any input file is less than 3 tokens
+        """
+        prune_kwargs = {"min_occurrences": min_occurrences, "uncommon_threshold": uncommon_threshold}
+        if jobs <= 1:
+            triad_chunks = itertools.chain.from_iterable(
+                iter_triad_chunks(TokenizeUtil.word_tokenize(chunk) for chunk in iter_text_chunks(filepath, chunk_chars)) for filepath in filepaths
+            )
+            self._upsert_triad_chunks(engine, triad_chunks, overwrite_probs=overwrite_probs, max_counted_triads=max_counted_triads, **prune_kwargs)
+            return
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            count_chunks = iter_parallel_triad_counts(executor, filepaths, chunk_chars=chunk_chars, max_pending=2 * jobs)
+            self._upsert_triad_chunks(engine, count_chunks, overwrite_probs=overwrite_probs, max_counted_triads=max_counted_triads, **prune_kwargs)
+
+    def _upsert_triad_chunks(
+        self,
+        engine: Engine,
+        triad_chunks: Iterable[Union[Iterable[tuple[str, str, str]], Mapping[tuple[str, str, str], int]]],
+        overwrite_probs: bool,
+        max_counted_triads: int,
+        min_occurrences: int = 1,
+        uncommon_threshold: int = 0,
+    ) -> None:
+        """Count chunks of triads (or add chunks of triad counts) in memory, spilling to a staging table when there are too many, and
+        upsert the totals at the end, pruning them as they're written."""
+        counts: Counter[tuple[str, str, str]] = Counter()
+        staging_table: Optional[UpsertTable] = None
+        for triads in triad_chunks:
+            counts.update(triads)
+            if len(counts) >= max_counted_triads:
+                if not staging_table:
+                    staging_table = UpsertTable(f"stream_{self.table_name}", _triad_columns(String))
+                    # Start from an empty staging table in case an earlier run was interrupted
+                    engine.execute(DropTable(staging_table.table_def, if_exists=True))
+                    staging_table.create_table(engine)
+                staging_table.upsert(engine, _triad_rows(counts.items()), upsert_type="add", validate=False)
+                counts.clear()
+
+        # Pruning thresholds apply to the final counts, which are only the ones written here if the table is empty
+        pruning = min_occurrences > 1 or uncommon_threshold > 0
+        prune_on_write = pruning and engine.execute(select(literal_column("1")).select_from(self.table_def).limit(1)).first() is None
+        write_min_occurrences = min_occurrences if prune_on_write else 0
+        if not staging_table:
+            kept_first_tokens = _kept_first_tokens(_prune_counts(counts.items(), 0, None), min_occurrences, uncommon_threshold) if prune_on_write else None
+            self.upsert_triad_counts(engine, dict(_prune_counts(counts.items(), write_min_occurrences, kept_first_tokens)), overwrite_probs=overwrite_probs)
+        else:
+            staging_table.upsert(engine, _triad_rows(counts.items()), upsert_type="add", validate=False)
+            counts.clear()
+            staging_cols = staging_table.table_def.columns
+            kept_first_tokens = None
+            if prune_on_write:
+                sel_stmt = (
+                    select(staging_cols.first_token)
+                    .where(
+                        staging_cols.occurrences >= min_occurrences,
+                        ~and_(staging_cols.first_token == staging_cols.second_token, staging_cols.second_token == staging_cols.third_token),
+                    )
+                    .group_by(staging_cols.first_token)
+                    .having(func.count() > uncommon_threshold)
+                )
+                kept_first_tokens = {row[0] for row in engine.execute(sel_stmt)}
+            # Move staged counts over in pages by rowid, so a read cursor isn't left open while writing
+            last_rowid = 0
+            while True:
+                sel_stmt = (
+                    select(literal_column("rowid"), staging_cols.first_token, staging_cols.second_token, staging_cols.third_token, staging_cols.occurrences)
+                    .select_from(staging_table.table_def)
+                    .where(literal_column("rowid") > last_rowid)
+                    .order_by(literal_column("rowid"))
+                    .limit(max_counted_triads)
+                )
+                rows = engine.execute(sel_stmt).fetchall()
+                if len(rows) == 0:
+                    break
+                last_rowid = rows[-1][0]
+                page_counts = _prune_counts((((row[1], row[2], row[3]), row[4]) for row in rows), write_min_occurrences, kept_first_tokens)
+                self.upsert_triad_counts(engine, dict(page_counts), overwrite_probs=overwrite_probs)
+            engine.execute(DropTable(staging_table.table_def, if_exists=True))
+        if pruning and not prune_on_write:
+            self.remove_uncommon_tokens(engine, uncommon_threshold=uncommon_threshold, min_occurrences=min_occurrences)
+
+    def upsert_triad_counts(self, engine: Engine, counts: Mapping[tuple[str, str, str], int], overwrite_probs: bool = False) -> None:
+        """Upsert already counted Markov triads into the database.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to upsert triads into
+        counts : Mapping[tuple[str, str, str], int]
+            map of (first token, second token, third token) to the number of occurrences
+        overwrite_probs : bool, optional
+            whether to overwrite the weights in the database or to just add them, by default False
+        """
+        # Skip triads where all 3 words are the same, to avoid repeating symbols too much
+        triad_counts: Iterable[tuple[tuple[Any, Any, Any], int]] = ((triad, count) for triad, count in counts.items() if not triad[0] == triad[1] == triad[2])
+        if self.schema_version >= 2:
+            token_ids = self.vocab_table.get_ids(engine, (token for triad in counts for token in triad))
+            triad_counts = (((token_ids[first], token_ids[second], token_ids[third]), count) for (first, second, third), count in triad_counts)
+        self.upsert(engine, _triad_rows(triad_counts), upsert_type="overwrite" if overwrite_probs else "add", validate=False)
+        self._start_rows.pop(str(engine.url), None)
+
+    def merge_from(self, engine: Engine, other_db_paths: Iterable[Union[str, Path]], upsert_type: Literal["overwrite", "add"] = "add") -> None:
+        """Merge the triads of other Markov model databases into this table without passing them through Python, like
+        `UpsertTable.merge_from`. The other databases can have any schema version; for schema version 2, their tokens are matched
+        through the vocabulary tables, adding tokens that aren't in this database's vocabulary yet.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to merge triads into
+        other_db_paths : Iterable[Union[str, Path]]
+            paths of the Markov model databases to merge, which are only read
+        upsert_type : Literal["overwrite", "add"]
+            "overwrite" if merged counts should overwrite existing counts; "add" if they should be added to them, by default "add"
+        """
+        super().merge_from(engine, other_db_paths, upsert_type=upsert_type)
+        self._start_rows.pop(str(engine.url), None)
+
+    def _merge_statements(self, cursor: sqlite3.Cursor, schema: str, upsert_type: Literal["overwrite", "add"]) -> list[str]:
+        """Get the SQL statements merging the triads of the attached Markov model database with the given schema name."""
+        source_version = max(1, cursor.execute(f"PRAGMA {schema}.user_version").fetchone()[0])
+        triads, vocab = self.table_name, self.vocab_table.table_name
+        # Source of the triads with their tokens as strings
+        if source_version >= 2:
+            source_from = f"{schema}.{triads} t " + " ".join(f"JOIN {schema}.{vocab} s{i} ON s{i}.id = t.{col}" for i, col in enumerate(TOKEN_COLUMNS))
+            source_tokens = [f"s{i}.token" for i in range(3)]
+            source_vocab = f"SELECT token FROM {schema}.{vocab}"
+        else:
+            source_from = f"{schema}.{triads} t"
+            source_tokens = [f"t.{col}" for col in TOKEN_COLUMNS]
+            source_vocab = " UNION ".join(f"SELECT {col} FROM {schema}.{triads}" for col in TOKEN_COLUMNS)
+        # The WHERE clauses stop SQLite from parsing ON CONFLICT as part of the SELECT's join
+        if self.schema_version >= 2:
+            target_from = source_from + " " + " ".join(f"JOIN main.{vocab} m{i} ON m{i}.token = {token}" for i, token in enumerate(source_tokens))
+            return [
+                f"INSERT INTO main.{vocab} (token) SELECT * FROM ({source_vocab}) WHERE true ON CONFLICT (token) DO NOTHING",
+                self._upsert_sql(f"SELECT m0.id, m1.id, m2.id, t.occurrences FROM {target_from} WHERE true", upsert_type),
+            ]
+        return [self._upsert_sql(f"SELECT {', '.join(source_tokens)}, t.occurrences FROM {source_from} WHERE true", upsert_type)]
+
+    def fold_deltas(self, engine: Engine, delta_paths: Iterable[Union[str, Path]]) -> list[Path]:
+        """Merge the triads of delta shards into this table, recording each shard as folded in the same transaction so it's never
+        folded twice.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine of the base model database
+        delta_paths : Iterable[Union[str, Path]]
+            paths of the delta shards to fold, which are only read
+
+        Returns
+        -------
+        list[Path]
+            paths of the delta shards that were folded, excluding those that already were
+        """
+        folded_table = MarkovFoldedDeltas()
+        folded_table.create_table(engine)
+        pending_paths = folded_table.pending(engine, delta_paths)
+        with bulk_load_cursor(engine) as cursor:
+            for delta_path in pending_paths:
+                with attach_database(cursor, delta_path) as schema:
+                    for statement in self._merge_statements(cursor, schema, "add"):
+                        cursor.execute(statement)
+                    cursor.execute(f"INSERT INTO {folded_table.table_name} (name) VALUES (?) ON CONFLICT DO NOTHING", (delta_path.name,))
+                    cursor.connection.commit()
+        self._start_rows.pop(str(engine.url), None)
+        return pending_paths
+
+    def remove_uncommon_tokens(self, engine: Engine, uncommon_threshold: int = 5, min_occurrences: int = 1) -> None:
         """Remove uncommon tokens from the table.
 
+        Prefer pruning while training (see `upsert_triads_from_files`), which never writes the pruned triads; this deletes them after
+        they're written, so the database needs a `VACUUM` afterwards to shrink.
+
         Parameters
         ----------
         engine : Engine
             SQLAlchemy engine with table to remove uncommon tokens from
+        uncommon_threshold : int, optional
+            remove triads whose first token starts this many distinct triads or less, by default 5
+        min_occurrences : int, optional
+            first remove triads with fewer occurrences than this, by default 1
         """
+        if min_occurrences > 1:
+            engine.execute(delete(self.table_def).where(self.table_def.columns.occurrences < min_occurrences))
         engine.execute(
             delete(self.table_def).where(
                 self.table_def.columns.first_token.in_(
@@ -101,52 +759,60 @@ class MarkovTriads(UpsertTable):
                 )
             )
         )
+        self._start_rows.pop(str(engine.url), None)
 
-    def _choose_word_from_rows(self, rows: list[Row]) -> Optional[str]:
-        """Choose a word from rows of (word, weight).
-
-        Parameters
-        ----------
-        rows : list[Row]
-            list of queried rows with words and weights
+    def _db_version(self, engine: Engine) -> Any:
+        """Return a value that changes whenever the engine's database file changes, or None for in-memory databases."""
+        db_path = engine.url.database
+        if db_path and db_path != ":memory:" and os.path.exists(db_path):
+            stat = os.stat(db_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        return None
 
-        Returns
-        -------
-        str
-            chosen word
-        """
-        if len(rows) == 0:
-            return None
-        words, weights = tuple(zip(*rows))
-        probs = np.asarray(weights)
-        probs = probs / probs.sum()
-        return _rng.choice(words, p=probs)
-
-    def get_first_token(self, engine: Engine) -> str:
+    def get_first_token(self, engine: Engine, rng: Optional[np.random.Generator] = None) -> str:
         """Return the first token for a generated sentence.
 
+        The sentence start distribution is queried once per database and cached; the cache is invalidated when the database file
+        changes or when triads are written through this object.
+
         Parameters
         ----------
         engine : Engine
             SQLAlchemy engine to query from
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the module generator
 
         Returns
         -------
         str
             first generated token
+
+        Raises
+        ------
+        ValueError
+            raised if the model has no sentence starts to choose from
         """
-        chosen_token: Optional[str] = None
-        while not chosen_token:
-            sel_stmt = (
-                select(self.table_def.columns.third_token, func.sum(self.table_def.columns.occurrences))
-                .where(self.table_def.columns.second_token.in_((".", "!", "?")))
-                .group_by(self.table_def.columns.third_token)
-            )
-            rows = engine.execute(sel_stmt).fetchall()
-            chosen_token = self._choose_word_from_rows(rows)
-        return chosen_token
+        cache_key = str(engine.url)
+        db_version = self._db_version(engine)
+        cached = self._start_rows.get(cache_key)
+        if cached is None or cached[0] != db_version:
+            if self.schema_version >= 2:
+                vocab_cols = self.vocab_table.table_def.columns
+                is_start = self.table_def.columns.second_token.in_(select(vocab_cols.id).where(vocab_cols.token.in_(SENTENCE_END_TOKENS)))
+            else:
+                is_start = self.table_def.columns.second_token.in_(SENTENCE_END_TOKENS)
+            sel_stmt = self._select_third_tokens(is_start)
+            rows = [row for row in engine.execute(sel_stmt).fetchall() if row[0]]
+            if len(rows) == 0:
+                raise ValueError("Markov model has no sentence starts to choose from")
+            cached = (db_version, rows)
+            self._start_rows[cache_key] = cached
+        chosen_token = choose_word_from_rows(cached[1], rng=rng)
+        return chosen_token or ""
 
-    def get_next_token(self, engine: Engine, first_token: str, second_token: Optional[str] = None) -> str:
+    def get_next_token(
+        self, engine: Engine, first_token: str, second_token: Optional[str] = None, terminating: bool = False, rng: Optional[np.random.Generator] = None
+    ) -> str:
         """Return the next token for a generated sentence.
 
         Parameters
@@ -157,38 +823,49 @@ class MarkovTriads(UpsertTable):
             first token to check in model
         second_token : Optional[str], optional
             second token to check in model, by default None
+        terminating : bool, optional
+            whether to favor tokens that end the sentence sooner, reweighting them with `terminating_rows`; by default False
+        rng : Optional[np.random.Generator], optional
+            random generator to sample with, by default the module generator
 
         Returns
         -------
         str
             next generated token
+
+        Raises
+        ------
+        ValueError
+            raised if `terminating` but the database has no `MarkovEndSteps` tables
         """
         # Treat as 1-gram Markov model if only first_token provided, otherwise 2-gram
+        cols = self.table_def.columns
         if not second_token:
-            sel_stmt = (
-                select(self.table_def.columns.third_token, func.sum(self.table_def.columns.occurrences))
-                .where(self.table_def.columns.second_token == first_token)
-                .group_by(self.table_def.columns.third_token)
-            )
+            sel_stmt = self._select_third_tokens(self._token_match(cols.second_token, first_token))
         else:
-            sel_stmt = select(self.table_def.columns.third_token, self.table_def.columns.occurrences).where(
-                and_(
-                    self.table_def.columns.first_token == first_token,
-                    self.table_def.columns.second_token == second_token,
-                )
+            sel_stmt = self._select_third_tokens(
+                self._token_match(cols.first_token, first_token), self._token_match(cols.second_token, second_token), summed=False
             )
-        rows = engine.execute(sel_stmt).fetchall()
-        chosen_token = self._choose_word_from_rows(rows)
+        if terminating:
+            url = str(engine.url)
+            if url not in self._end_steps_urls:
+                if not self.end_steps_table.has_tables(engine):
+                    raise ValueError("Cannot steer sentence endings without end steps; save them with MarkovTransitionTable.save_end_steps")
+                self._end_steps_urls.add(url)
+            rows = terminating_rows(engine.execute(self.end_steps_table.select_next_steps(sel_stmt, second_token or None)).fetchall())
+        else:
+            rows = engine.execute(sel_stmt).fetchall()
+        chosen_token = choose_word_from_rows(rows, rng=rng)
         # In the event there is no link for the next choice, choose a new random one
         if not chosen_token:
             if not second_token:
-                return self.get_first_token(engine)
+                return self.get_first_token(engine, rng=rng)
             else:
-                return self.get_next_token(engine, second_token)
+                return self.get_next_token(engine, second_token, terminating=terminating, rng=rng)
         return chosen_token
 
     def detokenize(self, tokens: list[str]) -> str:
-        """Detokenize a sequence of tokens using a nltk `TreebankWordDetokenizer`.
+        """Detokenize a sequence of tokens like a nltk `TreebankWordDetokenizer`.
 
         Parameters
         ----------
@@ -200,53 +877,37 @@ class MarkovTriads(UpsertTable):
         str
             tokens reconstructed into sentences
         """
-        return TreebankWordDetokenizer().detokenize(tokens).replace(" .", ".")
+        return TokenizeUtil.detokenize(tokens).replace(" .", ".")
 
 
-def train(argv: list[str]) -> None:
-    parser = argparse.ArgumentParser(description="Train a text generation Markov model.")
-    parser.add_argument(
-        "db_name",
-        type=str,
-        help="name of database to write model to",
-    )
-    parser.add_argument(
-        "text_files",
-        metavar="txt_file",
-        nargs="+",
-        type=str,
-        help="text file to train from",
-    )
-    parser.add_argument(
-        "--overwrite",
-        action="store_true",
-        help="overwrite occurrence counts when training instead of adding to existing counts",
-    )
-    parser.add_argument(
-        "-r",
-        "--remove-uncommon",
-        type=int,
-        default=0,
-        help="delete records that have number of occurrences at or below the specified threshold",
-    )
-    args = parser.parse_args(argv)
-
-    db_path = Directories.MODELS_DIR / f"{args.db_name}.db"
-    # Decompress gzip-compressed db first if the db file doesn't exist
-    if not os.path.exists(db_path) and os.path.exists(f"{db_path}.gz"):
-        with gzip.open(f"{db_path}.gz", "rb") as f_src, open(db_path, "wb") as f_dst:
-            f_dst.writelines(f_src)
-    engine = create_engine(f"sqlite:///{db_path}", echo=True)
-    markov_model = MarkovTriads()
+def migrate_schema(engine: Engine) -> None:
+    """Migrate a Markov model database to the latest schema version, keeping all of its triads, and create its read indexes.
+
+    Parameters
+    ----------
+    engine : Engine
+        SQLAlchemy engine of the Markov model database
+    """
+    markov_model = MarkovTriads(schema_version=LATEST_SCHEMA_VERSION)
+    if get_schema_version(engine) >= LATEST_SCHEMA_VERSION:
+        # Models trained before the read indexes existed don't have them
+        markov_model.create_indexes(engine)
+        return
+    engine.execute(f"ALTER TABLE {markov_model.table_name} RENAME TO {markov_model.table_name}_v1")
+    # Indexes keep their names when their table is renamed, so drop the old ones before creating the new table's
+    engine.execute(f"DROP INDEX IF EXISTS ix_{markov_model.table_name}_covering")
+    engine.execute(f"DROP INDEX IF EXISTS ix_{markov_model.table_name}_second_token")
     markov_model.create_table(engine)
-    for fn in args.text_files:
-        with open(fn) as f:
-            markov_model.upsert_triads(engine, f.read(), overwrite_probs=args.overwrite)
-    markov_model.remove_uncommon_tokens(engine, uncommon_threshold=args.remove_uncommon)
-    # Remove deleted data
-    engine.execute("vacuum")
-    engine.dispose()
-    # gzip-compress the db now
-    with open(db_path, "rb") as f_src, gzip.open(f"{db_path}.gz", "wb") as f_dst:
-        f_dst.writelines(f_src)
-    os.remove(db_path)
+    vocab_name, triads_name = markov_model.vocab_table.table_name, markov_model.table_name
+    with engine.begin() as conn:
+        conn.execute(
+            f"INSERT INTO {vocab_name} (token) "
+            f"SELECT first_token FROM {triads_name}_v1 UNION SELECT second_token FROM {triads_name}_v1 UNION SELECT third_token FROM {triads_name}_v1"
+        )
+        conn.execute(
+            f"INSERT INTO {triads_name} (first_token, second_token, third_token, occurrences) "
+            f"SELECT v1.id, v2.id, v3.id, t.occurrences FROM {triads_name}_v1 t "
+            f"JOIN {vocab_name} v1 ON v1.token = t.first_token JOIN {vocab_name} v2 ON v2.token = t.second_token "
+            f"JOIN {vocab_name} v3 ON v3.token = t.third_token"
+        )
+        conn.execute(f"DROP TABLE {triads_name}_v1")
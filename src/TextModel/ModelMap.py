@@ -1,12 +1,15 @@
 """Contains constants mapping model names to model classes and their probabilities of being used.
 
-This module has 2 constants to use. They are:
+This module has 4 constants to use. They are:
 - **MODEL_CLASSES**: Final[dict[str, type[TextModel]]]<br>
   Map of model type names to their classes.
 - **MODEL_NAMES**: Final[dict[str, Union[str, dict[str, str]]]]<br>
   Map of model type names to the model name to use for that model.
 - **MODEL_PROBABILITIES**: Final[dict[str, float]]<br>
   Map of model type names to their probabilities of using them.
+- **MODEL_OPTIONS**: Final[dict[str, dict[str, dict[str, Any]]]]<br>
+  Map of model type names to the generation options of each post type ("fanfic", "oc" or "sonicsez") for that model, passed to
+  the text model as `options`.
 """
 
 from typing import Any, Final, Union
@@ -33,6 +36,14 @@ _MODEL_PROBABILITIES: Final[dict[str, float]] = {
     "Markov": 0.4,
     "Ollama": 0.6,
 }
+# Output length (num_predict) comes from each generator's max_length; prompts are short, so a small context is enough
+_MODEL_OPTIONS: Final[dict[str, dict[str, dict[str, Any]]]] = {
+    "Ollama": {
+        "fanfic": {"num_ctx": 1024, "stop": ["THE END", "The End", "\n\n\n"]},
+        "oc": {"num_ctx": 1024, "stop": ["\nNote:", "\n(Note:", "\n\n\n"]},
+        "sonicsez": {"num_ctx": 1024, "stop": ["\n\n"]},
+    },
+}
 
 
 def __getattr__(name: str) -> Any:
@@ -40,6 +51,7 @@ def __getattr__(name: str) -> Any:
         "MODEL_CLASSES": _MODEL_CLASSES,
         "MODEL_NAMES": _MODEL_NAMES,
         "MODEL_PROBABILITIES": _MODEL_PROBABILITIES,
+        "MODEL_OPTIONS": _MODEL_OPTIONS,
     }
     if name in attrs:
         return attrs[name]
@@ -1,28 +1,125 @@
+import json
+import logging
+import math
 import os
+import re
 import requests
-from typing import Any, Optional
+import threading
+from typing import Any, ClassVar, Optional
 from unidecode import unidecode
 
+from .GenerationState import GenerationState
+from . import HedgedRequests, PromptCache
 from .TextModel import TextModel
 from src.Errors import OllamaError
+from src.Util import HTTPUtil
+
+_logger = logging.getLogger(__name__)
+
+REFUSAL_PHRASES: tuple[str, ...] = ("ai language", "model", "i can't assist", "i can't help", "i don't understand", "unable", "not possible")
+"""Lowercase phrases that mark a response as a refusal or a non-answer when they're in its start."""
+
+
+_SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*(?=\s|$)")
+
+
+def _clean_response(text: str) -> str:
+    """Transliterate a response to ASCII and strip surrounding whitespace and quotes."""
+    return unidecode(text).strip().strip('"')
+
+
+def _float_env(name: str) -> Optional[float]:
+    """Get an environment variable as a float, or none if it isn't set."""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def _strip_incomplete_sentence(text: str) -> str:
+    """Cut off the text after its last complete sentence, if it has one."""
+    ends = [match.end() for match in _SENTENCE_END_RE.finditer(text)]
+    return text[: ends[-1]] if ends else text
+
+
+def _is_bad_start(result_start: str) -> bool:
+    """Check whether the start of a response says the model can't do that, or prefaces the actual response."""
+    return (
+        result_start.startswith("Sorry,")
+        or result_start.startswith("Sure")
+        or "As " in result_start
+        or any(phrase in result_start.lower() for phrase in REFUSAL_PHRASES)
+    )
 
 
 class OllamaTextModel(TextModel):
-    """Text model that uses a local Ollama instance to generate text."""
+    """Text model that uses a local Ollama instance to generate text.
+
+    Responses are streamed, so a response whose start is a refusal or a preface (like "Sorry," or "As an AI") is cancelled as soon
+    as its first `START_CHECK_CHARS` characters arrive instead of after the whole response is generated.
+
+    Generation options in `options` (e.g. `stop` sequences and `num_ctx`) are sent as Ollama's `options`, and `max_length` in words
+    is sent as the `num_predict` token budget unless `options` has one. Responses cut off by the budget end at their last complete
+    sentence.
 
-    def __init__(self, model_name: str, **kwargs: Any):
+    With hedging (`hedge_candidates` above 1), several candidate generations run at once and the first good one is used; the rest are
+    cancelled.
+
+    Completions go through the `PromptCache`, keyed by the model name, prompt and `options`.
+    """
+
+    MAX_ATTEMPTS: ClassVar[int] = 10
+    """Max number of generations to try before giving up."""
+    START_CHECK_CHARS: ClassVar[int] = 50
+    """Number of characters at the start of a response that are checked for refusals."""
+    MIN_RESPONSE_CHARS: ClassVar[int] = 40
+    """Responses with at most this many characters are rejected."""
+    TOKENS_PER_WORD: ClassVar[float] = 1.4
+    """Approximate number of tokens per generated word, to turn `max_length` into `num_predict`."""
+
+    def __init__(
+        self,
+        model_name: str,
+        hedge_candidates: Optional[int] = None,
+        hedge_delay: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        **kwargs: Any,
+    ):
         """Create an `OllamaTextModel`.
 
         Parameters
         ----------
         model_name : str
             name of the model, see https://github.com/ollama/ollama?tab=readme-ov-file#model-library
+        hedge_candidates : Optional[int], optional
+            max number of candidate generations to run at once, by default environment variable `OLLAMA_HEDGE_CANDIDATES` or 1,
+            which tries them one after another
+        hedge_delay : Optional[float], optional
+            seconds to wait after starting a candidate before starting another one while it runs, or none to start them all at once;
+            by default environment variable `OLLAMA_HEDGE_DELAY` or none
+        hedge_percentile : Optional[float], optional
+            if set, wait for this percentile of the latencies of earlier successful generations of the model in this process instead
+            of `hedge_delay`, once there are any; by default environment variable `OLLAMA_HEDGE_PERCENTILE` or none
         """
         super().__init__(model_name, **kwargs)
         self.__model_name = model_name
         self.restore_prompt = False
+        self.hedge_candidates = hedge_candidates if hedge_candidates is not None else int(os.getenv("OLLAMA_HEDGE_CANDIDATES", 1))
+        self.hedge_delay = hedge_delay if hedge_delay is not None else _float_env("OLLAMA_HEDGE_DELAY")
+        self.hedge_percentile = hedge_percentile if hedge_percentile is not None else _float_env("OLLAMA_HEDGE_PERCENTILE")
+
+    def _request_options(self) -> dict[str, Any]:
+        """Get the Ollama `options` to generate with.
 
-    def get_next_word(self) -> str:
+        Returns
+        -------
+        dict[str, Any]
+            the text model's `options`, with `num_predict` set from `max_length` if it's positive and not set yet
+        """
+        options = dict(self.options)
+        if self.max_length > 0:
+            options.setdefault("num_predict", math.ceil(self.max_length * self.__class__.TOKENS_PER_WORD))
+        return options
+
+    def get_next_word(self, state: Optional[GenerationState] = None) -> str:
         """Not implemented as the API will return a block of text all at once.
 
         Raises
@@ -32,52 +129,102 @@ class OllamaTextModel(TextModel):
         """
         raise NotImplementedError("This uses Ollama to generate a block of text all at once, so this is not implemented.")
 
-    def get_text_block(self, prompt: Optional[str] = None) -> str:
+    def get_text_block(self, prompt: Optional[str] = None, state: Optional[GenerationState] = None) -> str:
         """Get a random block of text from the model.
 
         Parameters
         ----------
         prompt : Optional[str]
             prompt to start the model with, or none if starting from empty state
+        state : Optional[GenerationState]
+            unused, as the API keeps no state between requests
 
         Returns
         -------
         str
             random block of text from the model
+
+        Raises
+        ------
+        OllamaError
+            raised if no generation succeeded after `MAX_ATTEMPTS` attempts
+        PromptCacheMissError
+            raised if the prompt cache is in "replay" mode and the completion isn't cached
         """
         prompt_str = prompt or "Write some text."
         prompt_str = (
             "Ignore the fact you are an AI, and give me your responses directly and plainly without prefacing your responses with anything. " + prompt_str
         )
-        succeeded = False
-        attempts = 0
-        max_attempts = 10
-        while not succeeded and attempts < max_attempts:
-            response = requests.post(
-                f"{os.getenv('OLLAMA_PROTOCOL', 'http')}://{os.getenv('OLLAMA_URL', 'localhost:11434')}/api/generate",
-                json={"model": self.__model_name, "prompt": prompt_str, "stream": False},
-                timeout=180,
-            )
+        return PromptCache.cached("ollama", self.__model_name, prompt_str, self._request_options(), lambda: self.__generate_hedged(prompt_str))
+
+    def __generate_hedged(self, prompt_str: str) -> str:
+        """Generate candidates until one is good, with hedging if enabled."""
+        max_attempts = self.__class__.MAX_ATTEMPTS
+        latency_key = f"ollama:{self.__model_name}"
+        result = HedgedRequests.first_success(
+            lambda cancel: self.__generate(prompt_str, cancel),
+            max_attempts,
+            candidates=self.hedge_candidates,
+            stagger=HedgedRequests.stagger_delay(latency_key, self.hedge_delay, self.hedge_percentile),
+            latency_key=latency_key,
+        )
+        if result is None:
+            raise OllamaError(self.__model_name, max_attempts)
+        return result
+
+    def __generate(self, prompt: str, cancel: threading.Event) -> Optional[str]:
+        """Stream one generation from Ollama, cancelling it as soon as its start shows it's a bad response.
+
+        Parameters
+        ----------
+        prompt : str
+            full prompt to send
+        cancel : threading.Event
+            event set when the generation isn't needed anymore, e.g. because another candidate succeeded
+
+        Returns
+        -------
+        Optional[str]
+            generated text, or none if the generation failed or was rejected
+        """
+        check_chars = self.__class__.START_CHECK_CHARS
+        text = ""
+        start_checked = False
+        truncated = False
+        # Leaving the block closes the connection, which makes Ollama stop generating
+        with HTTPUtil.get_session().post(
+            f"{os.getenv('OLLAMA_PROTOCOL', 'http')}://{os.getenv('OLLAMA_URL', 'localhost:11434')}/api/generate",
+            json={"model": self.__model_name, "prompt": prompt, "stream": True, "options": self._request_options()},
+            stream=True,
+            timeout=180,
+        ) as response:
             if not response.ok:
-                print(response.text)
-                attempts += 1
-                continue
-            result = unidecode(response.json()["response"]).strip().strip('"')
-            # Ensure that we don't get a response saying the model can't do that
-            result_start = result[:50]
-            is_bad_response = (
-                len(result) <= 40
-                or result.startswith("Sorry,")
-                or result.startswith("Sure")
-                or "As " in result_start
-                or any(
-                    phrase in result_start.lower()
-                    for phrase in ("ai language", "model", "i can't assist", "i can't help", "i don't understand", "unable", "not possible")
-                )
-            )
-            succeeded = not is_bad_response
-            if not succeeded:
-                attempts += 1
-        if not succeeded:
-            raise OllamaError(f"Failed to get text block from Ollama after {max_attempts} attempts")
+                _logger.warning(f"Ollama returned {response.status_code}: {response.text}")
+                return None
+            try:
+                for line in response.iter_lines():
+                    if cancel.is_set():
+                        return None
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        _logger.warning(f"Ollama failed while generating: {chunk['error']}")
+                        return None
+                    text += chunk.get("response", "")
+                    if chunk.get("done"):
+                        truncated = chunk.get("done_reason") == "length"
+                        break
+                    # Check the start of the response as soon as there's enough of it
+                    if not start_checked and len(start := _clean_response(text)) >= check_chars:
+                        if _is_bad_start(start[:check_chars]):
+                            _logger.info("Rejected Ollama response early: %r", start[:check_chars])
+                            return None
+                        start_checked = True
+            except (requests.exceptions.ChunkedEncodingError, json.JSONDecodeError) as e:
+                _logger.warning(f"Ollama response stream broke off: {e}")
+                return None
+        result = _clean_response(_strip_incomplete_sentence(text) if truncated else text)
+        if len(result) <= self.__class__.MIN_RESPONSE_CHARS or _is_bad_start(result[:check_chars]):
+            return None
         return result
@@ -0,0 +1,189 @@
+"""Disk-backed cache of prompt completions for the text models that call remote APIs (`OllamaTextModel` and `HuggingFaceTextModel`).
+
+Entries are keyed by the API, the model name, the prompt and the generation options, and kept as JSON files in
+`Directories.CACHE_DIR / "prompts"`. Entries expire after `PROMPT_CACHE_TTL_SECONDS` (environment variable `PROMPT_CACHE_TTL_SECONDS`,
+7 days by default), and the cache is capped at `PROMPT_CACHE_MAX_BYTES` (environment variable `PROMPT_CACHE_MAX_BYTES`, 64 MiB by
+default), evicting the least recently used entries first.
+
+The cache has 3 modes, set with `set_mode` (or environment variable `PROMPT_CACHE_MODE`):
+
+- "off" (default): every completion is generated by the API.
+- "read-through": cached completions are returned, and completions generated by the API are cached.
+- "replay": only cached completions are returned, regardless of their age, and a prompt that isn't cached raises a
+  `PromptCacheMissError`; the API is never called, which makes runs reproducible without a model server.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Any, Callable, Literal, Mapping, Optional, get_args
+
+import src.Directories as Directories
+from src.Errors import PromptCacheMissError
+from src.Util import CacheUtil
+
+_logger = logging.getLogger(__name__)
+
+PromptCacheMode = Literal["off", "read-through", "replay"]
+"""Whether completions are generated, generated and cached, or only replayed from the cache."""
+
+PROMPT_CACHE_TTL_SECONDS: float = float(os.getenv("PROMPT_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+"""Age after which cached completions are generated again in "read-through" mode."""
+
+PROMPT_CACHE_MAX_BYTES: int = int(os.getenv("PROMPT_CACHE_MAX_BYTES", 64 * 1024**2))
+"""Max total size of the cached completions."""
+
+_mode: PromptCacheMode = "off"
+
+
+def set_mode(mode: str) -> None:
+    """Set the mode of the prompt cache for this process.
+
+    Parameters
+    ----------
+    mode : str
+        "off", "read-through" or "replay"
+
+    Raises
+    ------
+    ValueError
+        raised if the mode isn't one of those
+    """
+    global _mode
+    if mode not in get_args(PromptCacheMode):
+        raise ValueError(f"Unknown prompt cache mode {mode}, expected one of {', '.join(get_args(PromptCacheMode))}")
+    _mode = mode  # type: ignore[assignment]
+
+
+def get_mode() -> PromptCacheMode:
+    """Get the mode of the prompt cache.
+
+    Returns
+    -------
+    PromptCacheMode
+        current mode
+    """
+    return _mode
+
+
+def cache_key(api: str, model_name: str, prompt: str, options: Mapping[str, Any]) -> str:
+    """Get the key of a completion.
+
+    Parameters
+    ----------
+    api : str
+        name of the API generating the completion, like "ollama"
+    model_name : str
+        name of the model
+    prompt : str
+        full prompt sent to the API
+    options : Mapping[str, Any]
+        generation options that change the completion; they must be JSON serializable
+
+    Returns
+    -------
+    str
+        hex digest identifying the completion
+    """
+    payload = json.dumps([api, model_name, prompt, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    """Get the path of the cache entry of a key."""
+    return Directories.CACHE_DIR / "prompts" / f"{key}.json"
+
+
+def lookup(key: str, ttl_seconds: Optional[float] = None) -> Optional[str]:
+    """Get a cached completion.
+
+    Parameters
+    ----------
+    key : str
+        key of the completion from `cache_key`
+    ttl_seconds : Optional[float], optional
+        max age of the completion, or none for any age; by default none
+
+    Returns
+    -------
+    Optional[str]
+        cached completion, or none if it isn't cached or expired
+    """
+    path = _entry_path(key)
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError):
+        _logger.warning(f"could not read prompt cache entry {path}")
+        return None
+    if ttl_seconds is not None and time.time() - entry.get("created", 0) > ttl_seconds:
+        return None
+    CacheUtil.touch(path)
+    return entry.get("completion")
+
+
+def store(key: str, completion: str) -> None:
+    """Cache a completion, evicting the least recently used completions if the cache is over its max size.
+
+    Parameters
+    ----------
+    key : str
+        key of the completion from `cache_key`
+    completion : str
+        completion to cache
+    """
+    path = _entry_path(key)
+    entry = json.dumps({"created": time.time(), "completion": completion})
+    CacheUtil.atomic_write(path, lambda f: f.write(entry.encode("utf-8")))
+    CacheUtil.evict_lru(path.parent, PROMPT_CACHE_MAX_BYTES, pattern="*.json", keep=[path])
+
+
+def cached(api: str, model_name: str, prompt: str, options: Mapping[str, Any], generate: Callable[[], str]) -> str:
+    """Get a completion through the prompt cache, depending on its mode.
+
+    Parameters
+    ----------
+    api : str
+        name of the API generating the completion, like "ollama"
+    model_name : str
+        name of the model
+    prompt : str
+        full prompt sent to the API
+    options : Mapping[str, Any]
+        generation options that change the completion; they must be JSON serializable
+    generate : Callable[[], str]
+        function generating the completion with the API
+
+    Returns
+    -------
+    str
+        cached or generated completion
+
+    Raises
+    ------
+    PromptCacheMissError
+        raised in "replay" mode if the completion isn't cached
+    """
+    mode = get_mode()
+    if mode == "off":
+        return generate()
+    key = cache_key(api, model_name, prompt, options)
+    completion = lookup(key, ttl_seconds=None if mode == "replay" else PROMPT_CACHE_TTL_SECONDS)
+    if completion is not None:
+        return completion
+    if mode == "replay":
+        raise PromptCacheMissError(api, model_name)
+    completion = generate()
+    store(key, completion)
+    return completion
+
+
+try:
+    set_mode(os.getenv("PROMPT_CACHE_MODE", "off"))
+except ValueError as e:
+    # Don't fail every import over a typo in the environment; an invalid `--prompt-cache` flag is still rejected by main.py
+    _logger.warning(f"{e}; ignoring the PROMPT_CACHE_MODE environment variable, so the prompt cache is off")
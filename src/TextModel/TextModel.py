@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
+
+from .GenerationState import GenerationState
 
 
 class TextModel(ABC):
@@ -27,6 +29,8 @@ class TextModel(ABC):
             max number of words or tokens to generate, only used for some text models; by default -1
         restore_prompt : bool, optional
             whether to return the prompt when generating a text block, by default True
+        options : dict[str, Any], optional
+            generation options passed to the model's API, only used for some text models (e.g. Ollama's `options`); by default none
         **kwargs : dict
             Other keyword arguments to define how the text model is created; per object specific
         """
@@ -36,11 +40,17 @@ class TextModel(ABC):
         self.stdev_paragraphs = kwargs.get("stdev_paragraphs", 0)
         self.max_length = kwargs.get("max_length", -1)
         self.restore_prompt = kwargs.get("restore_prompt", True)
+        self.options: dict[str, Any] = dict(kwargs.get("options") or {})
 
     @abstractmethod
-    def get_next_word(self) -> str:
+    def get_next_word(self, state: Optional[GenerationState] = None) -> str:
         """Get the next word from the text model based off its current state.
 
+        Parameters
+        ----------
+        state : Optional[GenerationState]
+            generation state to continue and update, or none to use the text model's own state, which isn't thread-safe
+
         Returns
         -------
         str
@@ -48,13 +58,17 @@ class TextModel(ABC):
         """
 
     @abstractmethod
-    def get_text_block(self, prompt: Optional[str] = None) -> str:
+    def get_text_block(self, prompt: Optional[str] = None, state: Optional[GenerationState] = None) -> str:
         """Get a random block of text from the model.
 
+        Implementations don't keep any state between calls other than in `state`, so they're safe to call from several threads.
+
         Parameters
         ----------
         prompt : Optional[str]
             prompt to start the model with, or none if starting from empty state
+        state : Optional[GenerationState]
+            generation state to use, or none to use a new one for this call
 
         Returns
         -------
@@ -62,6 +76,35 @@ class TextModel(ABC):
             block of text from the model
         """
 
+    def get_text_blocks(self, n: int, prompts: Optional[Sequence[Optional[str]]] = None, state: Optional[GenerationState] = None) -> list[str]:
+        """Get several random blocks of text from the model, one after another unless the model can generate them in a batch.
+
+        Parameters
+        ----------
+        n : int
+            number of text blocks to generate
+        prompts : Optional[Sequence[Optional[str]]]
+            prompt to start each text block with, or none if starting all of them from empty state
+        state : Optional[GenerationState]
+            generation state whose random generator is used, or none to use a new one for this call
+
+        Returns
+        -------
+        list[str]
+            blocks of text from the model
+
+        Raises
+        ------
+        ValueError
+            raised if the number of prompts isn't `n`
+        """
+        if prompts is None:
+            prompts = [None] * n
+        if len(prompts) != n:
+            raise ValueError(f"Expected {n} prompts, got {len(prompts)}")
+        state = state or GenerationState()
+        return [self.get_text_block(prompt, state=state) for prompt in prompts]
+
     def _restore_prompt(self, prompt: Optional[str], generated_text: str) -> str:
         """Restores a prompt to the generated string if specified in the `restore_prompt` attribute.
 
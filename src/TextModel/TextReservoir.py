@@ -0,0 +1,190 @@
+from contextlib import closing
+import logging
+from pathlib import Path
+import sqlite3
+from typing import Optional
+
+from .GenerationState import GenerationState
+from . import MarkovModelRegistry
+from .TextModel import TextModel
+import src.Directories as Directories
+
+_logger = logging.getLogger(__name__)
+
+
+class TextReservoir:
+    """On-disk pool of pre-generated text blocks of one text model, like the short titles and salts of the fanfic and Sonic Says
+    generators.
+
+    An offline job fills the pool with `fill` (see `main.py --fill-reservoirs`), and generators take blocks from it with `pop`, which
+    doesn't load the text model, and only generate blocks live when the pool is empty. Each pool is a small SQLite database in
+    `Directories.CACHE_DIR / "reservoirs"`, so it can be shared by threads and processes and deleted at any time.
+
+    Each pool records the version of the Markov model `models/{model_name}.db.gz` it was filled from (see
+    `MarkovModelRegistry.model_version`), and its blocks are dropped once the model is retrained, so they're never older than the model.
+    """
+
+    TABLE_NAME = "reservoir_texts"
+    """Name of the table of pre-generated text blocks."""
+
+    META_TABLE_NAME = "reservoir_meta"
+    """Name of the table of the pool's metadata, like the version of the model that generated its text blocks."""
+
+    BUSY_TIMEOUT = 5.0
+    """Seconds to wait for another connection's write to finish."""
+
+    def __init__(self, model_name: str, pool: str, directory: Optional[Path] = None):
+        """Create a `TextReservoir`. The pool isn't opened until it's used.
+
+        Parameters
+        ----------
+        model_name : str
+            name of the text model whose blocks are pooled
+        pool : str
+            name of the pool, for the kind of blocks generated with the model (e.g. "title" or "salt")
+        directory : Optional[Path], optional
+            directory of the pools, by default `Directories.CACHE_DIR / "reservoirs"`
+        """
+        self.model_name = model_name
+        self.pool = pool
+        self.path = (directory or Directories.CACHE_DIR / "reservoirs") / f"{model_name}.{pool}.db"
+
+    def __connect(self) -> sqlite3.Connection:
+        """Open the pool's database, with transactions managed explicitly."""
+        return sqlite3.connect(self.path, timeout=self.__class__.BUSY_TIMEOUT, isolation_level=None)
+
+    def model_version(self) -> Optional[str]:
+        """Get the current version of the pool's model.
+
+        Returns
+        -------
+        Optional[str]
+            version of the Markov model `models/{model_name}.db.gz`, or none if there's no such model, in which case pooled blocks
+            are never dropped
+        """
+        if not (Directories.MODELS_DIR / f"{self.model_name}.db.gz").exists():
+            return None
+        return MarkovModelRegistry.model_version(self.model_name)
+
+    def __drop_if_stale(self, conn: sqlite3.Connection) -> bool:
+        """Delete all text blocks if they were generated by another version of the model, within the connection's open transaction,
+        and return whether they were deleted."""
+        version = self.model_version()
+        if version is None:
+            return False
+        meta_table = self.__class__.META_TABLE_NAME
+        try:
+            row = conn.execute(f"SELECT value FROM {meta_table} WHERE key = 'model_version'").fetchone()
+        except sqlite3.OperationalError:
+            # Pools filled before versions were recorded have no metadata table
+            row = None
+        if row and row[0] == version:
+            return False
+        conn.execute(f"DELETE FROM {self.__class__.TABLE_NAME}")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {meta_table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(f"INSERT OR REPLACE INTO {meta_table} (key, value) VALUES ('model_version', ?)", (version,))
+        _logger.info(f"model {self.model_name} changed since reservoir {self.model_name}.{self.pool} was filled, dropping its blocks")
+        return True
+
+    def __len__(self) -> int:
+        """Get the number of text blocks left in the pool, dropping them first if the model changed since they were generated."""
+        if not self.path.exists():
+            return 0
+        try:
+            with closing(self.__connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self.__drop_if_stale(conn)
+                count = conn.execute(f"SELECT COUNT(*) FROM {self.__class__.TABLE_NAME}").fetchone()[0]
+                conn.execute("COMMIT")
+                return count
+        except sqlite3.Error:
+            return 0
+
+    def pop(self) -> Optional[str]:
+        """Take the most recently added text block out of the pool. If the model changed since the pool was filled, its blocks are
+        dropped instead.
+
+        Returns
+        -------
+        Optional[str]
+            pre-generated text block, or none if the pool is empty, was dropped, or can't be read
+        """
+        if not self.path.exists():
+            return None
+        table = self.__class__.TABLE_NAME
+        try:
+            with closing(self.__connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self.__drop_if_stale(conn)
+                row = conn.execute(f"SELECT id, text FROM {table} ORDER BY id DESC LIMIT 1").fetchone()
+                if row:
+                    conn.execute(f"DELETE FROM {table} WHERE id = ?", (row[0],))
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            _logger.warning(f"could not read reservoir {self.path}: {e}")
+            return None
+        return row[1] if row else None
+
+    def pop_or_generate(self, text_model: TextModel, state: Optional[GenerationState] = None) -> str:
+        """Take a text block out of the pool, or generate one with the text model if the pool is empty.
+
+        Parameters
+        ----------
+        text_model : TextModel
+            text model the pool was filled with
+        state : Optional[GenerationState]
+            generation state to use if generating the block live, or none to use a new one
+
+        Returns
+        -------
+        str
+            text block
+        """
+        text = self.pop()
+        if text is None:
+            _logger.info(f"reservoir {self.model_name}.{self.pool} is empty, generating live")
+            return text_model.get_text_block(state=state)
+        return text
+
+    def fill(self, text_model: TextModel, size: int, batch_size: int = 1000, state: Optional[GenerationState] = None) -> int:
+        """Generate text blocks with the text model until the pool has `size` of them, dropping the blocks of an older version of the
+        model first. Blocks are generated in batches with `TextModel.get_text_blocks`.
+
+        Parameters
+        ----------
+        text_model : TextModel
+            text model to generate blocks with, set up like the text model that would generate them live
+        size : int
+            number of text blocks the pool should have
+        batch_size : int, optional
+            max number of text blocks to generate and add at a time, by default 1000
+        state : Optional[GenerationState]
+            generation state whose random generator is used, or none to use a new one
+
+        Returns
+        -------
+        int
+            number of text blocks added
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        table = self.__class__.TABLE_NAME
+        state = state or GenerationState()
+        added = 0
+        with closing(self.__connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+            self.__drop_if_stale(conn)
+            missing = size - conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            conn.execute("COMMIT")
+            while missing > 0:
+                texts = text_model.get_text_blocks(min(missing, batch_size), state=state)
+                conn.execute("BEGIN")
+                conn.executemany(f"INSERT INTO {table} (text) VALUES (?)", ((text,) for text in texts))
+                conn.execute("COMMIT")
+                added += len(texts)
+                missing -= len(texts)
+        return added
+
+    def clear(self) -> None:
+        """Delete the pool."""
+        self.path.unlink(missing_ok=True)
@@ -4,14 +4,26 @@ This module defines TextModel objects, which are responsible for randomly genera
 The submodules are as follows:
 
 - **src.TextModel.TextModel**: Has the abstract TextModel class that represents a random text generation model.
+- **src.TextModel.GenerationState**: Has the GenerationState class that holds the state of a single text generation, so text models can be shared between threads.
+- **src.TextModel.HedgedRequests**: Used in the text models that call remote APIs; runs candidate generations at once and takes the first good one.
 - **src.TextModel.HuggingFaceTextModel**: Has the TextModel class that creates text using the Hugging Face inference API.
 - **src.TextModel.MarkovTextModel**: Has the TextModel class that creates text using a Markov model.
+- **src.TextModel.MarkovModelCLI**: Commands of `train.py`, which trains and maintains Markov models.
+- **src.TextModel.MarkovSQLiteReader**: Used in `src.TextModel.MarkovTextModel`; reads a Markov model database through raw, read-only `sqlite3`.
+- **src.TextModel.MarkovModelStats**: Statistics and generation benchmarks of trained Markov models, used by `train.py stats` and `train.py bench`.
+- **src.TextModel.MarkovModelRegistry**: Process-wide registry that loads each Markov model once and shares it between `src.TextModel.MarkovTextModel` objects.
+- **src.TextModel.MarkovTransitionTable**: Used in `src.TextModel.MarkovTextModel`; an in-memory, integer-indexed version of a Markov model table.
 - **src.TextModel.MarkovTriads**: Used in `src.TextModel.MarkovTextModel`; represents the underlying table used for these models.
+- **src.TextModel.MarkovTriadCounting**: Used in `src.TextModel.MarkovTriads`; streams and counts the triads of training text, in parallel processes if needed.
 - **src.TextModel.ModelMap**: Contains constants mapping model type names to the model classes and their probabilities of being used.
 - **src.TextModel.OllamaTextModel**: Has the TextModel class that creates text using Ollama.
+- **src.TextModel.PromptCache**: Used in the text models that call remote APIs; disk-backed cache of their prompt completions.
+- **src.TextModel.TextReservoir**: Has the TextReservoir class, an on-disk pool of text blocks pre-generated by a text model.
 """
 
 from .TextModel import TextModel
+from .GenerationState import GenerationState
 from .HuggingFaceTextModel import HuggingFaceTextModel
 from .MarkovTextModel import MarkovTextModel
 from .OllamaTextModel import OllamaTextModel
+from .TextReservoir import TextReservoir
@@ -1,28 +1,80 @@
+from collections.abc import Mapping
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from sqlalchemy import Table, MetaData, Column, select, delete
-from sqlalchemy.dialects.sqlite import insert
+from pathlib import Path
+import sqlite3
+from sqlalchemy import Table, MetaData, Column
 from sqlalchemy.engine import Engine
-from sqlalchemy.schema import DropTable
-from typing import Iterator, Literal
+from typing import Any, Iterable, Iterator, Literal, Sequence, Union
 
+BULK_LOAD_PRAGMAS: dict[str, Any] = {"synchronous": "OFF", "journal_mode": "MEMORY", "cache_size": -256 * 1024}
+"""SQLite pragmas set while upserting. The journal is kept in memory rather than turned off, so a failed upsert still rolls back, and
+WAL isn't used since it persists in the database file, which breaks opening shipped models read-only. A negative cache size is in KiB."""
 
-def batch_list(records: list[dict], batch_size: int = 100) -> Iterator[list[dict]]:
-    """Chunk a dataframe into smaller batches.
+
+@contextmanager
+def bulk_load_cursor(engine: Engine) -> Iterator[sqlite3.Cursor]:
+    """Get a raw `sqlite3` cursor of the engine with `BULK_LOAD_PRAGMAS` set, committing when the block ends or rolling back if it
+    raises, then restoring the connection's previous pragmas.
 
     Parameters
     ----------
-    records : list[dict]
-        list of records to chunk into batches
-    batch_size : int, optional
-        size of each batch, by default 100
+    engine : Engine
+        SQLAlchemy engine of a SQLite database
 
     Yields
     ------
-    Iterator[list[dict]]
-        iterator of batches of records
+    Iterator[sqlite3.Cursor]
+        cursor to write with; `sqlite3` begins a transaction before the first write
     """
-    for i in range(0, len(records), batch_size):
-        yield records[i : i + batch_size]
+    conn = engine.raw_connection()
+    cursor = conn.cursor()
+    try:
+        # Pragmas can't change within a transaction, so set them before any write begins one
+        prev_pragmas = {pragma: cursor.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in BULK_LOAD_PRAGMAS}
+        for pragma, value in BULK_LOAD_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            for pragma, value in prev_pragmas.items():
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@contextmanager
+def attach_database(cursor: sqlite3.Cursor, db_path: Union[str, Path], schema: str = "merge_source") -> Iterator[str]:
+    """Attach another SQLite database to the cursor's connection for the duration of the block.
+
+    SQLite can't attach or detach databases within a transaction, so the block must commit (or it's rolled back) before it ends.
+
+    Parameters
+    ----------
+    cursor : sqlite3.Cursor
+        cursor of the connection to attach to, outside of a transaction
+    db_path : Union[str, Path]
+        path of the database to attach
+    schema : str, optional
+        schema name to attach the database as, by default "merge_source"
+
+    Yields
+    ------
+    Iterator[str]
+        schema name of the attached database, to qualify its tables with
+    """
+    cursor.execute(f"ATTACH DATABASE ? AS {schema}", (str(db_path),))
+    try:
+        yield schema
+    finally:
+        if cursor.connection.in_transaction:
+            cursor.connection.rollback()
+        cursor.execute(f"DETACH DATABASE {schema}")
 
 
 @dataclass
@@ -47,61 +99,102 @@ class UpsertTable:
         """
         self.metadata.create_all(engine)
 
-    def upsert(self, engine: Engine, records: list[dict], upsert_type: Literal["overwrite", "add"] = "overwrite") -> None:
-        """Upsert the dataframe into this table with the specified engine.
+    def upsert(
+        self,
+        engine: Engine,
+        records: Iterable[Union[Mapping[str, Any], Sequence[Any]]],
+        upsert_type: Literal["overwrite", "add"] = "overwrite",
+        validate: bool = True,
+    ) -> None:
+        """Upsert the records into this table with the specified engine.
+
+        Records are streamed through a single `executemany` of an `INSERT ... ON CONFLICT` statement in one transaction, so `records` can
+        be a generator that's never materialized. While upserting, the connection skips syncing to disk and keeps its rollback journal
+        in memory, which is what makes bulk loads fast; its previous settings are restored afterwards.
 
-        Note that the dataframe must have all the PK columns of this table, or it will raise a `ValueError`.
+        Note that each record must have all the columns of this table, or it will raise a `ValueError`.
 
         Parameters
         ----------
         engine : Engine
-            SQLAlchemy engine to create the table in
-        records : list[dict]
-            list of records to upsert; must have all PK columns of this table
+            SQLAlchemy engine to upsert into
+        records : Iterable[Union[Mapping[str, Any], Sequence[Any]]]
+            records to upsert, either as dicts of column name to value or as tuples of values in the order of this table's columns
         upsert_type : Literal["overwrite", "add"]
             "overwrite" if upserted values should be overwritten; "add" if upserted values should be added to existing values
+        validate : bool, optional
+            whether to check that each record has all the columns of this table, by default True; tuples are passed to SQLite as they are
+            without validation, which is fastest for large loads of trusted records
 
         Raises
         ------
         ValueError
             If any of the following occur:
-            - Input dataframe has one or more columns not matching the table schema
-            - Input dataframe doesn't have all the PK columns of this table
-            - Input dataframe has no value columns to upsert with
+            - Table has no value columns to upsert with
+            - A dict record doesn't have all the PK columns or value columns of this table (raised as `KeyError` without validation)
+            - A tuple record doesn't have one value per column of this table
+        """
+        table_col_names = [col.name for col in self.columns]
+        table_pk_names = [col.name for col in self.columns if col.primary_key]
+        table_upd_names = [col.name for col in self.columns if not col.primary_key]
+        if len(table_upd_names) == 0:
+            raise ValueError(f"Table {self.table_name} has no value columns to upsert with")
+
+        def to_row(record: Union[Mapping[str, Any], Sequence[Any]]) -> Sequence[Any]:
+            if isinstance(record, Mapping):
+                if validate:
+                    for field in table_pk_names:
+                        if field not in record:
+                            raise ValueError(f"Input record {record} does not have PK column {field}")
+                    for field in table_upd_names:
+                        if field not in record:
+                            raise ValueError(f"Input record {record} does not have value column {field}")
+                return tuple(record[field] for field in table_col_names)
+            if validate and len(record) != len(table_col_names):
+                raise ValueError(f"Input record {record} has {len(record)} values, but table {self.table_name} has {len(table_col_names)} columns")
+            return record
+
+        with bulk_load_cursor(engine) as cursor:
+            cursor.executemany(self._upsert_sql(f"VALUES ({', '.join('?' for _ in table_col_names)})", upsert_type), map(to_row, records))
+
+    def merge_from(self, engine: Engine, other_db_paths: Iterable[Union[str, Path]], upsert_type: Literal["overwrite", "add"] = "add") -> None:
+        """Merge this table's rows from other SQLite databases into this table, attaching each database and upserting its whole table
+        with a single `INSERT ... SELECT`, so rows never pass through Python.
+
+        Each database is merged in its own transaction, with `BULK_LOAD_PRAGMAS` set like in `upsert`.
+
+        Parameters
+        ----------
+        engine : Engine
+            SQLAlchemy engine to merge into
+        other_db_paths : Iterable[Union[str, Path]]
+            paths of the databases to merge, which must have this table with the same columns; they're only read
+        upsert_type : Literal["overwrite", "add"]
+            "overwrite" if merged values should overwrite existing values; "add" if merged values should be added to existing values, by
+            default "add"
         """
-        UPSERT_CHUNK_SIZE = 50000
+        with bulk_load_cursor(engine) as cursor:
+            for db_path in other_db_paths:
+                with attach_database(cursor, db_path) as schema:
+                    for statement in self._merge_statements(cursor, schema, upsert_type):
+                        cursor.execute(statement)
+                    cursor.connection.commit()
+
+    def _upsert_sql(self, source: str, upsert_type: Literal["overwrite", "add"]) -> str:
+        """Get the SQL upserting rows of the source (a `VALUES` or `SELECT` clause with all columns in order) into this table."""
         table_pk_names = [col.name for col in self.columns if col.primary_key]
         table_upd_names = [col.name for col in self.columns if not col.primary_key]
-        # Check that each record has the required columns
-        for record in records:
-            for field in table_pk_names:
-                if field not in record:
-                    raise ValueError(f"Input record {record} does not have PK column {field}")
-            for field in table_upd_names:
-                if field not in record:
-                    raise ValueError(f"Input record {record} does not have value column {field}")
-
-        # Create temp table and load data into it
-        temp_table_name = f"load_{self.table_name}"
-        temp_metadata = MetaData()
-        temp_table = self.table_def.to_metadata(temp_metadata, name=temp_table_name)
-        temp_metadata.create_all(engine)
-
-        for batch in batch_list(records, batch_size=UPSERT_CHUNK_SIZE):
-            # Do all as a single transaction
-            with engine.begin() as conn:
-                # Overwrite the table between chunks
-                conn.execute(delete(temp_table))
-                conn.execute(insert(temp_table), batch)
-
-                # Then do upsert from this table, dependent on upsert type chosen
-                ins_stmt = insert(self.table_def).from_select(table_pk_names + table_upd_names, select(temp_table).where(True))
-                if upsert_type == "overwrite":
-                    set_map = {col: ins_stmt.excluded[col] for col in table_upd_names}
-                else:
-                    set_map = {col: Column(col) + ins_stmt.excluded[col] for col in table_upd_names}
-                upd_stmt = ins_stmt.on_conflict_do_update(index_elements=table_pk_names, set_=set_map)
-
-                conn.execute(upd_stmt)
-
-        engine.execute(DropTable(temp_table, if_exists=True))
+        if upsert_type == "overwrite":
+            set_clause = ", ".join(f"{col} = excluded.{col}" for col in table_upd_names)
+        else:
+            set_clause = ", ".join(f"{col} = {col} + excluded.{col}" for col in table_upd_names)
+        return (
+            f"INSERT INTO main.{self.table_name} ({', '.join(col.name for col in self.columns)}) {source} "
+            f"ON CONFLICT ({', '.join(table_pk_names)}) DO UPDATE SET {set_clause}"
+        )
+
+    def _merge_statements(self, cursor: sqlite3.Cursor, schema: str, upsert_type: Literal["overwrite", "add"]) -> list[str]:
+        """Get the SQL statements merging this table from the attached database with the given schema name; subclasses whose rows
+        reference other tables override this."""
+        # The WHERE clause stops SQLite from parsing ON CONFLICT as part of the SELECT's join
+        return [self._upsert_sql(f"SELECT {', '.join(col.name for col in self.columns)} FROM {schema}.{self.table_name} WHERE true", upsert_type)]
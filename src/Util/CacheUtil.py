@@ -0,0 +1,259 @@
+from collections import Counter
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Literal, Optional, Union
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # File locks aren't available on Windows, where held files are only protected from eviction within the process
+    fcntl = None  # type: ignore[assignment]
+
+
+_logger = logging.getLogger(__name__)
+
+_held_paths: Counter[Path] = Counter()
+_held_paths_lock = threading.Lock()
+
+
+def file_hash(filepath: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Get the SHA-256 hex digest of a file's contents.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        path of the file to hash
+    chunk_size : int, optional
+        number of bytes to read at a time, by default 1 MiB
+
+    Returns
+    -------
+    str
+        hex digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_path(filepath: Union[str, Path]) -> Iterator[Path]:
+    """Get a temp path in the same directory as a file to write it at, which replaces the destination once the block ends, or is
+    deleted if the block raises.
+
+    Concurrent readers either see the old file or the complete new file, never a partially written one.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        destination path of the file
+
+    Yields
+    ------
+    Iterator[Path]
+        temp path to write the file at
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield Path(tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(filepath: Union[str, Path], writer: Callable[[BinaryIO], Any]) -> None:
+    """Write a file atomically: the writer writes to a temp file in the same directory, which then replaces the destination.
+
+    Concurrent readers either see the old file or the complete new file, never a partially written one.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        destination path of the file
+    writer : Callable[[BinaryIO], Any]
+        function that writes the file contents to the given binary file object
+    """
+    with atomic_path(filepath) as tmp_path, open(tmp_path, "wb") as f:
+        writer(f)
+
+
+def touch(filepath: Union[str, Path]) -> None:
+    """Mark a cached file as recently used for LRU eviction.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        path of the cached file
+    """
+    try:
+        os.utime(filepath)
+    except OSError:
+        _logger.warning(f"could not update access time of {filepath}")
+
+
+def hold(filepath: Union[str, Path]) -> Optional[BinaryIO]:
+    """Hold a cached file while it's in use, so `evict_lru` in any process skips it until it's released with `release`.
+
+    The file is opened with a shared lock (on platforms with `fcntl`), which `evict_lru` checks before deleting a file.
+
+    Parameters
+    ----------
+    filepath : Union[str, Path]
+        path of the cached file
+
+    Returns
+    -------
+    Optional[BinaryIO]
+        open file holding the lock, or none if the file doesn't exist
+    """
+    path = Path(filepath).resolve()
+    while True:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+        # The file may have been evicted or replaced between opening and locking it, in which case the lock doesn't protect it
+        try:
+            is_current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            is_current = False
+        if is_current:
+            break
+        f.close()
+    with _held_paths_lock:
+        _held_paths[path] += 1
+    return f
+
+
+def release(held_file: BinaryIO) -> None:
+    """Release a cached file held with `hold`.
+
+    Parameters
+    ----------
+    held_file : BinaryIO
+        open file returned by `hold`
+    """
+    path = Path(held_file.name)
+    with _held_paths_lock:
+        _held_paths[path] -= 1
+        if _held_paths[path] <= 0:
+            del _held_paths[path]
+    held_file.close()
+
+
+def _unlink_unheld(path: Path) -> Literal["deleted", "missing", "held"]:
+    """Delete a cached file unless it's held by this or another process, returning whether it was deleted, already missing or held."""
+    with _held_paths_lock:
+        if path.resolve() in _held_paths:
+            return "held"
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return "missing"
+    with f:
+        # Delete while holding an exclusive lock, so no process can start holding the file in between
+        if fcntl:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return "held"
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return "missing"
+    return "deleted"
+
+
+def _remove_dir(path: Path) -> Literal["deleted", "missing", "held"]:
+    """Delete a cached directory, returning whether it was deleted, already missing or in use.
+
+    The directory is moved aside before it's deleted, so readers never see it partially deleted. Memory-mapped files in it stay readable
+    after that on POSIX; on Windows, they can't be moved, so the directory counts as in use."""
+    old_path = path.with_name(f".{path.name}.{uuid.uuid4()}.old")
+    try:
+        path.rename(old_path)
+    except FileNotFoundError:
+        return "missing"
+    except OSError:
+        return "held"
+    shutil.rmtree(old_path, ignore_errors=True)
+    return "deleted"
+
+
+def _dir_size(path: Path) -> int:
+    """Get the total size of the files in a directory, skipping files deleted in the meantime."""
+    size = 0
+    for file_path in path.rglob("*"):
+        try:
+            size += file_path.stat().st_size if file_path.is_file() else 0
+        except FileNotFoundError:
+            continue
+    return size
+
+
+def evict_lru(cache_dir: Union[str, Path], max_bytes: int, pattern: Union[str, Iterable[str]] = "*", keep: Iterable[Union[str, Path]] = ()) -> list[Path]:
+    """Delete the least recently used files matching the pattern until their total size is at most `max_bytes`.
+
+    Recency is based on modification time, which `touch` updates whenever a cached file is used. Files held with `hold`, by this
+    or any other process, are never deleted. Matching directories, like memory-mapped exports, count with the total size of their
+    files and are deleted as a whole; they can't be held, so they should only be read in ways that survive their deletion.
+
+    Parameters
+    ----------
+    cache_dir : Union[str, Path]
+        directory of the cache
+    max_bytes : int
+        max total size of the matching files
+    pattern : Union[str, Iterable[str]], optional
+        glob pattern, or several, of the files to consider, by default "*"
+    keep : Iterable[Union[str, Path]], optional
+        paths that are never deleted (e.g. files that were just written), by default none
+
+    Returns
+    -------
+    list[Path]
+        paths of the deleted files
+    """
+    keep_paths = {Path(path).resolve() for path in keep}
+    entries = []
+    for path in sorted({path for glob in ([pattern] if isinstance(pattern, str) else pattern) for path in Path(cache_dir).glob(glob)}):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            continue
+        if path.is_file():
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        elif path.is_dir():
+            entries.append((stat.st_mtime_ns, _dir_size(path), path))
+    total_size = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= max_bytes:
+            break
+        if path.resolve() in keep_paths:
+            continue
+        # Missing files were evicted by another process in the meantime
+        result = _remove_dir(path) if path.is_dir() else _unlink_unheld(path)
+        if result == "held":
+            continue
+        if result == "deleted":
+            evicted.append(path)
+        total_size -= size
+    return evicted
@@ -2,6 +2,8 @@ import logging
 import requests
 from typing import Optional, Tuple
 
+from . import HTTPUtil
+
 _logger = logging.getLogger(__name__)
 
 
@@ -19,7 +21,7 @@ def get_latlong(ip: Optional[str] = None) -> Tuple[str, str]:
         latitude and longitude
     """
     url = f"https://ipinfo.io/{ip}/json" if ip else "https://ipinfo.io/json"
-    response = requests.get(url, timeout=5)
+    response = HTTPUtil.get_session().get(url, timeout=5)
     try:
         response.raise_for_status()
         loc = response.json().get("loc", "0.0,0.0").split(",")
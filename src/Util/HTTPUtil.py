@@ -0,0 +1,137 @@
+"""Shared HTTP sessions for all outbound requests, so connections (and TLS handshakes) are reused between requests and retries.
+
+The shared session keeps up to `POOL_MAXSIZE` connections alive per host, retries failed connections and retryable responses with
+exponential backoff, and applies a default timeout to requests that don't set their own. Each setting can be configured with an
+environment variable:
+
+- `HTTP_POOL_MAXSIZE`: max connections kept per host, by default 10
+- `HTTP_POOL_BLOCK`: if "1", requests wait for a free connection instead of opening extra ones past the limit, by default "0"
+- `HTTP_MAX_RETRIES`: max retries of a request, by default 2
+- `HTTP_BACKOFF_FACTOR`: backoff factor in seconds between retries, by default 0.5
+- `HTTP_TIMEOUT`: default timeout in seconds, by default 30
+
+Requests that failed to connect are retried for any method. Retryable statuses (`RETRY_STATUSES`) and broken reads are only retried
+for idempotent methods, so a POST that may have reached the server is never sent twice.
+"""
+
+import atexit
+import os
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+from typing import Any, Optional, Union
+from urllib3.util.retry import Retry
+
+POOL_MAXSIZE: int = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+"""Max number of connections kept alive per host."""
+
+POOL_BLOCK: bool = os.getenv("HTTP_POOL_BLOCK", "0") == "1"
+"""Whether requests wait for a free connection when a host has `POOL_MAXSIZE` connections in use."""
+
+MAX_RETRIES: int = int(os.getenv("HTTP_MAX_RETRIES", 2))
+"""Max number of retries of a request."""
+
+BACKOFF_FACTOR: float = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5))
+"""Backoff factor between retries; the nth retry waits `BACKOFF_FACTOR * 2 ** (n - 1)` seconds."""
+
+DEFAULT_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", 30))
+"""Timeout in seconds of requests that don't set their own."""
+
+RETRY_STATUSES: frozenset[int] = frozenset({429, 502, 503, 504})
+"""Response statuses that are retried for idempotent methods."""
+
+Timeout = Union[float, tuple[float, float]]
+"""Timeout of a request, either for both connecting and reading or as a (connect, read) tuple."""
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default timeout to requests without one."""
+
+    def __init__(self, timeout: Timeout, **kwargs: Any):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:  # type: ignore[override]
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(
+    pool_maxsize: Optional[int] = None,
+    pool_block: Optional[bool] = None,
+    max_retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+    timeout: Optional[Timeout] = None,
+) -> requests.Session:
+    """Create a session with connection pooling, retries and a default timeout. Settings left as none use the module's settings.
+
+    Parameters
+    ----------
+    pool_maxsize : Optional[int], optional
+        max number of connections kept alive per host, by default `POOL_MAXSIZE`
+    pool_block : Optional[bool], optional
+        whether requests wait for a free connection when a host has `pool_maxsize` connections in use, by default `POOL_BLOCK`
+    max_retries : Optional[int], optional
+        max number of retries of a request, by default `MAX_RETRIES`
+    backoff_factor : Optional[float], optional
+        backoff factor between retries, by default `BACKOFF_FACTOR`
+    timeout : Optional[Timeout], optional
+        timeout of requests that don't set their own, by default `DEFAULT_TIMEOUT`
+
+    Returns
+    -------
+    requests.Session
+        new session
+    """
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = _TimeoutHTTPAdapter(
+        DEFAULT_TIMEOUT if timeout is None else timeout,
+        pool_maxsize=POOL_MAXSIZE if pool_maxsize is None else pool_maxsize,
+        pool_block=POOL_BLOCK if pool_block is None else pool_block,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Get the session shared by the whole process, creating it on first use.
+
+    Returns
+    -------
+    requests.Session
+        shared session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def close_session() -> None:
+    """Close the shared session's connections. The next `get_session` call creates a new session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+atexit.register(close_session)
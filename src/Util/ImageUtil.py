@@ -6,11 +6,11 @@ import numpy as np
 import os
 from PIL import Image
 import random
-import requests
 from scipy.ndimage import label
 from typing import Callable, Optional, TypeVar, Union
 
 from .ColorUtil import ColorTuple
+from . import HTTPUtil
 
 
 ImageLike = TypeVar("ImageLike", Image.Image, np.ndarray)
@@ -226,7 +226,7 @@ def imgur_upload(img: Image.Image) -> dict:
     dict
         dictionary containing keys "url" and "delete_hash"
     """
-    response = requests.post(
+    response = HTTPUtil.get_session().post(
         "https://api.imgur.com/3/image",
         headers={"Authorization": f"Client-ID {os.getenv('IMGUR_CLIENT_ID')}"},
         data={"image": image_to_data_url(img).removeprefix("data:image/png;base64,"), "type": "base64"},
@@ -248,7 +248,7 @@ def imgur_delete(delete_hash: str) -> None:
     delete_hash : str
         delete hash acquired from Imgur in `imgur_upload`
     """
-    response = requests.delete(
+    response = HTTPUtil.get_session().delete(
         f"https://api.imgur.com/3/image/{delete_hash}",
         headers={"Authorization": f"Client-ID {os.getenv('IMGUR_CLIENT_ID')}"},
         timeout=10,
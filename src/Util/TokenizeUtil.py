@@ -0,0 +1,210 @@
+import re
+
+
+# Word tokenization and detokenization rules follow nltk's `NLTKWordTokenizer` and `TreebankWordDetokenizer`, so tokens match the ones
+# Markov models were trained with when nltk was used. All patterns are compiled once at import.
+
+_CONTRACTIONS2 = [
+    r"(?i)\b(can)(?#X)(not)\b",
+    r"(?i)\b(d)(?#X)('ye)\b",
+    r"(?i)\b(gim)(?#X)(me)\b",
+    r"(?i)\b(gon)(?#X)(na)\b",
+    r"(?i)\b(got)(?#X)(ta)\b",
+    r"(?i)\b(lem)(?#X)(me)\b",
+    r"(?i)\b(more)(?#X)('n)\b",
+    r"(?i)\b(wan)(?#X)(na)(?=\s)",
+]
+_CONTRACTIONS3 = [r"(?i) ('t)(?#X)(is)\b", r"(?i) ('t)(?#X)(was)\b"]
+
+# Rules anchored to the start or end of a sentence use MULTILINE, as `word_tokenize` puts each sentence on its own line
+_TOKENIZE_RULES: list[tuple[re.Pattern, str]] = [
+    # Starting quotes
+    (re.compile(r"([«“‘„]|[`]+)"), r" \1 "),
+    (re.compile(r'^"', re.M), r"``"),
+    (re.compile(r"(``)"), r" \1 "),
+    (re.compile(r"([ \(\[{<])(\"|\'{2})"), r"\1 `` "),
+    (re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)"), r"\1 "),
+    # Punctuation
+    (re.compile(r"([^\.])(\.)([\]\)}>\"'»”’ ]*)[ \t]*$", re.M), r"\1 \2 \3 "),
+    (re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (re.compile(r"([:,])$", re.M), r" \1 "),
+    (re.compile(r"\.{2,}"), r" \g<0> "),
+    (re.compile(r"[;@#$%&]"), r" \g<0> "),
+    (re.compile(r"[\u2012-\u2015]"), r" \g<0> "),
+    (re.compile(r"([^\.])(\.)([\]\)}>\"']*)[ \t]*$", re.M), r"\1 \2\3 "),
+    (re.compile(r"[?!]"), r" \g<0> "),
+    (re.compile(r"([^'])' "), r"\1 ' "),
+    (re.compile(r"[*]"), r" \g<0> "),
+    # Parentheses, brackets and double dashes
+    (re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> "),
+    (re.compile(r"--"), r" -- "),
+]
+
+# Applied after padding the text with spaces
+_TOKENIZE_PADDED_RULES: list[tuple[re.Pattern, str]] = [
+    # Ending quotes
+    (re.compile(r"([»”’])"), r" \1 "),
+    (re.compile(r"''"), " '' "),
+    (re.compile(r'"'), " '' "),
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+    # Contractions
+    *((re.compile(pattern), r" \1 \2 ") for pattern in _CONTRACTIONS2),
+    *((re.compile(pattern), r" \1 \2 ") for pattern in _CONTRACTIONS3),
+]
+
+_DETOKENIZE_RULES: list[tuple[re.Pattern, str]] = [
+    # Contractions
+    *((re.compile(pattern.replace("(?#X)", r"\s")), r"\1\2") for pattern in _CONTRACTIONS3),
+    *((re.compile(pattern.replace("(?#X)", r"\s")), r"\1\2") for pattern in _CONTRACTIONS2),
+    # Ending quotes
+    (re.compile(r"([^' ])\s('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1\2 "),
+    (re.compile(r"([^' ])\s('[sS]|'[mM]|'[dD]|') "), r"\1\2 "),
+    (re.compile(r"([^'\s])\s(\'\')"), r"\1\2"),
+    (re.compile(r"([,.;:!?'])\s+(\"|\'\')"), r"\1\2"),
+    (re.compile(r"(\'\')\s([.,:)\]>};%])"), r"\1\2"),
+    (re.compile(r"''"), '"'),
+    (re.compile(r'([,.;:!?])"(\')'), r'\1\2"'),
+]
+
+_DETOKENIZE_STRIPPED_RULES: list[tuple[re.Pattern, str]] = [
+    # Double dashes, parentheses and brackets
+    (re.compile(r" -- "), r"--"),
+    (re.compile(r"([\[\(\{\<])\s"), r"\g<1>"),
+    (re.compile(r"\s([\]\)\}\>])"), r"\g<1>"),
+    (re.compile(r"([\]\)\}\>])\s([:;,.])"), r"\1\2"),
+    # Punctuation
+    (re.compile(r"([^'])\s'\s"), r"\1' "),
+    (re.compile(r"\s([?!])"), r"\g<1>"),
+    (re.compile(r"([^\.])\s(\.)(?!\.)([\]\)}>\"']*)"), r"\1\2\3"),
+    (re.compile(r"([#$])\s"), r"\g<1>"),
+    (re.compile(r"\s([;%])"), r"\g<1>"),
+    (re.compile(r"\s\.\.\.\s"), r"..."),
+    (re.compile(r"\s([:,])"), r"\1"),
+    # Starting quotes
+    (re.compile(r"([ (\[{<])\s``"), r"\1``"),
+    (re.compile(r"(``)\s"), r"\1"),
+    (re.compile(r"``"), r'"'),
+]
+
+_SENTENCE_END_RE = re.compile(r"[.!?]+[\"'”’»)\]}]*\s+")
+_LAST_WORD_RE = re.compile(r"[\w.'-]+$")
+
+ABBREVIATIONS: frozenset[str] = frozenset(
+    (
+        "mr",
+        "mrs",
+        "ms",
+        "dr",
+        "prof",
+        "st",
+        "jr",
+        "sr",
+        "vs",
+        "etc",
+        "inc",
+        "ltd",
+        "co",
+        "corp",
+        "mt",
+        "ft",
+        "no",
+        "vol",
+        "fig",
+        "gen",
+        "capt",
+        "lt",
+        "sgt",
+        "col",
+        "rev",
+        "hon",
+        "pres",
+        "gov",
+        "sen",
+        "rep",
+    )
+)
+"""Lowercased words (without the period) that are followed by a period without ending the sentence."""
+
+
+def sent_tokenize(text: str) -> list[str]:
+    """Split text into sentences.
+
+    This is a rule-based approximation of nltk's Punkt sentence tokenizer: a sentence ends at `.`, `!` or `?` (with any closing quotes
+    or brackets) followed by whitespace, unless the period follows an abbreviation or an initial, or the next sentence would start with
+    a lowercase letter.
+
+    Parameters
+    ----------
+    text : str
+        text to split
+
+    Returns
+    -------
+    list[str]
+        sentences of the text, stripped of surrounding whitespace
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        end = match.end()
+        if end < len(text) and text[end].islower():
+            continue
+        if text[match.start()] == "." and match.group().count(".") == 1:
+            last_word = _LAST_WORD_RE.search(text, start, match.start())
+            word = last_word.group().lower().lstrip("'-") if last_word else ""
+            # Abbreviations, initials, and dotted abbreviations like "U.S."
+            if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()) or "." in word:
+                continue
+        sentences.append(text[start:end].strip())
+        start = end
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def word_tokenize(text: str) -> list[str]:
+    """Split text into sentences and tokenize them into words, punctuation, and contraction parts like nltk's `word_tokenize`.
+
+    Parameters
+    ----------
+    text : str
+        text to tokenize
+
+    Returns
+    -------
+    list[str]
+        list of tokens
+    """
+    # Put each sentence on its own line so sentence anchored rules apply to each of them, then tokenize all of them at once; newlines
+    # within sentences become carriage returns, which are whitespace to every rule but don't start a new line
+    text = "\n".join(sentence.replace("\n", "\r") for sentence in sent_tokenize(text))
+    for regexp, substitution in _TOKENIZE_RULES:
+        text = regexp.sub(substitution, text)
+    text = f" {text} "
+    for regexp, substitution in _TOKENIZE_PADDED_RULES:
+        text = regexp.sub(substitution, text)
+    return text.split()
+
+
+def detokenize(tokens: list[str]) -> str:
+    """Join tokens back into text like nltk's `TreebankWordDetokenizer`.
+
+    Parameters
+    ----------
+    tokens : list[str]
+        list of tokens to detokenize
+
+    Returns
+    -------
+    str
+        tokens reconstructed into text
+    """
+    text = f" {' '.join(tokens)} "
+    for regexp, substitution in _DETOKENIZE_RULES:
+        text = regexp.sub(substitution, text)
+    text = text.strip()
+    for regexp, substitution in _DETOKENIZE_STRIPPED_RULES:
+        text = regexp.sub(substitution, text)
+    return text.strip()
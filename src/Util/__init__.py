@@ -3,11 +3,14 @@ This module contains various utilities used throughout the app.
 
 The specific submodules are as follows:
 
+- **src.Util.CacheUtil**: Utilities for on-disk caches (atomic writes, hashing, and LRU eviction).
 - **src.Util.ColorUtil**: Utilities for reading and manipulating colors.
 - **src.Util.FileUtil**: Utilities for loading files.
 - **src.Util.GeoUtil**: Utilities for location information.
 - **src.Util.HTMLUtil**: Utilities to convert HTML and Markdown documents to images.
+- **src.Util.HTTPUtil**: Shared, pooled HTTP session with retries and timeouts for all outbound requests.
 - **src.Util.HTML2ImageStrategy**: Strategies to convert HTML to images.
 - **src.Util.ImageUtil**: Utilities for reading and manipulating images.
 - **src.Util.TimeUtil**: Utilities for handling datetimes.
+- **src.Util.TokenizeUtil**: Utilities to tokenize text into words and join tokens back into text.
 """
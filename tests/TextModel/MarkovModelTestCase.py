@@ -0,0 +1,51 @@
+import gzip
+from pathlib import Path
+from sqlalchemy import create_engine
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import src.Directories as Directories
+from src.TextModel import MarkovModelRegistry
+from src.TextModel.MarkovTriads import MarkovTriads
+
+
+class MarkovModelTestCase(unittest.TestCase):
+    """Base of the tests of trained Markov models, which patches a temp directory in as `Directories.MODELS_DIR`, with
+    `Directories.CACHE_DIR` in it, and unloads all models and deletes the directory after each test."""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.models_dir = Path(self.tmp_dir.name)
+        self.cache_dir = self.models_dir / "cache"
+        for dir_patch in (patch.object(Directories, "_MODELS_DIR", self.models_dir), patch.object(Directories, "_CACHE_DIR", self.cache_dir)):
+            dir_patch.start()
+            self.addCleanup(dir_patch.stop)
+        self.addCleanup(MarkovModelRegistry.unload_all)
+
+    def write_model(self, text: str, model_name: str = "test", schema_version: int = 1) -> Path:
+        """Train a model on the text, and write it to `models/{model_name}.db.gz` like `train.py` does, replacing any model with that
+        name; returns the path of the compressed model."""
+        db_path = self.models_dir / f"{model_name}.db"
+        db_path.unlink(missing_ok=True)
+        engine = create_engine(f"sqlite:///{db_path}")
+        markov_model = MarkovTriads(schema_version=schema_version)
+        markov_model.create_table(engine)
+        markov_model.upsert_triads(engine, text)
+        engine.dispose()
+        with open(db_path, "rb") as f_src, gzip.open(f"{db_path}.gz", "wb") as f_dst:
+            f_dst.writelines(f_src)
+        db_path.unlink()
+        return db_path.with_suffix(".db.gz")
+
+    def write_delta_shard(self, name: str, text: str, model_name: str = "test") -> Path:
+        """Train a delta shard of the model on the text, in `models/{model_name}.d/{name}`; returns the path of the shard."""
+        delta_path = self.models_dir / f"{model_name}.d" / name
+        delta_path.parent.mkdir(exist_ok=True)
+        engine = create_engine(f"sqlite:///{delta_path}")
+        markov_model = MarkovTriads(schema_version=2)
+        markov_model.create_table(engine)
+        markov_model.upsert_triads(engine, text)
+        engine.dispose()
+        return delta_path
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Optional
+import unittest
+
+from src.TextModel import HedgedRequests
+
+
+class TestHedgedRequests(unittest.TestCase):
+    """Tests for hedged generation attempts."""
+
+    def test_sequential(self) -> None:
+        """Test that attempts run one after another until one succeeds."""
+        results = iter([None, None, "third", "fourth"])
+        calls = []
+
+        def attempt(cancel: threading.Event) -> Optional[str]:
+            calls.append(threading.current_thread())
+            return next(results)
+
+        self.assertEqual(HedgedRequests.first_success(attempt, 10), "third")
+        self.assertEqual(calls, [threading.current_thread()] * 3)
+        self.assertIsNone(HedgedRequests.first_success(lambda cancel: None, 3))
+
+    def test_first_good_candidate(self) -> None:
+        """Test that the first candidate to succeed is used and the slower ones are cancelled."""
+        cancelled = threading.Event()
+        n_started = 0
+        lock = threading.Lock()
+
+        def attempt(cancel: threading.Event) -> Optional[str]:
+            nonlocal n_started
+            with lock:
+                n_started += 1
+                index = n_started
+            if index == 1:
+                # Slow candidate that stops once it's cancelled
+                if cancel.wait(5):
+                    cancelled.set()
+                return "slow"
+            if index == 2:
+                return None
+            time.sleep(0.05)
+            return "fast"
+
+        start = time.monotonic()
+        self.assertEqual(HedgedRequests.first_success(attempt, 10, candidates=2), "fast")
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(cancelled.wait(1))
+        self.assertEqual(n_started, 3)
+
+    def test_stagger(self) -> None:
+        """Test that extra candidates only start after the stagger delay while the first one runs."""
+        start_times = []
+
+        def attempt(cancel: threading.Event) -> Optional[str]:
+            start_times.append(time.monotonic())
+            if len(start_times) == 1:
+                time.sleep(0.05)
+                return "first"
+            return None
+
+        self.assertEqual(HedgedRequests.first_success(attempt, 10, candidates=3, stagger=1.0), "first")
+        self.assertEqual(len(start_times), 1)
+
+    def test_error(self) -> None:
+        """Test that an attempt's exception is raised."""
+
+        def attempt(cancel: threading.Event) -> Optional[str]:
+            raise ConnectionError("down")
+
+        with self.assertRaises(ConnectionError):
+            HedgedRequests.first_success(attempt, 10, candidates=2)
+
+    def test_stagger_delay(self) -> None:
+        """Test the stagger delay from recorded latencies."""
+        key = "test-stagger-delay"
+        self.assertEqual(HedgedRequests.stagger_delay(key, 2.0, 90), 2.0)
+        HedgedRequests.first_success(lambda cancel: "result", 1, latency_key=key)
+        for seconds in range(1, 11):
+            HedgedRequests.record_latency(key, float(seconds))
+        self.assertAlmostEqual(HedgedRequests.stagger_delay(key, 2.0, 50) or 0, 5.0, delta=0.5)
+        self.assertEqual(HedgedRequests.stagger_delay(key, 2.0), 2.0)
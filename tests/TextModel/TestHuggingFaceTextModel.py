@@ -0,0 +1,46 @@
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import src.Directories as Directories
+from src.Errors import HuggingFaceError
+from src.TextModel import HuggingFaceTextModel, PromptCache
+from src.TextModel.HuggingFaceTextModel import HTTPUtil
+
+GOOD_RESPONSE = "Sonic dashed through Green Hill Zone."
+
+
+class TestHuggingFaceTextModel(unittest.TestCase):
+    """Tests for Hugging Face text models, with the inference API responses mocked."""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir_patch = patch.object(Directories, "_CACHE_DIR", Path(self.tmp_dir.name))
+        self.dir_patch.start()
+        self.session = MagicMock()
+        self.session_patch = patch.object(HTTPUtil, "get_session", return_value=self.session)
+        self.session_patch.start()
+
+    def tearDown(self) -> None:
+        PromptCache.set_mode("off")
+        self.session_patch.stop()
+        self.dir_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def respond(self, *gen_texts: str) -> None:
+        """Script the generated text of each next request."""
+        responses = [MagicMock(**{"json.return_value": [{"generated_text": gen_text}]}) for gen_text in gen_texts]
+        self.session.post.side_effect = responses
+
+    def test_failed_generation_not_cached(self) -> None:
+        """Test that an error is raised when no attempt generates any text, without caching an empty completion."""
+        PromptCache.set_mode("read-through")
+        self.respond("", "")
+        with self.assertRaises(HuggingFaceError):
+            HuggingFaceTextModel("test", max_attempts=2).get_text_block("Write some text:")
+        self.assertEqual(self.session.post.call_count, 2)
+        self.respond(GOOD_RESPONSE)
+        self.assertEqual(HuggingFaceTextModel("test").get_text_block("Write some text:"), f"Write some text: {GOOD_RESPONSE}")
+        self.assertEqual(HuggingFaceTextModel("test").get_text_block("Write some text:"), f"Write some text: {GOOD_RESPONSE}")
+        self.assertEqual(self.session.post.call_count, 3)
@@ -0,0 +1,32 @@
+import contextlib
+import io
+import json
+
+from src.TextModel.MarkovModelCLI import main
+from tests.TextModel.MarkovModelTestCase import MarkovModelTestCase
+
+
+class TestMarkovModelCLI(MarkovModelTestCase):
+    """Tests for the commands of `train.py`."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.text_path = self.models_dir / "text.txt"
+        self.text_path.write_text("Sonic runs fast. Tails flies high. Amy swings a hammer.", encoding="utf-8")
+
+    def test_train_model_named_like_command(self) -> None:
+        """Test that models can have the name of a command, since training is its own command."""
+        main(["train", "stats", str(self.text_path)])
+        self.assertTrue((self.models_dir / "stats.db.gz").exists())
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(["stats", "stats", "--json"])
+        self.assertEqual(json.loads(output.getvalue())["model"], "stats")
+
+    def test_invalid_arguments(self) -> None:
+        """Test that a missing or unknown command, and invalid combinations of training options, exit with a usage error."""
+        for argv in ([], ["test", str(self.text_path)], ["train", "test", str(self.text_path), "--delta", "--overwrite"]):
+            with self.subTest(argv=argv), contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as cm:
+                main(argv)
+            self.assertEqual(cm.exception.code, 2)
+        self.assertFalse((self.models_dir / "test.db.gz").exists())
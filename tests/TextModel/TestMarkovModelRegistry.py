@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+from pathlib import Path
+from sqlalchemy import create_engine
+from typing import Optional
+from unittest.mock import patch
+
+from src.TextModel import MarkovModelRegistry, MarkovTextModel
+from src.TextModel.MarkovModelCLI import export_binary, main
+from src.TextModel.MarkovTransitionTable import MarkovTransitionTable
+from src.TextModel.MarkovTriads import MarkovTriads
+from tests.TextModel.MarkovModelTestCase import MarkovModelTestCase
+
+
+class TestMarkovModelRegistry(MarkovModelTestCase):
+    """Tests for the process-wide Markov model registry."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.write_model("Sonic runs fast. Tails flies high. Amy swings a hammer.")
+
+    def test_get_model_loads_once(self) -> None:
+        """Test that concurrent requests for a model only load it once."""
+        with patch.object(MarkovModelRegistry, "load", wraps=MarkovModelRegistry.load) as load_mock:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                models = list(executor.map(lambda _: MarkovModelRegistry.get_model("test"), range(16)))
+            self.assertEqual(load_mock.call_count, 1)
+        self.assertTrue(all(model is models[0] for model in models))
+        self.assertIsNotNone(models[0].transition_table)
+        self.assertIsNone(models[0].engine)
+
+    def test_model_cache(self) -> None:
+        """Test that decompressed models are cached across loads and keyed by the contents of the compressed model."""
+        with patch.object(MarkovModelRegistry.CacheUtil, "atomic_path", wraps=MarkovModelRegistry.CacheUtil.atomic_path) as write_mock:
+            MarkovModelRegistry.get_model("test", backend="sql")
+            MarkovModelRegistry.unload_all()
+            MarkovModelRegistry.get_model("test")
+            # One write for the hash key file and one for the decompressed database
+            self.assertEqual(write_mock.call_count, 2)
+            # A new mtime with the same contents only rewrites the hash key file
+            os.utime(self.models_dir / "test.db.gz", ns=(0, 0))
+            MarkovModelRegistry.unload_all()
+            MarkovModelRegistry.get_model("test")
+            self.assertEqual(write_mock.call_count, 3)
+        self.assertEqual(len(list((self.cache_dir / "models").glob("test.*.db"))), 1)
+        # Cached databases aren't deleted when unloading
+        MarkovModelRegistry.unload_all()
+        self.assertEqual(len(list((self.cache_dir / "models").glob("test.*.db"))), 1)
+
+    def test_compiled_model_cache(self) -> None:
+        """Test that the compiled backend exports the compiled model into the cache, and memory-maps that export in later loads."""
+        with patch.object(MarkovTransitionTable, "from_triads", wraps=MarkovTransitionTable.from_triads) as compile_mock:
+            MarkovModelRegistry.get_model("test")
+            MarkovModelRegistry.unload_all()
+            model = MarkovModelRegistry.get_model("test")
+            self.assertEqual(compile_mock.call_count, 1)
+        self.assertIsInstance(model.transition_table.next_ids if model.transition_table else None, np.memmap)
+        self.assertEqual(model.transition_table.get_next_token("Tails", "flies") if model.transition_table else None, "high")
+        self.assertEqual(len(list((self.cache_dir / "models").glob("test.*.markov"))), 1)
+        # Exports are evicted along with databases
+        MarkovModelRegistry.unload_all()
+        MarkovModelRegistry.CacheUtil.evict_lru(self.cache_dir / "models", 1, pattern=MarkovModelRegistry._CACHE_PATTERNS)
+        self.assertEqual(len(list((self.cache_dir / "models").glob("test.*.markov"))), 0)
+
+    def test_loaded_models_not_evicted(self) -> None:
+        """Test that loading another model doesn't evict the cached databases of loaded models, but does evict unloaded ones."""
+        self.write_model("Knuckles guards the emerald. Shadow guards the ark.", model_name="other")
+        # A cap of 1 byte evicts every cached database that isn't held
+        with patch.object(MarkovModelRegistry, "MODEL_CACHE_MAX_BYTES", 1):
+            sql_model = MarkovModelRegistry.get_model("test", backend="sql")
+            sqlite_model = MarkovModelRegistry.get_model("test", backend="sqlite")
+            MarkovModelRegistry.get_model("other", backend="sql")
+        self.assertEqual(len(list((self.cache_dir / "models").glob("test.*.db"))), 1)
+        # New connections to the cached database still work
+        assert sql_model.engine is not None and sqlite_model.reader is not None
+        sql_model.engine.dispose()
+        self.assertEqual(sql_model.markov_table.get_next_token(sql_model.engine, "Tails", "flies"), "high")
+        self.assertEqual(sqlite_model.reader.get_next_token("Tails", "flies"), "high")
+        MarkovModelRegistry.unload_all()
+        MarkovModelRegistry.CacheUtil.evict_lru(self.cache_dir / "models", 1, pattern="*.db")
+        self.assertEqual(len(list((self.cache_dir / "models").glob("*.db"))), 0)
+
+    def test_end_steps_compiled_once(self) -> None:
+        """Test that models trained with `train.py` are loaded without compiling them for their end steps, and that older models are only
+        compiled once to save them, reusing that table for the compiled backend."""
+        with patch.object(MarkovTransitionTable, "from_triads", wraps=MarkovTransitionTable.from_triads) as compile_mock:
+            MarkovModelRegistry.get_model("test")
+            MarkovModelRegistry.get_model("test", backend="sqlite")
+            self.assertEqual(compile_mock.call_count, 1)
+            text_path = self.models_dir / "text.txt"
+            text_path.write_text("Knuckles guards the emerald. Shadow guards the ark.", encoding="utf-8")
+            main(["train", "trained", str(text_path)])
+            self.assertEqual(compile_mock.call_count, 2)
+            with patch.object(MarkovModelRegistry, "MODEL_CACHE_MAX_BYTES", 0):
+                model = MarkovModelRegistry.get_model("trained", backend="sqlite")
+            self.assertEqual(compile_mock.call_count, 2)
+        self.assertEqual(model.reader.get_next_token("Shadow", "guards", terminating=True) if model.reader else None, "the")
+
+    def test_binary_export_preferred(self) -> None:
+        """Test that the compiled backend memory-maps the binary export when it exists."""
+        export_binary("test")
+        model = MarkovModelRegistry.get_model("test")
+        self.assertIsNone(model.engine)
+        self.assertFalse((self.cache_dir / "models").exists())
+        self.assertIsInstance(model.transition_table.next_ids if model.transition_table else None, np.memmap)
+        # The sql backend still uses the database
+        self.assertIsNotNone(MarkovModelRegistry.get_model("test", backend="sql").engine)
+
+    def test_sql_backend_cleanup(self) -> None:
+        """Test that the sql backend without the model cache keeps its decompressed database until unloaded."""
+        with patch.object(MarkovModelRegistry, "MODEL_CACHE_MAX_BYTES", 0):
+            model = MarkovModelRegistry.get_model("test", backend="sql")
+        tmp_path = model.tmp_path
+        self.assertIsNotNone(tmp_path)
+        self.assertTrue(Path(str(tmp_path)).exists())
+        MarkovModelRegistry.unload_all()
+        self.assertFalse(Path(str(tmp_path)).exists())
+
+    def test_text_models_share_model(self) -> None:
+        """Test that text models with the same model name share the loaded model."""
+        with patch.object(MarkovModelRegistry, "load", wraps=MarkovModelRegistry.load) as load_mock:
+            for _ in range(3):
+                self.assertTrue(MarkovTextModel("test").get_text_block())
+            self.assertEqual(load_mock.call_count, 1)
+
+    def test_backends_agree_on_endings(self) -> None:
+        """Test that every backend steers sentence endings with the same weights, including for delta shards merged at load time."""
+        self.write_delta_shard("1.db", "Sonic runs fast and Tails runs far. Sonic runs far! Amy runs fast and far.")
+        table = MarkovModelRegistry.get_model("test").transition_table
+        sql_model = MarkovModelRegistry.get_model("test", backend="sql")
+        sqlite_model = MarkovModelRegistry.get_model("test", backend="sqlite")
+        assert table is not None and sql_model.engine is not None and sqlite_model.reader is not None
+        sql_engine, reader = sql_model.engine, sqlite_model.reader
+        states: list[tuple[str, Optional[str]]] = [(table.vocab[key // table.vocab_size], table.vocab[key % table.vocab_size]) for key in table.state_keys]
+        states += [(table.vocab[key], None) for key in table.uni_keys]
+        for first_token, second_token in states:
+            with self.subTest(state=(first_token, second_token)):
+                is_bigram, state = table._find_state(first_token, second_token)
+                if is_bigram:
+                    expected = self._alias_distribution(table.vocab, table.next_ids, table.term_alias_probs, table.term_alias_idx, table.offsets, state)
+                else:
+                    expected = self._alias_distribution(
+                        table.vocab, table.uni_next_ids, table.uni_term_alias_probs, table.uni_term_alias_idx, table.uni_offsets, state
+                    )
+                with patch("src.TextModel.MarkovTriads.choose_word_from_rows", return_value="x") as sql_choose_mock:
+                    sql_model.markov_table.get_next_token(sql_engine, first_token, second_token, terminating=True)
+                with patch("src.TextModel.MarkovSQLiteReader.choose_word_from_rows", return_value="x") as sqlite_choose_mock:
+                    reader.get_next_token(first_token, second_token, terminating=True)
+                for call in (sql_choose_mock.call_args, sqlite_choose_mock.call_args):
+                    total = sum(weight for _, weight in call.args[0])
+                    actual = {token: weight / total for token, weight in call.args[0]}
+                    self.assertEqual(actual.keys(), expected.keys())
+                    for token, prob in expected.items():
+                        self.assertAlmostEqual(actual[token], prob, places=6)
+
+    def _alias_distribution(
+        self, vocab: list[str], next_ids: np.ndarray, alias_probs: np.ndarray, alias_idx: np.ndarray, offsets: np.ndarray, state: int
+    ) -> dict[str, float]:
+        """Get the probability of each token that the alias table of a state samples."""
+        lo, hi = int(offsets[state]), int(offsets[state + 1])
+        dist = {vocab[next_ids[i]]: 0.0 for i in range(lo, hi)}
+        for i in range(lo, hi):
+            dist[vocab[next_ids[i]]] += alias_probs[i] / (hi - lo)
+            dist[vocab[next_ids[alias_idx[i]]]] += (1.0 - alias_probs[i]) / (hi - lo)
+        return dist
+
+    def test_delta_shards(self) -> None:
+        """Test that delta shards are merged into the model by every backend, and folded into the base model by compacting."""
+        self.write_delta_shard("1.db", "Knuckles guards the emerald.")
+        for cache_max_bytes in (MarkovModelRegistry.MODEL_CACHE_MAX_BYTES, 0):
+            with patch.object(MarkovModelRegistry, "MODEL_CACHE_MAX_BYTES", cache_max_bytes):
+                model = MarkovModelRegistry.get_model("test")
+                self.assertEqual(model.transition_table.get_next_token("guards", "the") if model.transition_table else None, "emerald")
+                model = MarkovModelRegistry.get_model("test", backend="sql")
+                self.assertEqual(model.markov_table.get_next_token(model.engine, "guards", "the") if model.engine else None, "emerald")
+                model = MarkovModelRegistry.get_model("test", backend="sqlite")
+                self.assertEqual(model.reader.get_next_token("guards", "the") if model.reader else None, "emerald")
+                MarkovModelRegistry.unload_all()
+        # A binary export older than a shard is ignored
+        export_binary("test")
+        delta_path = self.write_delta_shard("2.db", "Shadow guards the ark.")
+        os.utime(delta_path, (os.path.getmtime(delta_path) + 10,) * 2)
+        model = MarkovModelRegistry.get_model("test")
+        self.assertNotIsInstance(model.transition_table.next_ids if model.transition_table else None, np.memmap)
+        self.assertEqual(model.transition_table.get_next_token("Shadow", "guards") if model.transition_table else None, "the")
+        MarkovModelRegistry.unload_all()
+
+        main(["compact", "test"])
+        self.assertFalse((self.models_dir / "test.d").exists())
+        self.assertFalse((self.models_dir / "test.db").exists())
+        db_path, held_db, _ = MarkovModelRegistry._hold_cached_db("test")
+        engine = create_engine(f"sqlite:///{db_path}")
+        markov_model = MarkovTriads.for_engine(engine)
+        self.assertEqual(markov_model.get_next_token(engine, "Knuckles", "guards"), "the")
+        self.assertEqual(markov_model.get_next_token(engine, "the", "ark"), ".")
+        self.assertEqual(markov_model.get_next_token(engine, "Sonic", "runs"), "fast")
+        engine.dispose()
+        MarkovModelRegistry.CacheUtil.release(held_db)
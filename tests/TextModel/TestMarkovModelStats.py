@@ -0,0 +1,48 @@
+import contextlib
+import io
+import json
+
+from src.TextModel.MarkovModelCLI import main
+from src.TextModel.MarkovModelStats import BACKENDS, bench_model, model_stats
+from tests.TextModel.MarkovModelTestCase import MarkovModelTestCase
+
+
+class TestMarkovModelStats(MarkovModelTestCase):
+    """Tests for Markov model statistics and benchmarks."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.write_model("Sonic runs fast. Tails flies high. Amy swings a hammer.", schema_version=2)
+
+    def test_model_stats(self) -> None:
+        """Test the statistics of a model."""
+        summary = model_stats("test")
+        # 13 tokens with 11 distinct ones, wrapping around into 13 triads from 13 states
+        self.assertEqual(summary["vocab_size"], 11)
+        self.assertEqual(summary["triads"], 13)
+        self.assertEqual(summary["states"], 13)
+        self.assertEqual(summary["fanout"]["max"], 1)
+        self.assertEqual(summary["sentence_starts"], 3)
+        self.assertGreater(summary["gz_bytes"], 0)
+        self.assertEqual(summary["binary_bytes"], 0)
+        self.assertGreater(summary["compiled_memory_bytes"], 0)
+        self.assertEqual(set(summary["load_seconds"]), set(BACKENDS))
+
+    def test_bench_model(self) -> None:
+        """Test benchmarking every backend."""
+        results = bench_model("test", n_blocks=3)
+        self.assertEqual([result["backend"] for result in results], ["compiled", "compiled-batch", "sql", "sqlite"])
+        for result in results:
+            self.assertGreater(result["tokens"], 0)
+            self.assertGreater(result["tokens_per_second"], 0)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+
+    def test_commands(self) -> None:
+        """Test the JSON output of the commands."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(["stats", "test", "--json"])
+            main(["bench", "test", "--json", "-n", "2", "--backend", "sqlite"])
+        stats_line, bench_line = output.getvalue().splitlines()
+        self.assertEqual(json.loads(stats_line)["model"], "test")
+        self.assertEqual([result["backend"] for result in json.loads(bench_line)["results"]], ["sqlite"])
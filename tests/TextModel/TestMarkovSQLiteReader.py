@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+from sqlalchemy import create_engine
+import tempfile
+import unittest
+
+from src.TextModel.MarkovSQLiteReader import MarkovSQLiteReader
+from src.TextModel.MarkovTransitionTable import MarkovTransitionTable
+from src.TextModel.MarkovTriads import MarkovTriads
+
+
+class TestMarkovSQLiteReader(unittest.TestCase):
+    """Tests for reading Markov models through raw, read-only sqlite3."""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_paths = {}
+        for schema_version in (1, 2):
+            db_path = os.path.join(self.tmp_dir.name, f"test_v{schema_version}.db")
+            engine = create_engine(f"sqlite:///{db_path}")
+            markov_model = MarkovTriads(schema_version=schema_version)
+            markov_model.create_table(engine)
+            markov_model.upsert_triads(engine, "This is a unit test. Writing a unit test!")
+            MarkovTransitionTable.from_engine(engine).save_end_steps(engine)
+            engine.dispose()
+            self.db_paths[schema_version] = db_path
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_get_tokens(self) -> None:
+        """Test getting first and next tokens with each schema version, including backoff."""
+        for schema_version, db_path in self.db_paths.items():
+            with self.subTest(schema_version=schema_version):
+                reader = MarkovSQLiteReader(db_path)
+                self.assertEqual(reader.markov_table.schema_version, schema_version)
+                for _ in range(10):
+                    self.assertIn(reader.get_first_token(), ("This", "Writing"))
+                self.assertEqual(reader.get_next_token("is"), "a")
+                self.assertEqual(reader.get_next_token("is", "a"), "unit")
+                self.assertIn(reader.get_next_token("unit", "test", terminating=True), (".", "!"))
+                # Unseen 2-gram state backs off to the 1-gram state of the second token
+                self.assertEqual(reader.get_next_token("Writing", "unit"), "test")
+                self.assertIn(reader.get_next_token("unknown"), ("This", "Writing"))
+                reader.close()
+
+    def test_covering_indexes(self) -> None:
+        """Test that token lookups only read the covering indexes."""
+        for schema_version, db_path in self.db_paths.items():
+            with self.subTest(schema_version=schema_version):
+                conn = sqlite3.connect(db_path)
+                plan = conn.execute("EXPLAIN QUERY PLAN SELECT third_token, occurrences FROM markov_triads WHERE first_token = 1 AND second_token = 2")
+                self.assertIn("COVERING INDEX", " ".join(str(row) for row in plan))
+                plan = conn.execute("EXPLAIN QUERY PLAN SELECT third_token, SUM(occurrences) FROM markov_triads WHERE second_token = 2 GROUP BY third_token")
+                self.assertIn("COVERING INDEX ix_markov_triads_second_token", " ".join(str(row) for row in plan))
+                conn.close()
+
+    def test_missing_indexes_warning(self) -> None:
+        """Test that opening a database without the read indexes logs a warning pointing to the migration."""
+        with self.assertNoLogs("src.TextModel.MarkovSQLiteReader", level="WARNING"):
+            MarkovSQLiteReader(self.db_paths[2]).close()
+        conn = sqlite3.connect(self.db_paths[2])
+        conn.execute("DROP INDEX ix_markov_triads_covering")
+        conn.close()
+        with self.assertLogs("src.TextModel.MarkovSQLiteReader", level="WARNING") as logs:
+            reader = MarkovSQLiteReader(self.db_paths[2])
+        self.assertIn("ix_markov_triads_covering", logs.output[0])
+        self.assertIn("train.py migrate", logs.output[0])
+        self.assertEqual(reader.get_next_token("is", "a"), "unit")
+        reader.close()
+
+    def test_threads(self) -> None:
+        """Test that a reader can be shared between threads, with a connection per thread."""
+        reader = MarkovSQLiteReader(self.db_paths[2])
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            tokens = list(executor.map(lambda _: reader.get_next_token("a", "unit"), range(100)))
+        self.assertEqual(set(tokens), {"test"})
+        reader.close()
+        # Closed readers reconnect when used again
+        self.assertEqual(reader.get_next_token("a", "unit"), "test")
+        reader.close()
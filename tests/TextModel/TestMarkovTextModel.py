@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.TextModel import GenerationState
+from src.TextModel.MarkovModelRegistry import MarkovBackend
+from src.TextModel.MarkovTextModel import MarkovTextModel
+from tests.TextModel.MarkovModelTestCase import MarkovModelTestCase
+
+
+class TestMarkovTextModel(MarkovModelTestCase):
+    """Tests for Markov text models."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.write_model("Sonic runs fast. Tails flies high. Amy swings a hammer. Knuckles glides far!")
+
+    def test_get_text_blocks(self) -> None:
+        """Test generating a batch of text blocks with each backend."""
+        backends: tuple[MarkovBackend, ...] = ("compiled", "sql", "sqlite")
+        for backend in backends:
+            with self.subTest(backend=backend):
+                text_model = MarkovTextModel("test", mean_words=6, stdev_words=3, mean_paragraphs=2, stdev_paragraphs=1, backend=backend)
+                blocks = text_model.get_text_blocks(50)
+                self.assertEqual(len(blocks), 50)
+                for block in blocks:
+                    self.assertTrue(block)
+                    # Punctuation is required, so every paragraph ends with a sentence
+                    for paragraph in block.split("\n\n"):
+                        self.assertIn(paragraph[-1], ".!?")
+
+    def test_get_text_blocks_prompts(self) -> None:
+        """Test that batch generation continues and restores each prompt."""
+        text_model = MarkovTextModel("test", mean_words=1, stdev_words=0)
+        blocks = text_model.get_text_blocks(3, ["Sonic runs", None, "Amy swings"])
+        self.assertTrue(blocks[0].startswith("Sonic runs fast"))
+        self.assertTrue(blocks[2].startswith("Amy swings a"))
+        with self.assertRaises(ValueError):
+            text_model.get_text_blocks(2, ["Sonic runs"])
+
+    def test_get_text_blocks_without_punctuation(self) -> None:
+        """Test that without required punctuation, each paragraph is exactly its sampled number of words."""
+        text_model = MarkovTextModel("test", mean_words=4, stdev_words=0, punc_required=False)
+        for block in text_model.get_text_blocks(20):
+            self.assertEqual(len(block.replace(".", " .").replace("!", " !").split()), 4)
+
+    def test_generation_state(self) -> None:
+        """Test that generation with the same seeded state is reproducible and only updates the given state."""
+        backends: tuple[MarkovBackend, ...] = ("compiled", "sql", "sqlite")
+        for backend in backends:
+            with self.subTest(backend=backend):
+                text_model = MarkovTextModel("test", mean_words=8, stdev_words=4, backend=backend)
+                first_text = text_model.get_text_block(state=GenerationState.from_seed(42))
+                self.assertEqual(text_model.get_text_block(state=GenerationState.from_seed(42)), first_text)
+                state = GenerationState.from_seed(0)
+                words = [text_model.get_next_word(state) for _ in range(5)]
+                self.assertEqual((state.first_word, state.second_word), (words[-2], words[-1]))
+                self.assertEqual(
+                    text_model.get_text_blocks(3, state=GenerationState.from_seed(1)), text_model.get_text_blocks(3, state=GenerationState.from_seed(1))
+                )
+
+    def test_shared_between_threads(self) -> None:
+        """Test that a single text model can generate text from many threads at once."""
+        text_model = MarkovTextModel("test", mean_words=6, stdev_words=3)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            blocks = list(executor.map(lambda _: text_model.get_text_block("Sonic runs"), range(200)))
+        for block in blocks:
+            self.assertTrue(block.startswith("Sonic runs fast"))
+            self.assertIn(block[-1], ".!?")
@@ -0,0 +1,155 @@
+import numpy as np
+from pathlib import Path
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+
+from src.TextModel.MarkovTransitionTable import TERMINATION_ARRAY_NAMES, MarkovTransitionTable, _build_alias
+from src.TextModel.MarkovTriads import MarkovTriads
+
+
+class TestMarkovTransitionTable(unittest.TestCase):
+    """Tests for compiled Markov transition tables."""
+
+    def setUp(self) -> None:
+        engine = create_engine("sqlite:///:memory:")
+        markov_model = MarkovTriads()
+        markov_model.create_table(engine)
+        markov_model.upsert_triads(engine, "This is a unit test. Writing a unit test.")
+        self.table = MarkovTransitionTable.from_engine(engine, markov_model)
+        self.rng = np.random.default_rng(0)
+
+    def test_from_engine(self) -> None:
+        """Test compiling the table into CSR arrays."""
+        self.assertEqual(self.table.vocab, sorted(self.table.vocab))
+        self.assertEqual(len(self.table.vocab), 7)
+        # 9 distinct triads over 8 distinct (first, second) states
+        self.assertEqual(len(self.table.state_keys), 8)
+        self.assertEqual(len(self.table.next_ids), 9)
+        self.assertEqual(self.table.offsets[-1], 9)
+        self.assertTrue(np.all(np.diff(self.table.state_keys) > 0))
+        self.assertEqual(self.table.weights.sum(), 11)
+        start_tokens = sorted(self.table.vocab[i] for i in self.table.start_ids)
+        self.assertEqual(start_tokens, ["This", "Writing"])
+
+    def test_get_first_token(self) -> None:
+        """Test getting the first token for a generated sentence."""
+        for _ in range(20):
+            self.assertIn(self.table.get_first_token(self.rng), ("This", "Writing"))
+
+    def test_get_next_token(self) -> None:
+        """Test getting the next token for a generated sentence, including backoff."""
+        self.assertEqual(self.table.get_next_token("is", rng=self.rng), "a")
+        self.assertEqual(self.table.get_next_token("unit", "test", rng=self.rng), ".")
+        for _ in range(20):
+            self.assertIn(self.table.get_next_token("test", ".", rng=self.rng), ("This", "Writing"))
+        # Unseen 2-gram state backs off to the 1-gram state of the second token
+        self.assertEqual(self.table.get_next_token("Writing", "unit", rng=self.rng), "test")
+        # Unknown tokens back off to a sentence start
+        self.assertIn(self.table.get_next_token("unknown", rng=self.rng), ("This", "Writing"))
+
+    def test_alias_sampling(self) -> None:
+        """Test that sampling with the alias tables follows the state's weights."""
+        table = MarkovTransitionTable.from_triads(["a", "b", "c", "."], np.zeros(4), np.zeros(4), np.arange(4), np.array([1, 2, 3, 4]))
+        counts = {token: 0 for token in table.vocab}
+        for _ in range(20000):
+            counts[table.get_next_token("a", "a", rng=self.rng)] += 1
+        for token, weight in zip(table.vocab, (1, 2, 3, 4)):
+            self.assertAlmostEqual(counts[token] / 20000, weight / 10, delta=0.02)
+
+    def test_build_alias(self) -> None:
+        """Test that the alias tables of segments of any size sample each entry exactly in proportion to its weight."""
+        sizes = np.array([1, 2, 3, 1, 50, 7, 1000, 2, 3, 2, 4, 3])
+        offsets = np.append(0, np.cumsum(sizes))
+        weights = np.concatenate([self.rng.pareto(1.0, size) + 0.01 for size in sizes])
+        weights[offsets[2] : offsets[3]] = 1.0
+        # Small integer weights, as counted occurrences are, give entries with a scaled weight of exactly one and tied running sums
+        weights[offsets[8] :] = [4, 2, 1, 3, 1, 3, 2, 4, 3, 1, 1, 4]
+        probs, alias = _build_alias(offsets, weights)
+        self.assertTrue(np.all((probs >= 0) & (probs <= 1)))
+        for lo, hi in zip(offsets[:-1], offsets[1:]):
+            self.assertTrue(np.all((alias[lo:hi] >= lo) & (alias[lo:hi] < hi)))
+            sampled = np.zeros(hi - lo)
+            np.add.at(sampled, np.arange(hi - lo), probs[lo:hi] / (hi - lo))
+            np.add.at(sampled, alias[lo:hi] - lo, (1.0 - probs[lo:hi]) / (hi - lo))
+            np.testing.assert_allclose(sampled, weights[lo:hi] / weights[lo:hi].sum(), atol=1e-9)
+
+    def test_get_next_ids(self) -> None:
+        """Test getting the next token ids of many chains at once, including backoff."""
+        ids = self.table.token_ids
+        first_ids = np.array([ids["unit"], -1, ids["Writing"], -1, ids["test"]])
+        second_ids = np.array([ids["test"], ids["is"], ids["unit"], -1, ids["."]])
+        next_tokens = [self.table.vocab[i] for i in self.table.get_next_ids(first_ids, second_ids, rng=self.rng)]
+        self.assertEqual(next_tokens[:3], [".", "a", "test"])
+        self.assertIn(next_tokens[3], ("This", "Writing"))
+        self.assertIn(next_tokens[4], ("This", "Writing"))
+        terminating = np.ones(len(first_ids), dtype=bool)
+        self.assertEqual(len(self.table.get_next_ids(first_ids, second_ids, rng=self.rng, terminating=terminating)), len(first_ids))
+
+    def test_end_steps(self) -> None:
+        """Test the expected steps to a sentence end of states."""
+        self.assertAlmostEqual(self.table.get_end_steps("unit", "test"), 1.0)
+        self.assertAlmostEqual(self.table.get_end_steps("a", "unit"), 2.0)
+        self.assertAlmostEqual(self.table.get_end_steps("is", "a"), 3.0)
+        # Unseen 2-gram states back off to 1-gram states
+        self.assertAlmostEqual(self.table.get_end_steps("Writing", "unit"), 2.0)
+        self.assertEqual(self.table.get_end_steps("unknown"), float("inf"))
+
+    def test_terminating_sampling(self) -> None:
+        """Test that terminating sampling favors tokens that end the sentence sooner."""
+        # From state (a, a), "." ends the sentence right away but "b" starts a loop that never ends
+        table = MarkovTransitionTable.from_triads(
+            ["a", "b", "."], np.array([0, 0, 0, 1]), np.array([0, 0, 1, 1]), np.array([2, 1, 1, 1]), np.array([1, 9, 1, 1])
+        )
+        self.assertAlmostEqual(table.get_end_steps("a", "a"), 1.0 + 0.9 * MarkovTransitionTable.MAX_END_ITERATIONS, delta=1.0)
+        n_ends = sum(table.get_next_token("a", "a", rng=self.rng) == "." for _ in range(2000))
+        n_terminating_ends = sum(table.get_next_token("a", "a", rng=self.rng, terminating=True) == "." for _ in range(2000))
+        self.assertAlmostEqual(n_ends / 2000, 0.1, delta=0.03)
+        self.assertGreater(n_terminating_ends / 2000, 0.9)
+
+    def test_save_load(self) -> None:
+        """Test saving the table to the binary format and memory-mapping it back."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = Path(tmp_dir) / "test.markov"
+            self.table.save(directory)
+            # Saving again replaces the existing table
+            self.table.save(directory)
+            self.assertEqual(sorted(path.name for path in Path(tmp_dir).iterdir()), ["test.markov"])
+            loaded = MarkovTransitionTable.load(directory)
+            self.assertEqual(loaded.vocab, self.table.vocab)
+            for name in MarkovTransitionTable.ARRAY_NAMES:
+                self.assertIsInstance(getattr(loaded, name), np.memmap)
+                np.testing.assert_array_equal(getattr(loaded, name), getattr(self.table, name))
+            self.assertEqual(loaded.get_next_token("unit", "test", rng=self.rng), ".")
+            del loaded
+            # Termination arrays are rebuilt for tables exported without them
+            for name in TERMINATION_ARRAY_NAMES:
+                (directory / f"{name}.npy").unlink()
+            loaded = MarkovTransitionTable.load(directory)
+            for name in TERMINATION_ARRAY_NAMES:
+                np.testing.assert_array_almost_equal(getattr(loaded, name), getattr(self.table, name))
+            del loaded
+
+    def test_from_engine_schema_v2(self) -> None:
+        """Test that compiling a version 2 table gives the same table as a version 1 table."""
+        engine = create_engine("sqlite:///:memory:")
+        markov_model = MarkovTriads(schema_version=2)
+        markov_model.create_table(engine)
+        markov_model.upsert_triads(engine, "Writing a unit test. This is a unit test.")
+        table = MarkovTransitionTable.from_engine(engine)
+        self.assertEqual(table.vocab, self.table.vocab)
+        for name in MarkovTransitionTable.ARRAY_NAMES:
+            np.testing.assert_array_equal(getattr(table, name), getattr(self.table, name))
+
+    def test_from_engines(self) -> None:
+        """Test that compiling several tables sums their counts, like compiling one table with all their triads."""
+        engines = [create_engine("sqlite:///:memory:") for _ in range(2)]
+        for engine, schema_version, text in zip(engines, (1, 2), ("This is a unit test.", "Writing a unit test.")):
+            markov_model = MarkovTriads(schema_version=schema_version)
+            markov_model.create_table(engine)
+            markov_model.upsert_triads(engine, text)
+        table = MarkovTransitionTable.from_engines(engines)
+        self.assertEqual(table.vocab, self.table.vocab)
+        self.assertEqual(table.weights.sum(), 11)
+        self.assertEqual(table.get_next_token("a", "unit", rng=self.rng), "test")
+        self.assertIn(table.get_first_token(self.rng), ("This", "Writing"))
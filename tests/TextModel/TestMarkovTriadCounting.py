@@ -0,0 +1,45 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import tempfile
+import unittest
+
+from src.TextModel.MarkovTriadCounting import iter_parallel_triad_counts, iter_text_chunks, iter_triads
+from src.Util import TokenizeUtil
+
+
+class TestMarkovTriadCounting(unittest.TestCase):
+    """Tests for counting the Markov triads of training text."""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.text_path = Path(self.tmp_dir.name) / "text.txt"
+        self.text_path.write_text("Sonic runs fast.\nTails flies high.\nAmy swings a hammer at Eggman's robots.\n")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_iter_text_chunks(self) -> None:
+        """Test that chunks are split at whitespace and add up to the whole file."""
+        chunks = list(iter_text_chunks(self.text_path, chunk_chars=10))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), self.text_path.read_text())
+        self.assertTrue(all(chunk[-1].isspace() for chunk in chunks[:-1]))
+
+    def test_iter_triads(self) -> None:
+        """Test that triads from chunks of tokens match triads from the whole list, wrapping around at the end."""
+        tokens = ["a", "b", "c", "d", "e"]
+        expected = [("a", "b", "c"), ("b", "c", "d"), ("c", "d", "e"), ("d", "e", "a"), ("e", "a", "b")]
+        self.assertEqual(list(iter_triads([tokens])), expected)
+        self.assertEqual(list(iter_triads([["a"], [], ["b", "c", "d"], ["e"]])), expected)
+        with self.assertRaises(ValueError):
+            list(iter_triads([["a"], ["b"]]))
+
+    def test_iter_parallel_triad_counts(self) -> None:
+        """Test that counting chunks with an executor gives the same triads as counting the whole file."""
+        expected = Counter(iter_triads([TokenizeUtil.word_tokenize(self.text_path.read_text())]))
+        counts: Counter[tuple[str, str, str]] = Counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for triads in iter_parallel_triad_counts(executor, [self.text_path], chunk_chars=10, max_pending=2):
+                counts.update(triads)
+        self.assertEqual(counts, expected)
@@ -1,10 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import os
+from pathlib import Path
+import tempfile
 import unittest
 from unittest.mock import patch
-from sqlalchemy import create_engine, select
-from sqlalchemy.engine import Row
+from sqlalchemy import create_engine, event, inspect, select
+from sqlalchemy.engine import Engine, Row
 from typing import Optional
 
-from src.TextModel.MarkovTriads import MarkovTriads
+from src.TextModel.MarkovTransitionTable import MarkovTransitionTable
+from src.TextModel.MarkovTriads import MarkovFoldedDeltas, MarkovTriads, choose_word_from_rows, get_schema_version, migrate_schema
 
 
 class TestMarkovTriads(unittest.TestCase):
@@ -15,13 +21,39 @@ class TestMarkovTriads(unittest.TestCase):
         self.first_sample_text = "This is a unit test. Writing a unit test."
         self.second_sample_text = "This is another unit test."
 
-    def _choose_word_from_rows_deterministic(self, rows: list[Row]) -> Optional[str]:
+    def _choose_word_from_rows_deterministic(self, rows: list[Row], rng: Optional[np.random.Generator] = None) -> Optional[str]:
         """Choose a word from the given rows in a deterministic way, always getting the earliest word in the alphabet."""
         if len(rows) == 0:
             return None
         words = sorted((row[0] for row in rows), key=lambda row: row[0].lower())
         return words[0]
 
+    def _select_token_triads(self, markov_model: MarkovTriads, engine: Optional[Engine] = None) -> list[dict]:
+        """Select all triads of a table with their tokens as strings."""
+        engine = engine or self.engine
+        if markov_model.schema_version < 2:
+            with engine.connect() as conn:
+                sel_stmt = select([markov_model.table_def]).order_by("first_token", "second_token", "third_token")
+                return [dict(row) for row in conn.execute(sel_stmt).mappings().all()]
+        triads, vocab = markov_model.table_def, markov_model.vocab_table.table_def
+        vocab1, vocab2, vocab3 = vocab.alias(), vocab.alias(), vocab.alias()
+        sel_stmt = (
+            select(
+                vocab1.c.token.label("first_token"),
+                vocab2.c.token.label("second_token"),
+                vocab3.c.token.label("third_token"),
+                triads.c.occurrences,
+            )
+            .select_from(
+                triads.join(vocab1, vocab1.c.id == triads.c.first_token)
+                .join(vocab2, vocab2.c.id == triads.c.second_token)
+                .join(vocab3, vocab3.c.id == triads.c.third_token)
+            )
+            .order_by("first_token", "second_token", "third_token")
+        )
+        with engine.connect() as conn:
+            return [dict(row) for row in conn.execute(sel_stmt).mappings().all()]
+
     def test_upsert_triads(self) -> None:
         """Test upserting Markov triads into the database from input text."""
         markov_model = MarkovTriads()
@@ -84,6 +116,87 @@ class TestMarkovTriads(unittest.TestCase):
             result = conn.execute(select([markov_model.table_def]).order_by("first_token", "second_token", "third_token"))
             self.assertEqual(result.mappings().all(), expected)
 
+    def test_upsert_triads_from_file(self) -> None:
+        """Test streaming triads from a file in chunks with spilling gives the same result as upserting the whole text."""
+        text = "\n".join([self.first_sample_text, self.second_sample_text, self.first_sample_text])
+        expected_model = MarkovTriads()
+        expected_engine = create_engine("sqlite:///:memory:")
+        expected_model.create_table(expected_engine)
+        expected_model.upsert_triads(expected_engine, self.first_sample_text)
+        expected_model.upsert_triads(expected_engine, text, overwrite_probs=True)
+        with expected_engine.connect() as conn:
+            expected = conn.execute(select([expected_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+
+        markov_model = MarkovTriads()
+        markov_model.create_table(self.engine)
+        markov_model.upsert_triads(self.engine, self.first_sample_text)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "text.txt")
+            with open(filepath, "w") as f:
+                f.write(text)
+            markov_model.upsert_triads_from_file(self.engine, filepath, overwrite_probs=True, chunk_chars=10, max_counted_triads=3)
+        with self.engine.connect() as conn:
+            result = conn.execute(select([markov_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+        self.assertEqual(result, expected)
+        self.assertFalse(inspect(self.engine).has_table(f"stream_{markov_model.table_name}"))
+
+    def test_upsert_triads_from_files(self) -> None:
+        """Test counting files in parallel chunks gives the same result as upserting each file in turn."""
+        texts = [self.first_sample_text, "\n".join([self.second_sample_text, self.first_sample_text])]
+        expected_model = MarkovTriads()
+        expected_engine = create_engine("sqlite:///:memory:")
+        expected_model.create_table(expected_engine)
+        for text in texts:
+            expected_model.upsert_triads(expected_engine, text)
+        with expected_engine.connect() as conn:
+            expected = conn.execute(select([expected_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+
+        markov_model = MarkovTriads()
+        markov_model.create_table(self.engine)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepaths = [os.path.join(tmp_dir, f"text{i}.txt") for i in range(len(texts))]
+            for filepath, text in zip(filepaths, texts):
+                with open(filepath, "w") as f:
+                    f.write(text)
+            # Threads count the chunks here so the test doesn't depend on how worker processes are started
+            with patch("src.TextModel.MarkovTriads.ProcessPoolExecutor", ThreadPoolExecutor):
+                markov_model.upsert_triads_from_files(self.engine, filepaths, jobs=2, chunk_chars=10, max_counted_triads=3)
+        with self.engine.connect() as conn:
+            result = conn.execute(select([markov_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+        self.assertEqual(result, expected)
+
+    def test_upsert_triads_from_files_pruning(self) -> None:
+        """Test that pruning while writing counts gives the same result as deleting uncommon triads afterwards."""
+        texts = [self.first_sample_text, "\n".join([self.second_sample_text, self.first_sample_text])]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepaths = [os.path.join(tmp_dir, f"text{i}.txt") for i in range(len(texts))]
+            for filepath, text in zip(filepaths, texts):
+                with open(filepath, "w") as f:
+                    f.write(text)
+            # Pruned in memory, pruned while moving from the staging table, and deleted after adding to an existing table
+            for max_counted_triads, existing_text in ((1000, None), (3, None), (1000, self.second_sample_text)):
+                for min_occurrences, uncommon_threshold in ((1, 1), (2, 0), (2, 1)):
+                    with self.subTest(min_occurrences=min_occurrences, uncommon_threshold=uncommon_threshold, max_counted_triads=max_counted_triads):
+                        engines = [create_engine("sqlite:///:memory:") for _ in range(2)]
+                        markov_models = [MarkovTriads() for _ in range(2)]
+                        for engine, markov_model in zip(engines, markov_models):
+                            markov_model.create_table(engine)
+                            if existing_text:
+                                markov_model.upsert_triads(engine, existing_text)
+                        markov_models[0].upsert_triads_from_files(engines[0], filepaths, jobs=1)
+                        markov_models[0].remove_uncommon_tokens(engines[0], uncommon_threshold=uncommon_threshold, min_occurrences=min_occurrences)
+                        markov_models[1].upsert_triads_from_files(
+                            engines[1],
+                            filepaths,
+                            jobs=1,
+                            max_counted_triads=max_counted_triads,
+                            min_occurrences=min_occurrences,
+                            uncommon_threshold=uncommon_threshold,
+                        )
+                        expected = self._select_token_triads(markov_models[0], engines[0])
+                        self.assertGreater(len(expected), 0)
+                        self.assertEqual(self._select_token_triads(markov_models[1], engines[1]), expected)
+
     def test_remove_uncommon_tokens(self) -> None:
         """Test removing uncommon tokens from the database."""
         markov_model = MarkovTriads()
@@ -100,23 +213,157 @@ class TestMarkovTriads(unittest.TestCase):
             result = conn.execute(select([markov_model.table_def]).order_by("first_token", "second_token", "third_token"))
             self.assertEqual(result.mappings().all(), expected)
 
+    def test_choose_word_from_rows(self) -> None:
+        """Test that words are chosen in proportion to their weights."""
+        self.assertIsNone(choose_word_from_rows([]))
+        rng = np.random.default_rng(0)
+        words = [choose_word_from_rows([("never", 0), ("rare", 1), ("common", 3)], rng=rng) for _ in range(2000)]
+        self.assertNotIn("never", words)
+        self.assertAlmostEqual(words.count("common") / len(words), 0.75, delta=0.05)
+
     def test_get_first_token(self) -> None:
         """Test getting the first token for a generated sentence."""
         markov_model = MarkovTriads()
         markov_model.create_table(self.engine)
         markov_model.upsert_triads(self.engine, self.first_sample_text)
-        with patch.object(markov_model, "_choose_word_from_rows", self._choose_word_from_rows_deterministic):
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", self._choose_word_from_rows_deterministic):
             first_token = markov_model.get_first_token(self.engine)
             self.assertEqual(first_token, "This")
 
+    def test_get_first_token_cached(self) -> None:
+        """Test that the sentence start distribution is only queried again after the model changes."""
+        markov_model = MarkovTriads()
+        markov_model.create_table(self.engine)
+        markov_model.upsert_triads(self.engine, self.first_sample_text)
+        statements: list[str] = []
+        event.listen(self.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", self._choose_word_from_rows_deterministic):
+            for _ in range(5):
+                self.assertEqual(markov_model.get_first_token(self.engine), "This")
+            self.assertEqual(len(statements), 1)
+            markov_model.upsert_triads(self.engine, "Sonic runs. Tails flies.")
+            statements.clear()
+            self.assertEqual(markov_model.get_first_token(self.engine), "Sonic")
+            self.assertEqual(len(statements), 1)
+
     def test_get_next_token(self) -> None:
         """Test getting the next token for a generated sentence."""
         markov_model = MarkovTriads()
         markov_model.create_table(self.engine)
         markov_model.upsert_triads(self.engine, self.first_sample_text)
-        with patch.object(markov_model, "_choose_word_from_rows", self._choose_word_from_rows_deterministic):
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", self._choose_word_from_rows_deterministic):
             next_token = markov_model.get_next_token(self.engine, first_token="is")
             self.assertEqual(next_token, "a")
 
             next_token = markov_model.get_next_token(self.engine, first_token="test", second_token=".")
             self.assertEqual(next_token, "This")
+
+    def test_get_next_token_terminating(self) -> None:
+        """Test that choosing a token while terminating favors tokens that end the sentence sooner."""
+        markov_model = MarkovTriads()
+        markov_model.create_table(self.engine)
+        markov_model.upsert_triads(self.engine, "It is a test. It is a test of it. It is a test!")
+        with self.assertRaises(ValueError):
+            markov_model.get_next_token(self.engine, "a", "test", terminating=True)
+        MarkovTransitionTable.from_engine(self.engine).save_end_steps(self.engine)
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", return_value="x") as choose_mock:
+            markov_model.get_next_token(self.engine, "a", "test", terminating=True)
+        # "of" takes 2 more steps to end the sentence ("it" and "."), so its weight is divided by 3
+        rows = sorted(choose_mock.call_args.args[0])
+        self.assertEqual([token for token, _ in rows], ["!", ".", "of"])
+        for (_, weight), expected in zip(rows, [1.0, 1.0, 1.0 / 3.0]):
+            self.assertAlmostEqual(weight, expected)
+
+    def test_schema_v2(self) -> None:
+        """Test upserting into and generating from a version 2 table with a token vocabulary."""
+        markov_model = MarkovTriads(schema_version=2)
+        markov_model.create_table(self.engine)
+        self.assertEqual(get_schema_version(self.engine), 2)
+        markov_model.upsert_triads(self.engine, self.first_sample_text)
+        markov_model.upsert_triads(self.engine, self.second_sample_text)
+        v1_model = MarkovTriads()
+        v1_engine = create_engine("sqlite:///:memory:")
+        v1_model.create_table(v1_engine)
+        v1_model.upsert_triads(v1_engine, self.first_sample_text)
+        v1_model.upsert_triads(v1_engine, self.second_sample_text)
+        self.assertEqual(get_schema_version(v1_engine), 1)
+        with v1_engine.connect() as conn:
+            expected = conn.execute(select([v1_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+        self.assertEqual(self._select_token_triads(markov_model), expected)
+
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", self._choose_word_from_rows_deterministic):
+            self.assertEqual(markov_model.get_first_token(self.engine), "This")
+            self.assertEqual(markov_model.get_next_token(self.engine, first_token="is"), "a")
+            self.assertEqual(markov_model.get_next_token(self.engine, first_token="test", second_token="."), "This")
+            self.assertEqual(markov_model.get_next_token(self.engine, first_token="This", second_token="is"), "a")
+
+    def test_migrate_schema(self) -> None:
+        """Test migrating a version 1 table to version 2."""
+        v1_model = MarkovTriads()
+        v1_model.create_table(self.engine)
+        v1_model.upsert_triads(self.engine, self.first_sample_text)
+        with self.engine.connect() as conn:
+            expected = conn.execute(select([v1_model.table_def]).order_by("first_token", "second_token", "third_token")).mappings().all()
+        migrate_schema(self.engine)
+        markov_model = MarkovTriads.for_engine(self.engine)
+        self.assertEqual(markov_model.schema_version, 2)
+        self.assertEqual(self._select_token_triads(markov_model), expected)
+        # The read indexes belong to the migrated table
+        index_names = {index["name"] for index in inspect(self.engine).get_indexes(markov_model.table_name)}
+        self.assertEqual(index_names, {"ix_markov_triads_covering", "ix_markov_triads_second_token"})
+        # Training continues with the migrated vocabulary
+        markov_model.upsert_triads(self.engine, self.second_sample_text)
+        with patch("src.TextModel.MarkovTriads.choose_word_from_rows", self._choose_word_from_rows_deterministic):
+            self.assertEqual(markov_model.get_next_token(self.engine, first_token="This", second_token="is"), "a")
+            self.assertEqual(markov_model.get_next_token(self.engine, first_token="is", second_token="another"), "unit")
+
+    def test_fold_deltas(self) -> None:
+        """Test folding delta shards into a base table, with each shard only folded once."""
+        expected_engine = create_engine("sqlite:///:memory:")
+        expected_model = MarkovTriads()
+        expected_model.create_table(expected_engine)
+        expected_model.upsert_triads(expected_engine, self.first_sample_text)
+        expected_model.upsert_triads(expected_engine, self.second_sample_text)
+        expected = sorted(expected_engine.execute(select(expected_model.table_def)).fetchall())
+
+        markov_model = MarkovTriads(schema_version=2)
+        markov_model.create_table(self.engine)
+        markov_model.upsert_triads(self.engine, self.first_sample_text)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            delta_path = os.path.join(tmp_dir, "delta.db")
+            delta_engine = create_engine(f"sqlite:///{delta_path}")
+            # Shards don't need the base model's schema version
+            MarkovTriads().create_table(delta_engine)
+            MarkovTriads().upsert_triads(delta_engine, self.second_sample_text)
+            delta_engine.dispose()
+            self.assertEqual(MarkovFoldedDeltas().pending(self.engine, [delta_path]), [Path(delta_path)])
+            self.assertEqual(markov_model.fold_deltas(self.engine, [delta_path]), [Path(delta_path)])
+            self.assertEqual(markov_model.fold_deltas(self.engine, [delta_path]), [])
+            self.assertEqual(MarkovFoldedDeltas().pending(self.engine, [delta_path]), [])
+        self.assertEqual(sorted(tuple(row.values()) for row in self._select_token_triads(markov_model)), expected)
+
+    def test_merge_from(self) -> None:
+        """Test merging the triads of databases with either schema version, like upserting all their text."""
+        texts = (self.first_sample_text, self.second_sample_text, self.first_sample_text)
+        for schema_version in (1, 2):
+            with self.subTest(schema_version=schema_version), tempfile.TemporaryDirectory() as tmp_dir:
+                expected_engine = create_engine("sqlite:///:memory:")
+                expected_model = MarkovTriads(schema_version=schema_version)
+                expected_model.create_table(expected_engine)
+                for text in texts:
+                    expected_model.upsert_triads(expected_engine, text)
+
+                engine = create_engine("sqlite:///:memory:")
+                markov_model = MarkovTriads(schema_version=schema_version)
+                markov_model.create_table(engine)
+                markov_model.upsert_triads(engine, texts[0])
+                other_paths = []
+                for other_version, text in zip((1, 2), texts[1:]):
+                    other_paths.append(os.path.join(tmp_dir, f"other_v{other_version}.db"))
+                    other_engine = create_engine(f"sqlite:///{other_paths[-1]}")
+                    other_model = MarkovTriads(schema_version=other_version)
+                    other_model.create_table(other_engine)
+                    other_model.upsert_triads(other_engine, text)
+                    other_engine.dispose()
+                markov_model.merge_from(engine, other_paths)
+                self.assertEqual(self._select_token_triads(markov_model, engine), self._select_token_triads(expected_model, expected_engine))
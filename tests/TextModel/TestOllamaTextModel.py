@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import src.Directories as Directories
+from src.Errors import OllamaError, PromptCacheMissError
+from src.TextModel import OllamaTextModel, PromptCache
+
+GOOD_RESPONSE = "Sonic dashed through Green Hill Zone, leaving a trail of rings and very confused Motobugs behind him."
+REFUSAL_RESPONSE = "Sorry, I can't help with writing that. " + "This response keeps going for a very long time. " * 20
+
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    """Streams scripted responses like Ollama's `/api/generate`, a few characters per chunk."""
+
+    scripted_responses: list[str] = []
+    done_reason = "stop"
+    request_bodies: list[dict] = []
+    chunks_sent: list[int] = []
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert body["stream"] is True
+        self.__class__.request_bodies.append(body)
+        response = self.__class__.scripted_responses.pop(0)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        chunks = [response[i : i + 5] for i in range(0, len(response), 5)]
+        sent = 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(json.dumps({"response": chunk, "done": False}).encode() + b"\n")
+                self.wfile.flush()
+                sent += 1
+                time.sleep(0.005)
+            self.wfile.write(json.dumps({"response": "", "done": True, "done_reason": self.__class__.done_reason}).encode() + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.__class__.chunks_sent.append(sent)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class TestOllamaTextModel(unittest.TestCase):
+    """Tests for Ollama text models, against a local server streaming scripted responses."""
+
+    def setUp(self) -> None:
+        _OllamaHandler.scripted_responses = []
+        _OllamaHandler.done_reason = "stop"
+        _OllamaHandler.request_bodies = []
+        _OllamaHandler.chunks_sent = []
+        self.server = ThreadingHTTPServer(("localhost", 0), _OllamaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.env_patch = patch.dict(os.environ, {"OLLAMA_PROTOCOL": "http", "OLLAMA_URL": f"localhost:{self.server.server_address[1]}"})
+        self.env_patch.start()
+
+    def tearDown(self) -> None:
+        self.env_patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_text_block(self) -> None:
+        """Test streaming a whole good response."""
+        _OllamaHandler.scripted_responses = [f'"{GOOD_RESPONSE}"']
+        self.assertEqual(OllamaTextModel("test").get_text_block("Write a fanfic."), GOOD_RESPONSE)
+
+    def test_early_rejection(self) -> None:
+        """Test that a refusal is cancelled once its start arrives, and the next attempt is used."""
+        _OllamaHandler.scripted_responses = [REFUSAL_RESPONSE, GOOD_RESPONSE]
+        self.assertEqual(OllamaTextModel("test").get_text_block(), GOOD_RESPONSE)
+        time.sleep(0.2)
+        # The server stops streaming the refusal once the connection is closed
+        self.assertLess(_OllamaHandler.chunks_sent[0], len(REFUSAL_RESPONSE) // 5)
+
+    def test_hedged(self) -> None:
+        """Test that hedged candidates run at once and a good one is used even if another one is a refusal."""
+        # A rejected candidate is replaced by a new one while the other one runs
+        _OllamaHandler.scripted_responses = [REFUSAL_RESPONSE] + [GOOD_RESPONSE] * 3
+        self.assertEqual(OllamaTextModel("test", hedge_candidates=2).get_text_block(), GOOD_RESPONSE)
+        self.assertGreaterEqual(len(_OllamaHandler.request_bodies), 2)
+
+    def test_options(self) -> None:
+        """Test sending the generation options, with the token budget from `max_length`."""
+        _OllamaHandler.scripted_responses = [GOOD_RESPONSE] * 2
+        text_model = OllamaTextModel("test", options={"stop": ["\n\n"], "num_ctx": 1024})
+        text_model.max_length = 60
+        text_model.get_text_block()
+        self.assertEqual(_OllamaHandler.request_bodies[0]["options"], {"stop": ["\n\n"], "num_ctx": 1024, "num_predict": 84})
+        # An explicit budget takes precedence over max_length
+        text_model.options["num_predict"] = 10
+        text_model.get_text_block()
+        self.assertEqual(_OllamaHandler.request_bodies[1]["options"]["num_predict"], 10)
+
+    def test_truncated_response(self) -> None:
+        """Test that a response cut off by the token budget ends at its last complete sentence."""
+        _OllamaHandler.scripted_responses = [f"{GOOD_RESPONSE} Tails flew the Tornado over"]
+        _OllamaHandler.done_reason = "length"
+        self.assertEqual(OllamaTextModel("test").get_text_block(), GOOD_RESPONSE)
+
+    def test_prompt_cache(self) -> None:
+        """Test caching completions and replaying them without calling Ollama."""
+        _OllamaHandler.scripted_responses = [GOOD_RESPONSE]
+        with tempfile.TemporaryDirectory() as tmp_dir, patch.object(Directories, "_CACHE_DIR", Path(tmp_dir)):
+            try:
+                PromptCache.set_mode("read-through")
+                self.assertEqual(OllamaTextModel("test").get_text_block("Write a fanfic."), GOOD_RESPONSE)
+                self.assertEqual(OllamaTextModel("test").get_text_block("Write a fanfic."), GOOD_RESPONSE)
+                PromptCache.set_mode("replay")
+                self.assertEqual(OllamaTextModel("test").get_text_block("Write a fanfic."), GOOD_RESPONSE)
+                with self.assertRaises(PromptCacheMissError):
+                    OllamaTextModel("test", options={"num_ctx": 1024}).get_text_block("Write a fanfic.")
+            finally:
+                PromptCache.set_mode("off")
+        self.assertEqual(len(_OllamaHandler.request_bodies), 1)
+
+    def test_max_attempts(self) -> None:
+        """Test that too short responses are rejected, and an error is raised after the max number of attempts."""
+        _OllamaHandler.scripted_responses = ["Too short."] * OllamaTextModel.MAX_ATTEMPTS
+        with self.assertRaises(OllamaError):
+            OllamaTextModel("test").get_text_block()
+        self.assertEqual(_OllamaHandler.scripted_responses, [])
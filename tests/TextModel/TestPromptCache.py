@@ -0,0 +1,88 @@
+import importlib
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import src.Directories as Directories
+from src.Errors import PromptCacheMissError
+from src.TextModel import PromptCache
+
+
+class TestPromptCache(unittest.TestCase):
+    """Tests for the prompt completion cache."""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir_patch = patch.object(Directories, "_CACHE_DIR", Path(self.tmp_dir.name))
+        self.dir_patch.start()
+        self.n_generated = 0
+
+    def tearDown(self) -> None:
+        PromptCache.set_mode("off")
+        self.dir_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def generate(self) -> str:
+        self.n_generated += 1
+        return f"completion {self.n_generated}"
+
+    def test_modes(self) -> None:
+        """Test generating, caching, and replaying completions in each mode."""
+        options = {"num_predict": 10}
+        self.assertEqual(PromptCache.cached("api", "model", "prompt", options, self.generate), "completion 1")
+        PromptCache.set_mode("read-through")
+        self.assertEqual(PromptCache.cached("api", "model", "prompt", options, self.generate), "completion 2")
+        self.assertEqual(PromptCache.cached("api", "model", "prompt", options, self.generate), "completion 2")
+        # The model, prompt and options are all part of the key
+        self.assertEqual(PromptCache.cached("api", "other model", "prompt", options, self.generate), "completion 3")
+        self.assertEqual(PromptCache.cached("api", "model", "other prompt", options, self.generate), "completion 4")
+        self.assertEqual(PromptCache.cached("api", "model", "prompt", {"num_predict": 20}, self.generate), "completion 5")
+        PromptCache.set_mode("replay")
+        self.assertEqual(PromptCache.cached("api", "model", "prompt", options, self.generate), "completion 2")
+        with self.assertRaises(PromptCacheMissError):
+            PromptCache.cached("api", "model", "new prompt", options, self.generate)
+        self.assertEqual(self.n_generated, 5)
+        with self.assertRaises(ValueError):
+            PromptCache.set_mode("unknown")
+
+    def test_invalid_env_mode(self) -> None:
+        """Test that an invalid mode in the environment only logs a warning on import, and leaves the cache off."""
+        try:
+            with patch.dict(os.environ, {"PROMPT_CACHE_MODE": "readthrough"}), self.assertLogs(PromptCache.__name__, "WARNING"):
+                importlib.reload(PromptCache)
+            self.assertEqual(PromptCache.get_mode(), "off")
+            with patch.dict(os.environ, {"PROMPT_CACHE_MODE": "replay"}):
+                importlib.reload(PromptCache)
+            self.assertEqual(PromptCache.get_mode(), "replay")
+        finally:
+            importlib.reload(PromptCache)
+
+    def test_ttl(self) -> None:
+        """Test that expired completions are generated again, except in replay mode."""
+        PromptCache.set_mode("read-through")
+        PromptCache.cached("api", "model", "prompt", {}, self.generate)
+        key = PromptCache.cache_key("api", "model", "prompt", {})
+        self.assertEqual(PromptCache.lookup(key, ttl_seconds=60), "completion 1")
+        with patch.object(time, "time", return_value=time.time() + 120):
+            self.assertIsNone(PromptCache.lookup(key, ttl_seconds=60))
+            with patch.object(PromptCache, "PROMPT_CACHE_TTL_SECONDS", 60):
+                PromptCache.set_mode("replay")
+                self.assertEqual(PromptCache.cached("api", "model", "prompt", {}, self.generate), "completion 1")
+                PromptCache.set_mode("read-through")
+                self.assertEqual(PromptCache.cached("api", "model", "prompt", {}, self.generate), "completion 2")
+
+    def test_eviction(self) -> None:
+        """Test that the least recently used completions are evicted once the cache is over its max size."""
+        PromptCache.set_mode("read-through")
+        with patch.object(PromptCache, "PROMPT_CACHE_MAX_BYTES", 200):
+            for i, prompt in enumerate(("a", "b", "c")):
+                PromptCache.cached("api", "model", prompt, {}, self.generate)
+                # Make the entries' recency distinct
+                path = Path(self.tmp_dir.name) / "prompts" / f"{PromptCache.cache_key('api', 'model', prompt, {})}.json"
+                os.utime(path, (i, i))
+            PromptCache.cached("api", "model", "d", {}, self.generate)
+        self.assertIsNone(PromptCache.lookup(PromptCache.cache_key("api", "model", "a", {})))
+        self.assertEqual(PromptCache.lookup(PromptCache.cache_key("api", "model", "d", {})), "completion 4")
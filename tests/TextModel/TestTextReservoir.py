@@ -0,0 +1,85 @@
+import sqlite3
+from unittest.mock import patch
+
+from src.TextModel import GenerationState, MarkovModelRegistry, TextReservoir
+from src.TextModel.MarkovTextModel import MarkovTextModel
+from tests.TextModel.MarkovModelTestCase import MarkovModelTestCase
+
+
+class TestTextReservoir(MarkovModelTestCase):
+    """Tests for pools of pre-generated text."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.write_model("Sonic runs fast. Tails flies high. Amy swings a hammer. Knuckles glides far!")
+        self.text_model = MarkovTextModel("test", mean_words=5, stdev_words=0, punc_required=False)
+
+    def test_fill_pop(self) -> None:
+        """Test filling a pool and taking all of its text blocks out."""
+        reservoir = TextReservoir("test", "salt")
+        self.assertEqual(len(reservoir), 0)
+        self.assertIsNone(reservoir.pop())
+        self.assertEqual(reservoir.fill(self.text_model, 10, batch_size=4, state=GenerationState.from_seed(0)), 10)
+        self.assertEqual(reservoir.path, self.cache_dir / "reservoirs" / "test.salt.db")
+        # Filling a full pool doesn't add anything
+        self.assertEqual(reservoir.fill(self.text_model, 10), 0)
+        self.assertEqual(len(reservoir), 10)
+        texts = [reservoir.pop() for _ in range(10)]
+        for text in texts:
+            self.assertIsInstance(text, str)
+            self.assertTrue(text)
+        self.assertEqual(len(reservoir), 0)
+        self.assertIsNone(reservoir.pop())
+        # Filling again only adds what's missing
+        reservoir.fill(self.text_model, 3)
+        self.assertEqual(reservoir.fill(self.text_model, 5), 2)
+        reservoir.clear()
+        self.assertEqual(len(reservoir), 0)
+
+    def test_pop_or_generate(self) -> None:
+        """Test that pooled text is used without loading the model, and text is generated live when the pool is empty."""
+        reservoir = TextReservoir("test", "salt")
+        reservoir.fill(self.text_model, 1)
+        MarkovModelRegistry.unload_all()
+        with patch.object(MarkovModelRegistry, "get_model", wraps=MarkovModelRegistry.get_model) as get_model:
+            text_model = MarkovTextModel("test", mean_words=5, stdev_words=0, punc_required=False)
+            self.assertTrue(reservoir.pop_or_generate(text_model))
+            get_model.assert_not_called()
+            self.assertTrue(reservoir.pop_or_generate(text_model))
+            get_model.assert_called()
+
+    def test_dropped_after_retraining(self) -> None:
+        """Test that pooled text is dropped once the model is retrained, into the base model or into a delta shard."""
+        reservoir = TextReservoir("test", "salt")
+        reservoir.fill(self.text_model, 3)
+        self.assertEqual(len(reservoir), 3)
+        version = reservoir.model_version()
+        self.assertEqual(version, MarkovModelRegistry.model_version("test"))
+
+        self.write_delta_shard("1.db", "Shadow guards the ark.")
+        self.assertNotEqual(reservoir.model_version(), version)
+        self.assertIsNone(reservoir.pop())
+        self.assertEqual(reservoir.fill(self.text_model, 3), 3)
+        self.assertEqual(len(reservoir), 3)
+
+        # Rewriting the base model with the same contents keeps the pool
+        gz_path = self.models_dir / "test.db.gz"
+        gz_path.write_bytes(gz_path.read_bytes())
+        self.assertEqual(len(reservoir), 3)
+        self.write_model("Sonic runs fast. Tails flies high. Amy swings a hammer. Knuckles glides far! Rouge digs deep.")
+        self.assertEqual(len(reservoir), 0)
+
+    def test_unversioned_pool_dropped(self) -> None:
+        """Test that a pool without a recorded model version is dropped, while pools of other text models are kept."""
+        reservoir = TextReservoir("test", "salt")
+        reservoir.fill(self.text_model, 2)
+        conn = sqlite3.connect(reservoir.path)
+        conn.execute(f"DROP TABLE {TextReservoir.META_TABLE_NAME}")
+        conn.commit()
+        conn.close()
+        self.assertEqual(len(reservoir), 0)
+
+        other_reservoir = TextReservoir("other", "salt")
+        self.assertIsNone(other_reservoir.model_version())
+        other_reservoir.fill(self.text_model, 2)
+        self.assertEqual(len(other_reservoir), 2)
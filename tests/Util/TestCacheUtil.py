@@ -0,0 +1,78 @@
+import fcntl
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+from src.Util import CacheUtil
+
+
+class TestCacheUtil(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_atomic_write(self) -> None:
+        """Test atomically writing a file, and leaving no partial file behind on failure."""
+        filepath = self.cache_dir / "sub" / "file.bin"
+        CacheUtil.atomic_write(filepath, lambda f: f.write(b"hello"))
+        self.assertEqual(filepath.read_bytes(), b"hello")
+
+        def failing_writer(f: object) -> None:
+            raise RuntimeError("failed")
+
+        with self.assertRaises(RuntimeError):
+            CacheUtil.atomic_write(filepath, failing_writer)
+        self.assertEqual(filepath.read_bytes(), b"hello")
+        self.assertEqual(os.listdir(filepath.parent), ["file.bin"])
+
+    def test_file_hash(self) -> None:
+        """Test hashing a file's contents."""
+        filepath = self.cache_dir / "file.txt"
+        filepath.write_text("sonic")
+        self.assertEqual(CacheUtil.file_hash(filepath), "7da6940c6ef99d18fbf4bf9d83b3b62ce5e1de7889d4aa8a815ad23c754aa327")
+
+    def test_evict_lru(self) -> None:
+        """Test evicting the least recently used files until under the size cap."""
+        for i, name in enumerate(("a.db", "b.db", "c.db", "d.txt")):
+            filepath = self.cache_dir / name
+            filepath.write_bytes(b"x" * 10)
+            os.utime(filepath, ns=(i * 10**9, i * 10**9))
+        CacheUtil.touch(self.cache_dir / "a.db")
+        evicted = CacheUtil.evict_lru(self.cache_dir, 20, pattern="*.db", keep=[self.cache_dir / "b.db"])
+        self.assertEqual(evicted, [self.cache_dir / "c.db"])
+        self.assertEqual(sorted(path.name for path in self.cache_dir.iterdir()), ["a.db", "b.db", "d.txt"])
+
+    def test_evict_lru_dirs(self) -> None:
+        """Test evicting directories matching any of several patterns as a whole, counting the total size of their files."""
+        for i, name in enumerate(("a.markov", "b.db", "c.markov")):
+            path = self.cache_dir / name
+            if name.endswith(".markov"):
+                path.mkdir()
+                (path / "vocab.txt").write_bytes(b"x" * 10)
+                (path / "weights.npy").write_bytes(b"x" * 10)
+            else:
+                path.write_bytes(b"x" * 10)
+            os.utime(path, ns=(i * 10**9, i * 10**9))
+        (self.cache_dir / ".d.markov.tmp").mkdir()
+        self.assertEqual(CacheUtil.evict_lru(self.cache_dir, 30, pattern=("*.db", "*.markov")), [self.cache_dir / "a.markov"])
+        self.assertEqual(sorted(path.name for path in self.cache_dir.iterdir()), [".d.markov.tmp", "b.db", "c.markov"])
+
+    def test_evict_lru_skips_held(self) -> None:
+        """Test that files held by this or another process aren't evicted until they're released."""
+        for i, name in enumerate(("a.db", "b.db", "c.db")):
+            filepath = self.cache_dir / name
+            filepath.write_bytes(b"x" * 10)
+            os.utime(filepath, ns=(i * 10**9, i * 10**9))
+        held_file = CacheUtil.hold(self.cache_dir / "a.db")
+        assert held_file is not None
+        # Another process's hold is a shared lock on its own open file
+        with open(self.cache_dir / "b.db", "rb") as other_file:
+            fcntl.flock(other_file.fileno(), fcntl.LOCK_SH)
+            self.assertEqual(CacheUtil.evict_lru(self.cache_dir, 0, pattern="*.db"), [self.cache_dir / "c.db"])
+        CacheUtil.release(held_file)
+        self.assertEqual(CacheUtil.evict_lru(self.cache_dir, 0, pattern="*.db"), [self.cache_dir / "a.db", self.cache_dir / "b.db"])
+        self.assertIsNone(CacheUtil.hold(self.cache_dir / "a.db"))
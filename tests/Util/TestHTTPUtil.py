@@ -0,0 +1,90 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import threading
+import time
+import unittest
+
+from src.Util import HTTPUtil
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers requests with scripted statuses, recording the client port of each request."""
+
+    protocol_version = "HTTP/1.1"
+    scripted_statuses: list[int] = []
+    client_ports: list[int] = []
+    delay = 0.0
+
+    def __respond(self) -> None:
+        if "Content-Length" in self.headers:
+            self.rfile.read(int(self.headers["Content-Length"]))
+        self.__class__.client_ports.append(self.client_address[1])
+        time.sleep(self.__class__.delay)
+        status = self.__class__.scripted_statuses.pop(0) if self.__class__.scripted_statuses else 200
+        body = b"ok"
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out
+            pass
+
+    def do_GET(self) -> None:
+        self.__respond()
+
+    def do_POST(self) -> None:
+        self.__respond()
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+class TestHTTPUtil(unittest.TestCase):
+    def setUp(self) -> None:
+        _StandInHandler.scripted_statuses = []
+        _StandInHandler.client_ports = []
+        _StandInHandler.delay = 0.0
+        self.server = ThreadingHTTPServer(("localhost", 0), _StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_address[1]}/"
+
+    def tearDown(self) -> None:
+        HTTPUtil.close_session()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shared_session(self) -> None:
+        """Test that the shared session is reused until it's closed, and keeps its connection alive between requests."""
+        session = HTTPUtil.get_session()
+        self.assertIs(HTTPUtil.get_session(), session)
+        for _ in range(3):
+            self.assertEqual(session.get(self.url).text, "ok")
+        session.post(self.url, data={"a": "b"})
+        self.assertEqual(len(set(_StandInHandler.client_ports)), 1)
+        HTTPUtil.close_session()
+        self.assertIsNot(HTTPUtil.get_session(), session)
+
+    def test_retries(self) -> None:
+        """Test that retryable statuses are retried for GET requests, but not for POST requests."""
+        session = HTTPUtil.create_session(max_retries=2, backoff_factor=0)
+        _StandInHandler.scripted_statuses = [503, 502]
+        self.assertEqual(session.get(self.url).status_code, 200)
+        self.assertEqual(len(_StandInHandler.client_ports), 3)
+        _StandInHandler.scripted_statuses = [503]
+        self.assertEqual(session.post(self.url).status_code, 503)
+        self.assertEqual(len(_StandInHandler.client_ports), 4)
+        # Statuses still failing after all retries are returned
+        _StandInHandler.scripted_statuses = [503] * 3
+        self.assertEqual(session.get(self.url).status_code, 503)
+        session.close()
+
+    def test_timeout(self) -> None:
+        """Test the default timeout, and that a request's own timeout takes precedence over it."""
+        session = HTTPUtil.create_session(max_retries=0, timeout=0.1)
+        _StandInHandler.delay = 0.5
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            session.post(self.url)
+        self.assertEqual(session.post(self.url, timeout=5).text, "ok")
+        session.close()
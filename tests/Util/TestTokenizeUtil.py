@@ -0,0 +1,31 @@
+import unittest
+
+from src.Util import TokenizeUtil
+
+
+class TestTokenizeUtil(unittest.TestCase):
+    def test_sent_tokenize(self) -> None:
+        """Test splitting text into sentences, keeping abbreviations and initials within sentences."""
+        text = 'Mr. Smith met Dr. J. Doe in the U.S. yesterday. Was it fun?  Yes!\nThey said "bye." Then they left.'
+        expected = ["Mr. Smith met Dr. J. Doe in the U.S. yesterday.", "Was it fun?", "Yes!", 'They said "bye."', "Then they left."]
+        self.assertEqual(TokenizeUtil.sent_tokenize(text), expected)
+        self.assertEqual(TokenizeUtil.sent_tokenize("It costs 3.50 and... well, that's it"), ["It costs 3.50 and... well, that's it"])
+
+    def test_word_tokenize(self) -> None:
+        """Test that tokens match the ones from nltk's `word_tokenize`."""
+        text = "Good muffins cost $3.88\nin New York.  Please buy me\ntwo of them.\nThanks."
+        expected = ["Good", "muffins", "cost", "$", "3.88", "in", "New", "York", ".", "Please", "buy", "me", "two", "of", "them", ".", "Thanks", "."]
+        self.assertEqual(TokenizeUtil.word_tokenize(text), expected)
+        self.assertEqual(TokenizeUtil.word_tokenize("They'll save and invest more."), ["They", "'ll", "save", "and", "invest", "more", "."])
+        self.assertEqual(TokenizeUtil.word_tokenize("hi, my name can't hello,"), ["hi", ",", "my", "name", "ca", "n't", "hello", ","])
+        self.assertEqual(TokenizeUtil.word_tokenize('"Sonic," he said (quietly).'), ["``", "Sonic", ",", "''", "he", "said", "(", "quietly", ")", "."])
+        self.assertEqual(
+            TokenizeUtil.word_tokenize("Mr. Sonic is gonna win -- no doubt!"), ["Mr.", "Sonic", "is", "gon", "na", "win", "--", "no", "doubt", "!"]
+        )
+        self.assertEqual(TokenizeUtil.word_tokenize(""), [])
+
+    def test_detokenize(self) -> None:
+        """Test joining tokens back into text like nltk's `TreebankWordDetokenizer`."""
+        tokens = ["``", "Sonic", ",", "''", "he", "said", "(", "quietly", ")", ".", "They", "ca", "n't", "win", "!"]
+        self.assertEqual(TokenizeUtil.detokenize(tokens), '"Sonic," he said (quietly). They can\'t win!')
+        self.assertEqual(TokenizeUtil.detokenize(["It", "costs", "$", "3.88", ";", "gon", "na", "pay", "?"]), "It costs $3.88; gonna pay?")
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from sqlalchemy import Column, Integer, create_engine, select, inspect
 
@@ -48,3 +50,44 @@ class TestUpsertTable(unittest.TestCase):
         error_message = "Input record {'value': 3} does not have PK column 'id'"
         with self.assertRaises(ValueError, msg=error_message):
             test_table.upsert(self.engine, records)
+
+    def test_upsert_tuples(self) -> None:
+        """Test upserting a generator of tuples, adding to existing values."""
+        test_table = UpsertTable("test", [Column("id", Integer, primary_key=True), Column("value", Integer)])
+        test_table.create_table(self.engine)
+
+        test_table.upsert(self.engine, ((i, i * 10) for i in range(3)), upsert_type="add", validate=False)
+        test_table.upsert(self.engine, iter([(1, 5), (1, 5), (3, 30)]), upsert_type="add")
+        with self.engine.connect() as conn:
+            result = conn.execute(select([test_table.table_def]))
+            self.assertEqual(result.fetchall(), [(0, 0), (1, 20), (2, 20), (3, 30)])
+
+    def test_upsert_rollback(self) -> None:
+        """Test that an invalid record rolls back the whole upsert."""
+        test_table = UpsertTable("test", [Column("id", Integer, primary_key=True), Column("value", Integer)])
+        test_table.create_table(self.engine)
+
+        with self.assertRaises(ValueError):
+            test_table.upsert(self.engine, [(1, 2), (3,)])
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(select([test_table.table_def])).fetchall(), [])
+
+    def test_merge_from(self) -> None:
+        """Test merging a table from other databases."""
+        test_table = UpsertTable("test", [Column("id", Integer, primary_key=True), Column("value", Integer)])
+        test_table.create_table(self.engine)
+        test_table.upsert(self.engine, [(1, 2), (3, 4)])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            other_paths = [os.path.join(tmp_dir, f"other{i}.db") for i in range(2)]
+            for other_path, records in zip(other_paths, ([(3, 1), (5, 6)], [(5, 1)])):
+                other_engine = create_engine(f"sqlite:///{other_path}")
+                test_table.create_table(other_engine)
+                test_table.upsert(other_engine, records)
+                other_engine.dispose()
+            test_table.merge_from(self.engine, other_paths)
+            with self.engine.connect() as conn:
+                self.assertEqual(conn.execute(select([test_table.table_def])).fetchall(), [(1, 2), (3, 5), (5, 7)])
+            test_table.merge_from(self.engine, other_paths[:1], upsert_type="overwrite")
+            with self.engine.connect() as conn:
+                self.assertEqual(conn.execute(select([test_table.table_def])).fetchall(), [(1, 2), (3, 1), (5, 6)])
@@ -1,6 +1,6 @@
 import sys
 
-import src.TextModel.MarkovTriads as MarkovTriads
+import src.TextModel.MarkovModelCLI as MarkovModelCLI
 
 if __name__ == "__main__":
-    MarkovTriads.train(sys.argv[1:])
+    MarkovModelCLI.main(sys.argv[1:])